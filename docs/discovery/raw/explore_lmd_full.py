@@ -9,27 +9,29 @@ Quick look into `lmd_full.tar.gz`
 import warnings
 warnings.filterwarnings('ignore')
 
-import tarfile
 import os
 import numpy as np
 import pandas as pd
 
 from lakh_midi_dataset import project_dir
+from lakh_midi_dataset.tar_index import TarIndex
 
 # %% [markdown]
 """
 ## Archive Contents
 
-First, let's see what's in the lmd_full tar.gz file
+First, let's see what's in the lmd_full tar.gz file. Listing a streamed
+`tar.gz` means inflating the whole archive, so we go through the seekable
+index instead; it is built on first use and reused after that.
 """
 
 # %%
 tar_path = project_dir / "lmd_full.tar.gz"
 print(f"Opening {tar_path}...")
 
-with tarfile.open(tar_path, 'r|gz') as tar:
-    members = tar.getmembers()
-    print(f"Found {len(members)} files in the archive")
+index = TarIndex.open(tar_path)
+members = list(index.iter_members())
+print(f"Found {len(members)} files in the archive")
 
 # %% [markdown]
 """
@@ -53,9 +55,8 @@ Count different file types in the archive
 # %%
 extensions = {}
 for member in members:
-    if member.isfile():
-        ext = os.path.splitext(member.name)[1]
-        extensions[ext] = extensions.get(ext, 0) + 1
+    ext = os.path.splitext(member.name)[1]
+    extensions[ext] = extensions.get(ext, 0) + 1
 
 print("File types found:")
 for ext, count in sorted(extensions.items()):
@@ -87,10 +88,9 @@ Let's also check the directory structure
 # %%
 directories = set()
 for member in members:
-    if member.isfile():
-        dir_path = os.path.dirname(member.name)
-        if dir_path:
-            directories.add(dir_path)
+    dir_path = os.path.dirname(member.name)
+    if dir_path:
+        directories.add(dir_path)
 
 print(f"\nFound {len(directories)} unique directories")
 print("First 20 directories:")
@@ -104,4 +104,10 @@ for i, directory in enumerate(sorted(directories)[:20]):
 Check if specific MIDI file exists in the archive
 """
 
-# %%
\ No newline at end of file
+# %%
+midi_md5 = midi_files[0].key
+print(f"{midi_md5} in archive: {midi_md5 in index}")
+
+# Only the gzip span around this member is inflated
+midi_bytes = index.get_midi(midi_md5)
+print(f"Read {len(midi_bytes)} bytes, header: {midi_bytes[:4]}")
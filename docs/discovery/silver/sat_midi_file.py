@@ -6,11 +6,13 @@ Found in the sat_midi_file table for the silver layer.
 
 """
 #%%
-from lakh_midi_dataset.render_midi import render_midi_to_audio
+from lakh_midi_dataset.midi_compression import decompress
+from lakh_midi_dataset.render_cache import RenderCache
 import lakh_midi_dataset
 from IPython.display import Audio, display, HTML
 import io
 import os
+import shutil
 
 #%%
 %%sql
@@ -21,6 +23,7 @@ ATTACH 'hf://datasets/nintorac/ntrc_lakh_midi/lakh_remote.duckdb' AS lakh_remote
 select 
     midi_hk,
     file_content,
+    coalesce(content_codec, 'raw') as content_codec,
     file_size,
     load_date,
     record_source,
@@ -30,12 +33,19 @@ order by midi_hk
 limit 3
 
 #%% tags=["remove-output"]
-# Create audio column by saving files to _static/audio directory
+# Render 30 second previews through the render cache, so rebuilds reuse them,
+# and copy them to the _static/audio directory
 audio_dir = "../../_static/audio/silver"
-midi_file_df['audio_path'] = midi_file_df.apply(
-    lambda row: render_midi_to_audio(row['file_content'], audio_dir, row['midi_hk']), 
-    axis=1
-)
+os.makedirs(audio_dir, exist_ok=True)
+render_cache = RenderCache()
+
+def preview(row):
+    audio_path = f"{audio_dir}/{row['midi_hk']}.ogg"
+    midi_bytes = lambda: decompress(row['file_content'], row['content_codec'])
+    shutil.copyfile(render_cache.render(row['midi_hk'], midi_bytes, duration=30), audio_path)
+    return audio_path
+
+midi_file_df['audio_path'] = midi_file_df.apply(preview, axis=1)
 
 # %%
 # Display MIDI File 1
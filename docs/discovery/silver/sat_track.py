@@ -69,22 +69,6 @@ select
     idx_segments_timbre,
     idx_tatums_confidence,
     idx_tatums_start,
-    -- skip heavy array columns for now
-    --bars_start,
-    --bars_confidence,
-    --beats_start,
-    --beats_confidence,
-    --sections_start,
-    --sections_confidence,
-    --segments_start,
-    --segments_confidence,
-    --segments_loudness_max,
-    --segments_loudness_max_time,
-    --segments_loudness_start,
-    --segments_pitches,
-    --segments_timbre,
-    --tatums_start,
-    --tatums_confidence,
     load_date,
     record_source,
     partition_col
@@ -119,26 +103,27 @@ In the following plots, we show the prediction confidence by the size of the mar
 # %%
 %%sql -o track_timeseries_df -t df
 select 
-    track_hk,
-    title,
-    year,
-    bars_start,
-    bars_confidence,
-    beats_start,
-    beats_confidence,
-    sections_start,
-    sections_confidence,
-    segments_start,
-    segments_confidence,
-    segments_loudness_max,
-    segments_loudness_max_time,
-    segments_loudness_start,
-    segments_pitches,
-    segments_timbre,
-    tatums_start,
-    tatums_confidence,
-from lakh_remote.ntrc_lmd_silver.sat_track 
-where track_hk in (
+    t.track_hk,
+    t.title,
+    t.year,
+    list_transform(ts.bars, e -> e.start) as bars_start,
+    list_transform(ts.bars, e -> e.confidence) as bars_confidence,
+    list_transform(ts.beats, e -> e.start) as beats_start,
+    list_transform(ts.beats, e -> e.confidence) as beats_confidence,
+    list_transform(ts.sections, e -> e.start) as sections_start,
+    list_transform(ts.sections, e -> e.confidence) as sections_confidence,
+    list_transform(ts.segments, e -> e.start) as segments_start,
+    list_transform(ts.segments, e -> e.confidence) as segments_confidence,
+    list_transform(ts.segments, e -> e.loudness_max) as segments_loudness_max,
+    list_transform(ts.segments, e -> e.loudness_max_time) as segments_loudness_max_time,
+    list_transform(ts.segments, e -> e.loudness_start) as segments_loudness_start,
+    list_transform(ts.segments, e -> e.pitches) as segments_pitches,
+    list_transform(ts.segments, e -> e.timbre) as segments_timbre,
+    list_transform(ts.tatums, e -> e.start) as tatums_start,
+    list_transform(ts.tatums, e -> e.confidence) as tatums_confidence,
+from lakh_remote.ntrc_lmd_silver.sat_track t
+join lakh_remote.ntrc_lmd_silver.sat_track_timeseries ts using (track_hk)
+where t.track_hk in (
     '029f0cec6a749b64f45f27b8a7c56125',
     '02a93439e9627559dbc54f3a66f69c8c',
     '00d99d980159c5f67340a12debe54eae'
@@ -14,6 +14,7 @@ Based on the symbolic_example.md and ntrc_dataset.md documentation.
 import duckdb
 import pandas as pd
 import lakh_midi_dataset
+from lakh_midi_dataset.midi_compression import decompress
 from pathlib import Path
 import tempfile
 from symbolic_music.aria import MidiDict, AbsTokenizer, normalize_midi_dict
@@ -49,6 +50,7 @@ WITH random_midis AS (
         mf.midi_md5,
         mf.midi_hk,
         smf.file_content,
+        coalesce(smf.content_codec, 'raw') as content_codec,
         smf.file_size,
         -- Artist info
         sa.artist_name,
@@ -139,7 +141,7 @@ for idx, row in tqdm(midi_df.iterrows()):
     try:
         # Create temporary file from bytes
         with tempfile.NamedTemporaryFile(suffix='.mid', delete=False) as tmp_file:
-            tmp_file.write(row['file_content'])
+            tmp_file.write(decompress(row['file_content'], row['content_codec']))
             tmp_path = tmp_file.name
         
         # Load MIDI file
@@ -0,0 +1,181 @@
+"""
+Helpers for accumulating rows into arrow batches
+"""
+
+import threading
+import time
+from array import array
+from typing import Callable, Iterable, Iterator, TypeVar
+
+import pyarrow as pa
+
+from lakh_midi_dataset.parallel import _EMPTY, _SENTINEL, _ReadAhead
+
+T = TypeVar("T")
+
+
+class ColumnBatch:
+    """
+    Column-wise row accumulator with a fixed arrow schema
+
+    Rows are appended as positional values into one list per column and
+    converted with the declared types on `flush`, so every batch has the same
+    schema and no per-row dicts or DataFrames are built.
+    """
+    def __init__(self, schema: pa.Schema):
+        self.schema = schema
+        self._columns: list[list] = [[] for _ in schema]
+
+    def __len__(self) -> int:
+        return len(self._columns[0])
+
+    def append(self, *values):
+        for column, value in zip(self._columns, values):
+            column.append(value)
+
+    def flush(self) -> pa.Table:
+        """Return the accumulated rows as a table and start a new batch"""
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(self._columns, self.schema)],
+            schema=self.schema,
+        )
+        self._columns = [[] for _ in self.schema]
+        return table
+
+
+class LargeBinaryBuilder:
+    """
+    Builds a `large_binary` array from blobs copied into one contiguous buffer
+
+    Each blob is copied exactly once, into an arrow buffer of `capacity`
+    bytes that doubles if it runs out, and `finish` wraps the buffer and its
+    offsets as an array without copying again. Size `capacity` to the batch
+    when it is known up front.
+    """
+    def __init__(self, capacity: int = 1 << 20):
+        # Taken from arrow's memory pool, so it is neither zeroed nor page
+        # faulted in afresh for every batch
+        self._data = pa.allocate_buffer(max(capacity, 1), resizable=True)
+        self._view = memoryview(self._data).cast("B")
+        self._offsets = array("q", [0])
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return self._offsets[-1]
+
+    def append(self, blob: bytes | memoryview):
+        start = self._offsets[-1]
+        end = start + len(blob)
+        if end > self._data.size:
+            self._view.release()
+            self._data.resize(max(end, 2 * self._data.size))
+            self._view = memoryview(self._data).cast("B")
+        self._view[start:end] = blob
+        self._offsets.append(end)
+
+    def finish(self) -> pa.LargeBinaryArray:
+        """Return the array, after which the builder must not be reused"""
+        self._view.release()
+        return pa.LargeBinaryArray.from_buffers(
+            pa.large_binary(), len(self),
+            [None, pa.py_buffer(self._offsets), self._data],
+        )
+
+
+class MemoryBudget:
+    """
+    Byte budget shared by every resource running in the process
+
+    Readers `acquire` the size of each item they pull into memory and block
+    while the budget is exhausted; consumers `release` it once the batch has
+    been handed on. A single item larger than the whole budget is let through
+    when nothing else is held, so an oversized member cannot deadlock a run.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.in_use == 0 or self.in_use + nbytes <= self.max_bytes
+
+    def try_acquire(self, nbytes: int) -> bool:
+        with self._cond:
+            if not self._fits(nbytes):
+                return False
+            self.in_use += nbytes
+            return True
+
+    def acquire(self, nbytes: int):
+        with self._cond:
+            self._cond.wait_for(lambda: self._fits(nbytes))
+            self.in_use += nbytes
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.in_use -= nbytes
+            self._cond.notify_all()
+
+
+class ByteBatch(list):
+    """A list of items along with the bytes they account for"""
+    nbytes: int = 0
+
+
+def batch_by_bytes(
+    items: Iterable[T],
+    size_of: Callable[[T], int],
+    target_bytes: int,
+    max_latency: float | None = None,
+    budget: MemoryBudget | None = None,
+) -> Iterator[ByteBatch]:
+    """
+    Group items into batches of roughly `target_bytes`
+
+    A batch is also closed once `max_latency` seconds have passed since its
+    first item, even if the stream stalls before another arrives, so slow
+    streams still make progress. With a `budget`, every item's size is
+    acquired as it is read; the consumer must release `batch.nbytes` when it
+    is done with each batch. When the budget is exhausted the partial batch is
+    handed on before waiting, so batches held back by different resources can
+    never starve each other.
+    """
+    # With a deadline the items are read on a thread, so it can pass while the source blocks
+    reader = _ReadAhead(items, 1) if max_latency is not None else None
+    source = iter(items) if reader is None else None
+    batch, deadline = ByteBatch(), 0.0
+    try:
+        while True:
+            if reader is None:
+                item = next(source, _SENTINEL)
+            else:
+                item = reader.get(timeout=max(deadline - time.monotonic(), 0) if batch else None)
+                if item is _EMPTY:
+                    # Nothing more arrived in time
+                    yield batch
+                    batch = ByteBatch()
+                    continue
+            if item is _SENTINEL:
+                break
+            nbytes = size_of(item)
+            if budget is not None and not budget.try_acquire(nbytes):
+                if batch:
+                    yield batch
+                    batch = ByteBatch()
+                budget.acquire(nbytes)
+            if not batch and max_latency is not None:
+                deadline = time.monotonic() + max_latency
+            batch.append(item)
+            batch.nbytes += nbytes
+
+            if batch.nbytes >= target_bytes or (max_latency is not None and time.monotonic() >= deadline):
+                yield batch
+                batch = ByteBatch()
+    finally:
+        if reader is not None:
+            reader.close()
+    if batch:
+        yield batch
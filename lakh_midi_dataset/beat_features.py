@@ -0,0 +1,211 @@
+"""
+Beat and bar synchronous Echo Nest features, aggregated in bulk
+
+Summarises the segment chroma, timbre and loudness of every track of bronze
+`h5_extract` over its beats and bars, and writes one row per track to
+
+    data/bronze_lakh_midi/track_beat_features/partition_col=<digit>/*.parquet
+
+for the silver `sat_track_beat_features` satellite. Each beat (and bar)
+gets the mean of the segments starting within it, weighted by segment
+duration, and the loudest of their peaks. A beat no segment starts in takes
+the segment sounding at its start, and is NaN before the first segment.
+
+A batch is aggregated at once, without a loop over tracks: the segments
+and beats of all tracks are laid out on one time axis, each track shifted
+past the one before, so a single `searchsorted` assigns every segment to
+its beat and `reduceat` sums over each beat's run of segments.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from lakh_midi_dataset import derived_tables
+from lakh_midi_dataset.checkpoint import code_version
+from lakh_midi_dataset.derived_tables import build_derived_table
+from lakh_midi_dataset.sharding import bronze_dir
+
+EVENT_TYPE = pa.list_(pa.struct([
+    ("start", pa.float32()),
+    ("chroma", pa.list_(pa.float32(), 12)),
+    ("timbre", pa.list_(pa.float32(), 12)),
+    ("loudness_max", pa.float32()),
+]))
+
+BEAT_FEATURES_SCHEMA = pa.schema([
+    ("track_hk", pa.string()),
+    ("beats", EVENT_TYPE),
+    ("bars", EVENT_TYPE),
+])
+
+SOURCE_COLUMNS = ["track_hk", "analysis"]
+
+
+class _Column:
+    """A list column of `analysis`, flattened, with the track of each value"""
+    def __init__(self, analysis: pa.StructArray, name: str, width: int | None = None):
+        if analysis.type.get_field_index(name) >= 0:
+            # Null where the analysis struct itself is
+            column = pc.struct_field(analysis, name)
+        else:
+            # Extracted with --h5-fields without the arrays
+            column = pa.nulls(len(analysis), pa.list_(pa.float64() if width is None else pa.list_(pa.float64())))
+        lengths = pc.fill_null(pc.list_value_length(column), 0).to_numpy()
+        values = column.flatten()
+        if width is not None:
+            if len(values) and not pc.all(pc.equal(pc.list_value_length(values), width)).as_py():
+                raise ValueError(f"Not every {name} vector has {width} values")
+            values = values.flatten()
+        values = values.to_numpy(zero_copy_only=False).astype(np.float64)
+        self.values = values.reshape(-1, width) if width is not None else values
+        self.lengths = lengths
+        self.track = np.repeat(np.arange(len(lengths)), lengths)
+
+
+def aggregate_events(
+    event_times: np.ndarray,
+    event_track: np.ndarray,
+    segment_times: np.ndarray,
+    segment_track: np.ndarray,
+    weights: np.ndarray,
+    features: np.ndarray,
+    peaks: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Duration weighted mean of the (n, k) `features` and max of `peaks` of
+    the segments starting within each event, for events and segments of
+    many tracks on one sorted time axis. Events no segment starts in take
+    the segment sounding at their start, and are NaN before the track's
+    first.
+    """
+    n = len(event_times)
+    means = np.full((n, features.shape[1]), np.nan)
+    maxima = np.full(n, np.nan)
+    if n == 0 or len(segment_times) == 0:
+        return means, maxima
+
+    # Event each segment starts in, dropping those before their track's first event
+    event = np.searchsorted(event_times, segment_times, side="right") - 1
+    inside = event >= 0
+    inside[inside] = event_track[event[inside]] == segment_track[inside]
+    rows = np.flatnonzero(inside)
+    if len(rows):
+        event = event[rows]
+        # Segments are sorted, so each event's segments are one run
+        starts = np.flatnonzero(np.concatenate([[True], event[1:] != event[:-1]]))
+        counts = np.diff(np.append(starts, len(rows)))
+        weight_sums = np.add.reduceat(weights[rows], starts)
+        sums = np.add.reduceat(features[rows] * weights[rows, None], starts)
+        # Unweighted where every segment of the event has zero length
+        plain = np.add.reduceat(features[rows], starts) / counts[:, None]
+        has_weight = weight_sums > 0
+        means[event[starts]] = np.where(
+            has_weight[:, None], sums / np.where(has_weight, weight_sums, 1)[:, None], plain
+        )
+        maxima[event[starts]] = np.maximum.reduceat(peaks[rows], starts)
+
+    empty = np.flatnonzero(np.isnan(maxima))
+    sounding = np.searchsorted(segment_times, event_times[empty], side="right") - 1
+    valid = sounding >= 0
+    valid[valid] = segment_track[sounding[valid]] == event_track[empty[valid]]
+    means[empty[valid]] = features[sounding[valid]]
+    maxima[empty[valid]] = peaks[sounding[valid]]
+    return means, maxima
+
+
+def _event_lists(
+    events: _Column, shift: np.ndarray, segment_times: np.ndarray, segments: _Column,
+    weights: np.ndarray, chroma: np.ndarray, timbre: np.ndarray, peaks: np.ndarray,
+) -> pa.Array:
+    event_times = events.values + shift[events.track]
+    features, maxima = aggregate_events(
+        event_times, events.track, segment_times, segments.track,
+        weights, np.hstack([chroma, timbre]), peaks,
+    )
+    features = features.astype(np.float32)
+    structs = pa.StructArray.from_arrays(
+        [
+            pa.array(events.values.astype(np.float32)),
+            pa.FixedSizeListArray.from_arrays(pa.array(features[:, :12].ravel()), 12),
+            pa.FixedSizeListArray.from_arrays(pa.array(features[:, 12:].ravel()), 12),
+            pa.array(maxima.astype(np.float32)),
+        ],
+        fields=list(EVENT_TYPE.value_type),
+    )
+    offsets = np.concatenate([[0], np.cumsum(events.lengths)]).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), structs, type=EVENT_TYPE)
+
+
+def compute_beat_features_batch(batch: pa.RecordBatch) -> pa.Table:
+    """BEAT_FEATURES_SCHEMA row of every track in a batch of `SOURCE_COLUMNS`"""
+    analysis = batch.column("analysis")
+    segments = _Column(analysis, "segments_start")
+    chroma = _Column(analysis, "segments_pitches", 12).values
+    timbre = _Column(analysis, "segments_timbre", 12).values
+    peaks = _Column(analysis, "segments_loudness_max").values
+    beats = _Column(analysis, "beats_start")
+    bars = _Column(analysis, "bars_start")
+    if not (len(chroma) == len(timbre) == len(peaks) == len(segments.values)):
+        raise ValueError("Segment arrays of different lengths")
+
+    # Each track's times start after the end of the previous track's
+    span = max((column.values.max(initial=0.0) for column in (segments, beats, bars)), default=0.0) + 1.0
+    shift = np.arange(len(batch)) * span
+    segment_times = segments.values + shift[segments.track]
+
+    # A segment lasts until the next one, the last to the end of the track
+    durations = np.zeros(len(batch))
+    if analysis.type.get_field_index("songs") >= 0:
+        durations = pc.fill_null(pc.struct_field(analysis, ["songs", "duration"]), 0.0).to_numpy()
+    ends = np.append(segment_times[1:], 0.0)[:len(segment_times)]
+    last = np.cumsum(segments.lengths)[segments.lengths > 0] - 1
+    ends[last] = durations[segments.track[last]] + shift[segments.track[last]]
+    weights = np.maximum(ends - segment_times, 0)
+
+    return pa.Table.from_arrays(
+        [
+            batch.column("track_hk"),
+            _event_lists(beats, shift, segment_times, segments, weights, chroma, timbre, peaks),
+            _event_lists(bars, shift, segment_times, segments, weights, chroma, timbre, peaks),
+        ],
+        schema=BEAT_FEATURES_SCHEMA,
+    )
+
+
+def build_beat_features(
+    source: str | Path | None = None,
+    output: str | Path | None = None,
+    workers: int | None = None,
+) -> tuple[int, int]:
+    """
+    Aggregate any `h5_extract` file not yet aggregated by the current code.
+    Returns the files written and stale files removed.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return build_derived_table(
+        compute_beat_features_batch, BEAT_FEATURES_SCHEMA,
+        source=Path(source) if source is not None else bronze_dir() / "h5_extract",
+        output=Path(output) if output is not None else bronze_dir() / "track_beat_features",
+        version=code_version(sys.modules[__name__], derived_tables),
+        columns=SOURCE_COLUMNS,
+        workers=workers,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aggregate Echo Nest segment features over beats and bars")
+    parser.add_argument("--source", default=None, help="h5_extract directory to aggregate")
+    parser.add_argument("--output", default=None, help="Directory to write track_beat_features to")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    args = parser.parse_args()
+
+    written, removed = build_beat_features(args.source, args.output, args.workers)
+    print(f"Wrote track_beat_features for {written} h5_extract files, removed {removed} stale")
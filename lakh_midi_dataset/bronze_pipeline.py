@@ -3,10 +3,12 @@ Bronze Layer Data Pipeline for Lakh MIDI Dataset
 Processes raw source files into parquet format using dlt
 """
 
-import json
+import os
+import sys
 import tarfile
+from functools import partial
 from pathlib import Path
-from typing import Iterator, Dict, Any
+from typing import Iterable, Iterator, Dict, Any
 import io
 from itertools import islice
 
@@ -14,155 +16,469 @@ import dlt
 import h5py
 import numpy as np
 import pyarrow as pa
-import pandas as pd
+import pyarrow.compute as pc
 
 
-from lakh_midi_dataset.h5_utils import extract_h5_to_dict
+from lakh_midi_dataset import (
+    batching, h5_utils, hash_keys, json_stream, midi_compression, parallel, partitioning
+)
+from lakh_midi_dataset.batching import ColumnBatch, LargeBinaryBuilder, MemoryBudget, batch_by_bytes
+from lakh_midi_dataset.checkpoint import Checkpoint, code_version, fingerprint_inputs
+from lakh_midi_dataset.h5_utils import H5_SCALAR_FIELDS, extract_h5_batch
+from lakh_midi_dataset.json_stream import iter_json_object
+from lakh_midi_dataset.midi_compression import CODEC_RAW, MidiCompressor, ensure_dictionary
+from lakh_midi_dataset.parallel import pipelined_map
+from lakh_midi_dataset.partitioning import finalize_load
+from lakh_midi_dataset.sharding import (
+    bronze_dir, in_shard, merge_shard_manifests, validate_shard, write_shard_manifest
+)
+
+
+def read_midi_members(shard: int = 0, num_shards: int = 1) -> Iterator[tuple[str, str, bytes]]:
+    """
+    Stream (midi_md5, file_path, file_content) for the MIDI files in lmd_full.tar.gz
+    """
+    tar_path = "lmd_full.tar.gz"
+    with tarfile.open(tar_path, 'r|gz') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith('.mid'):
+                # Extract MD5 from filename stem
+                file_path = member.name
+                filename = Path(file_path).stem
+                midi_md5 = filename
+                if not in_shard(midi_md5, shard, num_shards):
+                    continue
+                
+                # Extract file content
+                file_obj = tar.extractfile(member)
+                if file_obj:
+                    yield midi_md5, file_path, file_obj.read()
+
+
+def read_h5_members(shard: int = 0, num_shards: int = 1) -> Iterator[tuple[str, str, bytes]]:
+    """
+    Stream (track_id, file_path, file_content) for the H5 files in lmd_matched_h5.tar.gz
+    """
+    tar_path = "lmd_matched_h5.tar.gz"
+    with tarfile.open(tar_path, 'r|gz') as tar:
+        for member in tar:
+            if member.isfile() and member.name.endswith('.h5'):
+                # Extract track ID from filename stem
+                file_path = member.name
+                filename = Path(file_path).stem
+                track_id = filename
+                if not in_shard(track_id, shard, num_shards):
+                    continue
+                
+                # Extract file content
+                file_obj = tar.extractfile(member)
+                if file_obj:
+                    yield track_id, file_path, file_obj.read()
+
+
+def read_match_scores(shard: int = 0, num_shards: int = 1) -> Iterator[tuple[str, dict]]:
+    """
+    Stream (track_id, {midi_md5: score}) from match_scores.json
+    """
+    for track_id, midi_scores in iter_json_object("match_scores.json"):
+        if in_shard(track_id, shard, num_shards):
+            yield track_id, midi_scores
+
+
+def read_md5_paths(shard: int = 0, num_shards: int = 1) -> Iterator[tuple[str, list]]:
+    """
+    Stream (midi_md5, [source_path, ...]) from md5_to_paths.json
+    """
+    for midi_md5, paths in iter_json_object("md5_to_paths.json"):
+        if in_shard(midi_md5, shard, num_shards):
+            yield midi_md5, paths
 
 
 @dlt.resource(table_name="raw_midi_files", parallelized=True)
-def process_midi_files() -> Iterator[pa.Table]:
+def process_midi_files(
+    shard: int = 0,
+    num_shards: int = 1,
+    members: Iterable[tuple[str, str, bytes]] | None = None,
+    target_bytes: int = 32 * 1024 * 1024,
+    max_latency: float | None = 30.0,
+    budget: MemoryBudget | None = None,
+    compressor: MidiCompressor | None = None,
+) -> Iterator[pa.Table]:
     """
     Extract MIDI files from lmd_full.tar.gz and yield as arrow tables
+
+    `members` overrides the archive stream, e.g. with a checkpointed window of it.
+    Batches hold about `target_bytes` of MIDI content, or whatever arrived
+    within `max_latency` seconds, and draw on the shared memory `budget`.
+    File contents are copied once into a contiguous `large_binary` column,
+    compressed one by one with `compressor` if given.
     """
-    def get_midi_rows():
-        tar_path = "lmd_full.tar.gz"
-        with tarfile.open(tar_path, 'r|gz') as tar:
-            for member in tar:
-                if member.isfile() and member.name.endswith('.mid'):
-                    # Extract MD5 from filename stem
-                    file_path = member.name
-                    filename = Path(file_path).stem
-                    midi_md5 = filename
-                    
-                    # Extract file content
-                    file_obj = tar.extractfile(member)
-                    if file_obj:
-                        file_content = file_obj.read()
-                        
-                        yield {
-                            "file_path": file_path,
-                            "midi_md5": midi_md5,
-                            "file_content": file_content,
-                            "file_size_bytes": len(file_content)
-                        }
-    
-    rows = get_midi_rows()
-    while item_slice := list(islice(rows, 1000)):
-        yield pa.Table.from_pandas(pd.DataFrame(item_slice))
+    if members is None:
+        members = read_midi_members(shard, num_shards)
+    codec = CODEC_RAW if compressor is None else compressor.codec
+    for batch in batch_by_bytes(members, _member_size, target_bytes, max_latency, budget):
+        contents = LargeBinaryBuilder(batch.nbytes)
+        md5s, paths, sizes = [], [], []
+        for midi_md5, file_path, file_content in batch:
+            md5s.append(midi_md5)
+            paths.append(file_path)
+            sizes.append(len(file_content))
+            contents.append(file_content if compressor is None else compressor.compress(file_content))
+        yield pa.table({
+            "file_path": pa.array(paths, pa.string()),
+            "midi_md5": pa.array(md5s, pa.string()),
+            # Wraps the contiguous buffer the contents were copied into
+            "file_content": contents.finish(),
+            "file_size_bytes": pa.array(sizes, pa.int64()),
+            "content_codec": pa.array([codec] * len(sizes), pa.string()),
+        })
+        if budget is not None:
+            budget.release(batch.nbytes)
 
 
 @dlt.resource(table_name="h5_extract", parallelized=True)
-def process_h5_files() -> Iterator[pa.Table]:
+def process_h5_files(
+    workers: int = 0,
+    ordered: bool = True,
+    max_pending: int | None = None,
+    shard: int = 0,
+    num_shards: int = 1,
+    members: Iterable[tuple[str, str, bytes]] | None = None,
+    target_bytes: int = 16 * 1024 * 1024,
+    max_latency: float | None = 30.0,
+    budget: MemoryBudget | None = None,
+    fields: Iterable[str] | None = None,
+) -> Iterator[pa.Table]:
     """
     Extract H5 files from lmd_matched_h5.tar.gz and extract musicbrainz data
+
+    With `workers` > 0 the tar is read on a single reader thread and batches
+    of raw member bytes are extracted in a pool of worker processes, with at
+    most `max_pending` batches in flight. Set `ordered=False` to yield
+    batches as soon as they are ready rather than in archive order.
+
+    Batches are sized by raw H5 bytes as in process_midi_files; bytes held by
+    batches still in the worker pool count against the `budget`.
+
+    `fields` restricts the extract to those dotted paths (e.g.
+    H5_SCALAR_FIELDS), and nothing else is read from the files.
     """
-    def get_h5_rows():
-        tar_path = "lmd_matched_h5.tar.gz"
-        with tarfile.open(tar_path, 'r|gz') as tar:
-            for member in tar:
-                if member.isfile() and member.name.endswith('.h5'):
-                    # Extract track ID from filename stem
-                    file_path = member.name
-                    filename = Path(file_path).stem
-                    track_id = filename
-                    
-                    # Extract file content
-                    file_obj = tar.extractfile(member)
-                    if file_obj:
-                        file_content = file_obj.read()
-                        
-                        # Extract H5 data directly here
-                        extracted_data = extract_h5_to_dict(file_content)
-                        
-                        yield {
-                            "track_id": track_id,
-                            "file_path": file_path,
-                            "file_size_bytes": len(file_content),
-                            **extracted_data
-                        }
-    
-    rows = get_h5_rows()
-    while item_slice := list(islice(rows, 20)):
-        yield pa.Table.from_pandas(pd.DataFrame(item_slice))
+    if members is None:
+        members = read_h5_members(shard, num_shards)
+    extract = partial(extract_h5_batch, fields=fields)
+    batches = batch_by_bytes(members, _member_size, target_bytes, max_latency, budget)
+    if workers > 0:
+        for table in pipelined_map(
+            extract, batches, workers,
+            max_pending=max_pending, ordered=ordered
+        ):
+            yield table
+            if budget is not None:
+                # Results arrive without their batch, but carry its raw sizes
+                budget.release(pc.sum(table.column("file_size_bytes")).as_py())
+    else:
+        for batch in batches:
+            yield extract(batch)
+            if budget is not None:
+                budget.release(batch.nbytes)
 
 
 @dlt.resource(table_name="raw_match_scores")
-def process_match_scores() -> Iterator[pa.Table]:
+def process_match_scores(
+    shard: int = 0,
+    num_shards: int = 1,
+    batch_size: int = 100_000,
+    members: Iterable[tuple[str, dict]] | None = None,
+) -> Iterator[pa.Table]:
     """
     Parse match_scores.json and flatten into records
+
+    The file is streamed one track at a time straight into arrow columns, so
+    memory stays flat however large it gets.
     """
-    def get_match_rows():
-        with open("match_scores.json", 'r') as f:
-            match_data = json.load(f)
-        
-        for track_id, midi_scores in match_data.items():
-            for midi_md5, score in midi_scores.items():
-                yield {
-                    "track_id": track_id,
-                    "midi_md5": midi_md5,
-                    "match_score": score
-                }
-    
-    rows = get_match_rows()
-    while item_slice := list(islice(rows, 1000)):
-        yield pa.Table.from_pandas(pd.DataFrame(item_slice))
+    if members is None:
+        members = read_match_scores(shard, num_shards)
+    rows = ColumnBatch(pa.schema([
+        ("track_id", pa.string()),
+        ("midi_md5", pa.string()),
+        ("match_score", pa.float64()),
+    ]))
+    for track_id, midi_scores in members:
+        for midi_md5, score in midi_scores.items():
+            rows.append(track_id, midi_md5, score)
+        if len(rows) >= batch_size:
+            yield rows.flush()
+    if len(rows):
+        yield rows.flush()
 
 
 @dlt.resource(table_name="raw_md5_paths", parallelized=True)
-def process_md5_paths() -> Iterator[pa.Table]:
+def process_md5_paths(
+    shard: int = 0,
+    num_shards: int = 1,
+    batch_size: int = 100_000,
+    members: Iterable[tuple[str, list]] | None = None,
+) -> Iterator[pa.Table]:
     """
     Parse md5_to_paths.json and flatten into records
+
+    Streamed like process_match_scores.
     """
-    def get_md5_rows():
-        with open("md5_to_paths.json", 'r') as f:
-            md5_data = json.load(f)
-        
-        for midi_md5, paths in md5_data.items():
-            for order, path in enumerate(paths):
-                yield {
-                    "midi_md5": midi_md5,
-                    "source_path": path,
-                    "path_order": order
-                }
-    
-    rows = get_md5_rows()
-    while item_slice := list(islice(rows, 1000)):
-        yield pa.Table.from_pandas(pd.DataFrame(item_slice))
+    if members is None:
+        members = read_md5_paths(shard, num_shards)
+    rows = ColumnBatch(pa.schema([
+        ("midi_md5", pa.string()),
+        ("source_path", pa.string()),
+        ("path_order", pa.int64()),
+    ]))
+    for midi_md5, paths in members:
+        for order, path in enumerate(paths):
+            rows.append(midi_md5, path, order)
+        if len(rows) >= batch_size:
+            yield rows.flush()
+    if len(rows):
+        yield rows.flush()
+
+
+def _member_size(member: tuple[str, str, bytes]) -> int:
+    return len(member[2])
+
 
+# table name: (resource, member reader, input files, members per checkpoint window)
+BRONZE_RESOURCES = {
+    "raw_midi_files": (process_midi_files, read_midi_members, ["lmd_full.tar.gz"], 20_000),
+    "raw_match_scores": (process_match_scores, read_match_scores, ["match_scores.json"], 50_000),
+    "raw_md5_paths": (process_md5_paths, read_md5_paths, ["md5_to_paths.json"], 50_000),
+    "h5_extract": (process_h5_files, read_h5_members, ["lmd_matched_h5.tar.gz"], 10_000),
+}
 
 
-def run_bronze_pipeline():
+class _Window:
+    """The next `size` members of a long lived stream, noting whether it ran dry"""
+    def __init__(self, stream: Iterator, size: int):
+        self.stream = stream
+        self.size = size
+        self.count = 0
+
+    def __iter__(self):
+        for member in islice(self.stream, self.size):
+            self.count += 1
+            yield member
+
+    @property
+    def exhausted(self) -> bool:
+        return self.count < self.size
+
+
+def _loaded_tables(load_info) -> dict[str, set[str]]:
+    """load_id -> tables its package wrote files for"""
+    return {
+        package.load_id: {job.job_file_info.table_name for job in package.jobs["completed_jobs"]}
+        for package in load_info.load_packages
+    }
+
+
+def run_bronze_pipeline(
+    h5_workers: int | None = None,
+    shard: int = 0,
+    num_shards: int = 1,
+    resume: bool = True,
+    memory_budget_bytes: int = 2 * 1024 ** 3,
+    h5_fields: Iterable[str] | None = None,
+    compress_midi: bool = False,
+    midi_dictionary: str | None = None,
+):
     """
     Main function to run the bronze layer pipeline
+
+    With `num_shards` > 1 only the members hashing to `shard` are processed,
+    and the files written are recorded in a shard manifest. Run every shard
+    (on any machines sharing the output filesystem) and then
+    `merge_shard_manifests` to complete the layer.
+
+    Each source is loaded in windows of members and every window is recorded
+    in a checkpoint once its parquet files are written, so a rerun after a
+    failure skips committed members. Resources whose inputs and code are
+    unchanged since they last completed are skipped entirely. Pass
+    `resume=False` to discard checkpoints and rebuild from scratch.
+
+    The archive resources share a `memory_budget_bytes` budget for member
+    bytes read but not yet handed to dlt. As each window loads, its files are
+    rewritten with the Data Vault hash keys added and the archive tables split
+    into hash partitions matching the silver `partition_col`.
+
+    `h5_fields` limits h5_extract to those dotted paths, e.g.
+    H5_SCALAR_FIELDS for a scalars-only build.
+
+    With `compress_midi` each MIDI blob is zstd compressed against the
+    `midi_dictionary` version in `midi_compression.dictionary_dir()`. Without
+    one, an unsharded run uses the latest dictionary there, training one on
+    the start of the archive if there is none yet. Sharded runs must be given
+    the version, so that every shard compresses with the same dictionary.
     """
+    validate_shard(shard, num_shards)
+    if compress_midi and midi_dictionary is None and num_shards > 1:
+        raise ValueError(
+            "Sharded runs need an explicit midi_dictionary, train one first with "
+            "`python -m lakh_midi_dataset.midi_compression`"
+        )
+    if h5_workers is None:
+        h5_workers = os.cpu_count() or 1
+
+    # Shards get their own pipeline so their working state does not collide
+    pipeline_name = "lakh_midi_bronze"
+    if num_shards > 1:
+        pipeline_name += f"_shard_{shard}_of_{num_shards}"
+
     # Create pipeline
     pipeline = dlt.pipeline(
-        pipeline_name="lakh_midi_bronze",
+        pipeline_name=pipeline_name,
         destination="filesystem",
         dataset_name="bronze_lakh_midi",
         progress=dlt.progress.tqdm(colour="yellow")
     )
     
     print("Starting bronze layer data pipeline...")
-    
-    # Run all resources
-    resources = [
-        process_midi_files(),
-        process_match_scores(),
-        process_md5_paths(),
-        process_h5_files(),
-    ]
-    
-    print("Processing all resources in parallel...")
-    load_info = pipeline.run(
-        resources,
-        loader_file_format="parquet"
+
+    # Packages left by a crashed run are rolled back via the checkpoints instead.
+    # The one that was being loaded may only be completed as aborted by a later
+    # load(), so it must never be committed with a window.
+    plan = pipeline.abort_packages()
+    aborted = set()
+    if plan is not None:
+        aborted.update(plan["packages_to_delete"], plan["extracted_packages_to_delete"])
+        if plan["package_to_abort"]:
+            aborted.add(plan["package_to_abort"]["load_id"])
+
+    # Where dlt actually writes the tables, which finalize_load must rewrite in place
+    with pipeline.destination_client() as client:
+        root = Path(client.dataset_path)
+    if root != bronze_dir(pipeline.dataset_name):
+        # e.g. a bucket_url configured for this pipeline name only
+        raise ValueError(
+            f"The pipeline writes to {root} but the derived stages read {bronze_dir(pipeline.dataset_name)}, "
+            "configure destination.filesystem.bucket_url for every pipeline"
+        )
+    version = code_version(
+        sys.modules[__name__], h5_utils, batching, hash_keys, json_stream, midi_compression,
+        parallel, partitioning
     )
-    print(f"Load info: {load_info}")
+    shard_args = dict(shard=shard, num_shards=num_shards)
+    budget = MemoryBudget(memory_budget_bytes)
+    if not compress_midi:
+        midi_dictionary = None
+    elif midi_dictionary is None:
+        midi_dictionary = ensure_dictionary(content for _, _, content in read_midi_members(**shard_args))
+    resource_args = {
+        "raw_midi_files": dict(
+            budget=budget,
+            compressor=None if midi_dictionary is None else MidiCompressor(midi_dictionary),
+        ),
+        "h5_extract": dict(workers=h5_workers, budget=budget, fields=h5_fields),
+    }
+    # Options that change what a resource writes, so a change rebuilds it
+    resource_config = {
+        "raw_midi_files": midi_dictionary,
+        "h5_extract": None if h5_fields is None else sorted(h5_fields),
+    }
+
+    checkpoints = {}
+    streams = {}
+    for table, (resource, reader, inputs, window_size) in BRONZE_RESOURCES.items():
+        name = table if num_shards == 1 else f"{table}-shard-{shard}-of-{num_shards}"
+        # Kept beside the dataset, dlt refuses to initialise a directory that already exists
+        checkpoint = Checkpoint(root.parent / "_checkpoints" / root.name, name, root / table)
+        checkpoint.rollback()
+        checkpoints[table] = checkpoint
+
+        fingerprint = fingerprint_inputs(inputs, version + repr(resource_config.get(table)))
+        if not resume or checkpoint.fingerprint != fingerprint:
+            checkpoint.reset(fingerprint)
+        elif checkpoint.complete:
+            print(f"Skipping {table}: inputs unchanged since it last completed")
+            continue
+        elif len(checkpoint):
+            print(f"Resuming {table}: {len(checkpoint)} members already written")
+        streams[table] = checkpoint.track(reader(**shard_args))
+
+    while streams:
+        windows = {
+            table: _Window(stream, BRONZE_RESOURCES[table][3])
+            for table, stream in streams.items()
+        }
+        resources = [
+            BRONZE_RESOURCES[table][0](members=window, **shard_args, **resource_args.get(table, {}))
+            for table, window in windows.items()
+        ]
+
+        print(f"Processing {', '.join(windows)} in parallel...")
+        pipeline.extract(resources, loader_file_format="parquet")
+        pipeline.normalize()
+        load_ids = [load_id for load_id in pipeline.list_normalized_load_packages() if load_id not in aborted]
+        for table in windows:
+            checkpoints[table].begin(load_ids)
+        load_info = pipeline.load()
+        print(f"Load info: {load_info}")
+
+        loaded = _loaded_tables(load_info)
+        for table in windows:
+            finalize_load(root / table, table, [load_id for load_id in load_ids if table in loaded.get(load_id, ())])
+
+        for table, window in windows.items():
+            checkpoints[table].commit()
+            if window.exhausted:
+                checkpoints[table].mark_complete()
+                del streams[table]
+
+    if num_shards > 1:
+        manifest = write_shard_manifest(
+            shard, num_shards,
+            sorted({load_id for cp in checkpoints.values() for load_id in cp.load_ids}),
+            tables=list(BRONZE_RESOURCES),
+            dataset_name=pipeline.dataset_name,
+        )
+        print(f"Shard manifest written to {manifest}")
     
     print("Bronze pipeline completed successfully!")
 
 
 if __name__ == "__main__":
-    run_bronze_pipeline()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--shard", type=int, default=0, help="Index of the shard to process")
+    parser.add_argument("--num-shards", type=int, default=1, help="Total number of shards")
+    parser.add_argument("--h5-workers", type=int, default=None, help="Worker processes for H5 extraction")
+    parser.add_argument("--merge", action="store_true", help="Merge the shard manifests instead of processing")
+    parser.add_argument("--no-resume", action="store_true", help="Discard checkpoints and rebuild everything")
+    parser.add_argument("--memory-budget-mb", type=int, default=2048, help="Memory budget for buffered archive members")
+    parser.add_argument(
+        "--h5-fields", default=None,
+        help="Comma separated dotted H5 paths to extract, or 'scalars' for only the songs tables",
+    )
+    parser.add_argument(
+        "--compress-midi", action="store_true",
+        help="zstd compress MIDI blobs with a trained dictionary (see midi_compression)",
+    )
+    parser.add_argument(
+        "--midi-dictionary", default=None,
+        help="Version of the dictionary to compress with, required with --num-shards > 1",
+    )
+    args = parser.parse_args()
+
+    if args.merge:
+        print(f"Merged manifest written to {merge_shard_manifests(args.num_shards)}")
+    else:
+        run_bronze_pipeline(
+            h5_workers=args.h5_workers,
+            shard=args.shard,
+            num_shards=args.num_shards,
+            resume=not args.no_resume,
+            memory_budget_bytes=args.memory_budget_mb * 1024 * 1024,
+            h5_fields=(
+                H5_SCALAR_FIELDS if args.h5_fields == "scalars"
+                else args.h5_fields.split(",") if args.h5_fields else None
+            ),
+            compress_midi=args.compress_midi,
+            midi_dictionary=args.midi_dictionary,
+        )
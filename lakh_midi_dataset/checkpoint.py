@@ -0,0 +1,139 @@
+"""
+Checkpoint manifests for resumable bronze runs
+
+Each resource keeps a small JSON manifest in a checkpoint directory recording
+which members have been durably written to parquet and by which loads. A run
+that dies part way through picks up where the last committed load stopped,
+and a resource whose inputs and code are unchanged since it last completed
+is skipped outright.
+
+The order of operations keeps the manifest and the parquet files in step:
+loads are recorded as pending before they are written and only become
+committed, along with their member keys, after the load succeeds. Files from
+loads left pending by a crash are deleted on the next run.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+from types import ModuleType
+from typing import Iterable, Iterator
+
+_SAMPLE_BYTES = 1 << 20
+
+
+def fingerprint_inputs(paths: Iterable[str | Path], code_version: str) -> str:
+    """
+    Cheap fingerprint of input files: size, mtime and hashes of the first and
+    last MiB, combined with the version of the code that processes them
+    """
+    digest = hashlib.sha256(code_version.encode())
+    for path in map(Path, paths):
+        stat = path.stat()
+        digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        with open(path, "rb") as f:
+            digest.update(f.read(_SAMPLE_BYTES))
+            f.seek(max(stat.st_size - _SAMPLE_BYTES, 0))
+            digest.update(f.read(_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def code_version(*modules: ModuleType) -> str:
+    """Hash of the source of the modules a resource depends on"""
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(inspect.getsource(module).encode())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """
+    Manifest of the members of one resource (and shard) written so far
+    """
+    def __init__(self, directory: Path, name: str, table_dir: Path):
+        self.path = Path(directory) / f"{name}.json"
+        self.table_dir = Path(table_dir)
+        self._staged: list[str] = []
+        if self.path.exists():
+            self._state = json.loads(self.path.read_text())
+        else:
+            self._state = {"fingerprint": None, "complete": False, "load_ids": [], "pending_load_ids": [], "done": []}
+        self._done = set(self._state["done"])
+
+    @property
+    def fingerprint(self) -> str | None:
+        return self._state["fingerprint"]
+
+    @property
+    def complete(self) -> bool:
+        return self._state["complete"]
+
+    @property
+    def load_ids(self) -> list[str]:
+        """Loads committed for this resource, across every run"""
+        return list(self._state["load_ids"])
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def reset(self, fingerprint: str):
+        """Forget all progress, deleting what earlier runs wrote, and start over"""
+        self._delete_loads(self._state["load_ids"] + self._state["pending_load_ids"])
+        self._state = {"fingerprint": fingerprint, "complete": False, "load_ids": [], "pending_load_ids": [], "done": []}
+        self._done = set()
+        self._staged = []
+        self._save()
+
+    def rollback(self):
+        """Delete files from loads that were started but never committed"""
+        if self._state["pending_load_ids"]:
+            self._delete_loads(self._state["pending_load_ids"])
+            self._state["pending_load_ids"] = []
+            self._save()
+        self._staged = []
+
+    def track(self, members: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Skip members already committed and stage the rest, keyed by their
+        first element, as they are handed out
+        """
+        for member in members:
+            if member[0] in self._done:
+                continue
+            self._staged.append(member[0])
+            yield member
+
+    def begin(self, load_ids: list[str]):
+        """Record loads about to be written so a crash can roll them back"""
+        self._state["pending_load_ids"] = list(load_ids)
+        self._save()
+
+    def commit(self):
+        """Mark the pending loads and staged members as durably written"""
+        self._done.update(self._staged)
+        self._state["done"] = sorted(self._done)
+        self._state["load_ids"] += self._state["pending_load_ids"]
+        self._state["pending_load_ids"] = []
+        self._staged = []
+        self._save()
+
+    def mark_complete(self):
+        self._state["complete"] = True
+        self._save()
+
+    def _delete_loads(self, load_ids: list[str]):
+        for load_id in load_ids:
+            # Partitioned tables keep their files a directory further down
+            for path in self.table_dir.rglob(f"{load_id}.*"):
+                path.unlink()
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
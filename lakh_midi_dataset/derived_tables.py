@@ -0,0 +1,125 @@
+"""
+Tables derived file by file from a hive partitioned bronze table
+
+Stages such as the MIDI note parser read every parquet file of a bronze
+table and write one output file for each, at the same relative path:
+
+    raw_midi_files/partition_col=a/<load_id>.0.parquet
+ -> midi_notes/partition_col=a/<load_id>.0.parquet
+
+so the output shares the silver partitioning, and a rerun only processes
+source files that are new or were derived by a different version of the
+stage. Outputs whose source file has gone (e.g. rolled back by a bronze
+checkpoint) are removed, along with any sidecar files sharing their name.
+"""
+
+import glob
+import os
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lakh_midi_dataset.parallel import pipelined_map
+
+VERSION_KEY = b"lakh_midi_dataset.version"
+
+
+def build_derived_table(
+    fn: Callable[[pa.RecordBatch], pa.Table],
+    schema: pa.Schema,
+    source: Path,
+    output: Path,
+    version: str,
+    columns: list[str] | None = None,
+    workers: int = 0,
+    batch_rows: int = 256,
+    max_pending: int | None = None,
+    writer: Callable[[Path, pa.Schema], Any] = pq.ParquetWriter,
+) -> tuple[int, int]:
+    """
+    Write `fn` of every batch of `columns` of the source files, in a pool of
+    `workers` processes if > 0. `fn` must be picklable and return tables
+    with `schema`; `version` identifies the code producing them.
+
+    Each output is written through `writer(tmp_path, schema)`, anything with
+    `write_table` and `close` that leaves a parquet file with `schema`'s
+    metadata at `tmp_path`, which is renamed into place once it closes.
+
+    Returns the number of files written and of stale files removed.
+    """
+    source, output = Path(source), Path(output)
+    for tmp_path in output.glob("*/*.tmp"):
+        tmp_path.unlink()
+
+    sources = {path.relative_to(source) for path in source.glob("*/*.parquet")}
+    removed = 0
+    for path in output.glob("*/*.parquet"):
+        if path.relative_to(output) not in sources:
+            for stale in path.parent.glob(glob.escape(path.name.removesuffix(".parquet")) + ".*"):
+                stale.unlink()
+            removed += 1
+
+    todo = sorted(
+        relative for relative in sources
+        if _version_of(output / relative) != version
+    )
+    if not todo:
+        return 0, removed
+
+    schema = schema.with_metadata({**(schema.metadata or {}), VERSION_KEY: version.encode()})
+    items = _read_batches(source, todo, columns, batch_rows)
+    if workers > 0:
+        results = pipelined_map(partial(_apply, fn), items, workers, max_pending=max_pending)
+    else:
+        results = map(partial(_apply, fn), items)
+
+    current, sink, tmp_path = None, None, None
+    for relative, table in results:
+        if relative != current:
+            if sink is not None:
+                sink.close()
+                os.replace(tmp_path, output / current)
+            current = relative
+            tmp_path = output / relative.with_suffix(".parquet.tmp")
+            tmp_path.parent.mkdir(parents=True, exist_ok=True)
+            sink = writer(tmp_path, schema)
+        sink.write_table(table)
+    sink.close()
+    os.replace(tmp_path, output / current)
+    return len(todo), removed
+
+
+def _version_of(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    metadata = pq.read_schema(path).metadata or {}
+    version = metadata.get(VERSION_KEY)
+    return version.decode() if version is not None else None
+
+
+def _read_batches(
+    source: Path, files: list[Path], columns: list[str] | None, batch_rows: int
+) -> Iterator[tuple[Path, pa.RecordBatch]]:
+    for relative in files:
+        parquet = pq.ParquetFile(source / relative)
+        names = parquet.schema_arrow.names
+        # Tolerate columns added to the source table after older files were written
+        present = None if columns is None else [column for column in columns if column in names]
+        empty = True
+        for batch in parquet.iter_batches(batch_size=batch_rows, columns=present):
+            empty = False
+            yield relative, batch
+        if empty:
+            # Still gets an output file, so it is not picked up again
+            schema = parquet.schema_arrow
+            if present is not None:
+                schema = pa.schema([schema.field(column) for column in present])
+            yield relative, pa.RecordBatch.from_pylist([], schema=schema)
+
+
+def _apply(fn: Callable[[pa.RecordBatch], pa.Table], item: tuple[Path, pa.RecordBatch]) -> tuple[Path, pa.Table]:
+    relative, batch = item
+    return relative, fn(batch)
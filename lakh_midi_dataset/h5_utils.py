@@ -1,7 +1,9 @@
+from typing import Iterable
+
 import h5py
-import io
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 def extract_h5_to_dict(file_content: bytes) -> dict:
     """
@@ -49,5 +51,391 @@ def extract_h5_to_dict(file_content: bytes) -> dict:
                 result[key] = dataset_to_dict(item)
         return result
     
-    with h5py.File(io.BytesIO(file_content), 'r') as h5_file:
+    with open_h5_image(file_content) as h5_file:
         return group_to_dict(h5_file)
+
+
+
+def open_h5_image(file_content: bytes) -> h5py.File:
+    """
+    Open an H5 file held in memory
+
+    The bytes are handed to HDF5's core driver as a file image, so reads are
+    served from memory inside HDF5 rather than through python callbacks on
+    an `io.BytesIO`. HDF5 copies the image into its own buffer when the file
+    is opened (h5py does not expose the file image callbacks that would let
+    it use `file_content` in place), so each file is briefly held twice.
+    """
+    fapl = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
+    fapl.set_fapl_core(backing_store=False)
+    fapl.set_file_image(file_content)
+    return h5py.File(h5py.h5f.open(b"image.h5", h5py.h5f.ACC_RDONLY, fapl=fapl))
+
+
+def _selection_tree(fields: Iterable[str]) -> dict:
+    """
+    Nest dotted paths like "analysis.songs.tempo" into dicts, where None
+    selects everything below that point
+    """
+    tree: dict = {}
+    for field in fields:
+        node = tree
+        *parents, leaf = field.split(".")
+        for key in parents:
+            child = node.setdefault(key, {})
+            if child is None:
+                break
+            node = child
+        else:
+            node[leaf] = None
+    return tree
+
+
+def _read_selected(group: h5py.Group, tree: dict, prefix: tuple[str, ...], out, types: dict):
+    """
+    Pass `out` (path, values) for the selected datasets only, reading nothing
+    else. Selected datasets are read through the low level API with memory
+    types cached in `types`, which for the small compound `songs` tables is
+    several times cheaper than h5py's high level indexing.
+    """
+    def visit(name, item):
+        if isinstance(item, h5py.Dataset):
+            out(path + tuple(name.split('/')), item[()])
+
+    for key, subtree in tree.items():
+        if key not in group:
+            continue
+        item = group[key]
+        path = prefix + (key,)
+        if isinstance(item, h5py.Group):
+            if subtree is None:
+                item.visititems(visit)
+            else:
+                _read_selected(item, subtree, path, out, types)
+        elif subtree is None:
+            out(path, _read_dataset(item.id, path, types))
+        elif item.dtype.names:
+            # Fields of a compound dataset, e.g. analysis.songs.tempo
+            out(path, _read_dataset(item.id, path, types, names=subtree))
+        else:
+            out(path, item[()])
+
+
+def _read_dataset(dataset: h5py.h5d.DatasetID, path: tuple, types: dict, names=None) -> np.ndarray:
+    file_type = dataset.get_type()
+    cached = types.get(path)
+    if cached is None or not cached[0].equal(file_type):
+        dtype = dataset.dtype
+        if names is not None:
+            # HDF5 converts compound types member by member, by name
+            dtype = np.dtype([(name, dtype.fields[name][0]) for name in dtype.names if name in names])
+        cached = types[path] = (file_type, dtype, h5py.h5t.py_create(dtype))
+    _, dtype, memory_type = cached
+    values = np.empty(dataset.shape, dtype)
+    dataset.read(h5py.h5s.ALL, h5py.h5s.ALL, values, mtype=memory_type)
+    return values
+
+
+def project_schema(schema: pa.Schema, fields: Iterable[str]) -> pa.Schema:
+    """
+    Narrow an H5 schema to the dotted `fields`. Top level columns that are
+    not H5 groups (track_id, file_path, ...) are always kept.
+    """
+    tree = _selection_tree(fields)
+    return pa.schema([
+        field if not pa.types.is_struct(field.type) else _project_field(field, tree[field.name])
+        for field in schema
+        if not pa.types.is_struct(field.type) or field.name in tree
+    ])
+
+
+def _project_field(field: pa.Field, subtree: dict | None) -> pa.Field:
+    if subtree is None or not pa.types.is_struct(field.type):
+        return field
+    return field.with_type(pa.struct([
+        _project_field(child, subtree[child.name])
+        for child in field.type if child.name in subtree
+    ]))
+
+
+def _songs(**fields: pa.DataType) -> pa.StructType:
+    return pa.struct(list(fields.items()))
+
+
+_FLOATS = pa.list_(pa.float64())
+# Segment pitch and timbre vectors, always 12 wide
+_VECTORS = pa.list_(pa.list_(pa.float64(), 12))
+
+# The layout of a Million Song Dataset track file. Types follow the HDF5
+# dtypes: 32 bit integers stay int32, the float64 datasets stay float64,
+# fixed width strings in the `songs` tables are decoded and string arrays
+# are kept as binary.
+H5_EXTRACT_SCHEMA = pa.schema([
+    ("track_id", pa.string()),
+    ("file_path", pa.string()),
+    ("file_size_bytes", pa.int64()),
+    ("analysis", pa.struct([
+        ("bars_confidence", _FLOATS),
+        ("bars_start", _FLOATS),
+        ("beats_confidence", _FLOATS),
+        ("beats_start", _FLOATS),
+        ("sections_confidence", _FLOATS),
+        ("sections_start", _FLOATS),
+        ("segments_confidence", _FLOATS),
+        ("segments_loudness_max", _FLOATS),
+        ("segments_loudness_max_time", _FLOATS),
+        ("segments_loudness_start", _FLOATS),
+        ("segments_pitches", _VECTORS),
+        ("segments_start", _FLOATS),
+        ("segments_timbre", _VECTORS),
+        ("songs", _songs(
+            analysis_sample_rate=pa.int32(),
+            audio_md5=pa.string(),
+            danceability=pa.float64(),
+            duration=pa.float64(),
+            end_of_fade_in=pa.float64(),
+            energy=pa.float64(),
+            idx_bars_confidence=pa.int32(),
+            idx_bars_start=pa.int32(),
+            idx_beats_confidence=pa.int32(),
+            idx_beats_start=pa.int32(),
+            idx_sections_confidence=pa.int32(),
+            idx_sections_start=pa.int32(),
+            idx_segments_confidence=pa.int32(),
+            idx_segments_loudness_max=pa.int32(),
+            idx_segments_loudness_max_time=pa.int32(),
+            idx_segments_loudness_start=pa.int32(),
+            idx_segments_pitches=pa.int32(),
+            idx_segments_start=pa.int32(),
+            idx_segments_timbre=pa.int32(),
+            idx_tatums_confidence=pa.int32(),
+            idx_tatums_start=pa.int32(),
+            key=pa.int32(),
+            key_confidence=pa.float64(),
+            loudness=pa.float64(),
+            mode=pa.int32(),
+            mode_confidence=pa.float64(),
+            start_of_fade_out=pa.float64(),
+            tempo=pa.float64(),
+            time_signature=pa.int32(),
+            time_signature_confidence=pa.float64(),
+            track_id=pa.string(),
+        )),
+        ("tatums_confidence", _FLOATS),
+        ("tatums_start", _FLOATS),
+    ])),
+    ("metadata", pa.struct([
+        ("artist_terms", pa.list_(pa.binary())),
+        ("artist_terms_freq", _FLOATS),
+        ("artist_terms_weight", _FLOATS),
+        ("similar_artists", pa.list_(pa.binary())),
+        ("songs", _songs(
+            analyzer_version=pa.string(),
+            artist_7digitalid=pa.int32(),
+            artist_familiarity=pa.float64(),
+            artist_hotttnesss=pa.float64(),
+            artist_id=pa.string(),
+            artist_latitude=pa.float64(),
+            artist_location=pa.string(),
+            artist_longitude=pa.float64(),
+            artist_mbid=pa.string(),
+            artist_name=pa.string(),
+            artist_playmeid=pa.int32(),
+            genre=pa.string(),
+            idx_artist_terms=pa.int32(),
+            idx_similar_artists=pa.int32(),
+            release=pa.string(),
+            release_7digitalid=pa.int32(),
+            song_hotttnesss=pa.float64(),
+            song_id=pa.string(),
+            title=pa.string(),
+            track_7digitalid=pa.int32(),
+        )),
+    ])),
+    ("musicbrainz", pa.struct([
+        ("artist_mbtags", pa.list_(pa.binary())),
+        ("artist_mbtags_count", pa.list_(pa.int32())),
+        ("songs", _songs(
+            idx_artist_mbtags=pa.int32(),
+            year=pa.int32(),
+        )),
+    ])),
+])
+
+# The one-record `songs` tables of each group, without the per-segment arrays
+H5_SCALAR_FIELDS = ("analysis.songs", "metadata.songs", "musicbrainz.songs")
+
+
+class H5BatchBuilder:
+    """
+    Accumulate H5 files column-wise and emit them as a single arrow table.
+
+    Datasets are kept as the numpy arrays h5py returns and only stitched into
+    arrow arrays (offsets over concatenated buffers) in `finish`, so no python
+    objects are created per value. Groups become structs, 1-D datasets become
+    lists, 2-D datasets become lists of fixed size lists and compound
+    datasets (the one-record `songs` tables) become structs of their fields.
+
+    With a `schema` every batch is built to exactly those types: datasets
+    and fields it does not declare are dropped, and ones a batch lacks are
+    null. Without one, types are inferred from the batch.
+
+    `fields` selects dotted paths ("metadata.songs", "analysis.songs.tempo")
+    to read; anything else in the file is never read or decoded, and is
+    left out of the schema.
+    """
+    def __init__(self, schema: pa.Schema | None = None, fields: Iterable[str] | None = None):
+        self.fields = None if fields is None else tuple(fields)
+        self._tree = None if fields is None else _selection_tree(self.fields)
+        self.schema = schema if schema is None or fields is None else project_schema(schema, self.fields)
+        self._types: dict = {}
+        self._num_rows = 0
+        self._columns: dict[str, list] = {}
+        self._datasets: dict[tuple[str, ...], list[np.ndarray | None]] = {}
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def append(self, file_content: bytes, **columns):
+        """Add one H5 file, plus any scalar top level columns, as a row"""
+        def add(path, values):
+            self._datasets.setdefault(path, [None] * self._num_rows).append(values)
+
+        def visit(name, item):
+            if isinstance(item, h5py.Dataset):
+                add(tuple(name.split('/')), item[()])
+
+        with open_h5_image(file_content) as h5_file:
+            if self._tree is None:
+                h5_file.visititems(visit)
+            else:
+                _read_selected(h5_file, self._tree, (), add, self._types)
+        for name, value in columns.items():
+            self._columns.setdefault(name, [None] * self._num_rows).append(value)
+
+        self._num_rows += 1
+        # Pad anything this file did not have
+        for values in (*self._datasets.values(), *self._columns.values()):
+            if len(values) < self._num_rows:
+                values.append(None)
+
+    def finish(self) -> pa.Table:
+        """Build the table and reset the builder"""
+        tree: dict = {}
+        for path, arrays in self._datasets.items():
+            node = tree
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = arrays
+
+        if self.schema is None:
+            table = pa.table({
+                **{name: pa.array(values) for name, values in self._columns.items()},
+                **{key: _node_to_arrow(node) for key, node in sorted(tree.items())},
+            })
+        else:
+            tree.update(self._columns)
+            table = pa.Table.from_arrays(
+                [_node_to_arrow(tree.get(f.name), f.type, self._num_rows) for f in self.schema],
+                schema=self.schema,
+            )
+        self._num_rows = 0
+        self._columns = {}
+        self._datasets = {}
+        return table
+
+
+def _node_to_arrow(node, type: pa.DataType | None = None, num_rows: int = 0) -> pa.Array:
+    if node is None:
+        return pa.nulls(num_rows, type)
+    if type is None:
+        if isinstance(node, dict):
+            keys = sorted(node)
+            return pa.StructArray.from_arrays([_node_to_arrow(node[k]) for k in keys], keys)
+        return _dataset_to_arrow(node)
+
+    if isinstance(node, dict):
+        return pa.StructArray.from_arrays(
+            [_node_to_arrow(node.get(f.name), f.type, num_rows) for f in type],
+            fields=list(type),
+        )
+    if pa.types.is_struct(type) or pa.types.is_list(type):
+        return _dataset_to_arrow(node, type)
+    # A plain column passed to `append`
+    return pa.array(node, type)
+
+
+def _dataset_to_arrow(arrays: list[np.ndarray | None], type: pa.DataType | None = None) -> pa.Array:
+    missing = np.array([a is None for a in arrays])
+    present = [a for a in arrays if a is not None]
+    if not present:
+        return pa.nulls(len(arrays), type)
+    dtype = present[0].dtype
+    mask = pa.array(missing) if missing.any() else None
+
+    if dtype.names:
+        # One record per file, missing/empty datasets become null
+        empty = np.zeros(1, dtype=dtype)
+        records = np.concatenate([a[:1] if a is not None and len(a) else empty for a in arrays])
+        missing |= np.array([a is not None and len(a) == 0 for a in arrays])
+        mask = pa.array(missing) if missing.any() else None
+        if type is None:
+            fields = [_values_to_arrow(records[name], decode=True) for name in dtype.names]
+            return pa.StructArray.from_arrays(fields, list(dtype.names), mask=mask)
+        fields = [
+            _values_to_arrow(records[f.name], f.type) if f.name in dtype.names
+            else pa.nulls(len(arrays), f.type)
+            for f in type
+        ]
+        return pa.StructArray.from_arrays(fields, fields=list(type), mask=mask)
+
+    lengths = np.array([len(a) if a is not None else 0 for a in arrays], dtype=np.int32)
+    offsets = pa.array(np.concatenate([[0], np.cumsum(lengths, dtype=np.int32)]))
+    values = np.concatenate(present)
+    value_type = type.value_type if type is not None else None
+    if values.ndim == 2:
+        item_type = value_type.value_type if value_type is not None else None
+        inner = pa.FixedSizeListArray.from_arrays(
+            _values_to_arrow(values.reshape(-1), item_type), values.shape[1]
+        )
+    else:
+        inner = _values_to_arrow(values, value_type)
+    return pa.ListArray.from_arrays(offsets, inner, mask=mask)
+
+
+def _values_to_arrow(values: np.ndarray, type: pa.DataType | None = None, decode: bool = False) -> pa.Array:
+    """
+    Convert a flat numpy array to `type`, or without one widen numbers and
+    decode strings as convert_value does
+    """
+    if values.dtype.kind == 'S':
+        array = pa.array(values)
+        if type is not None:
+            return array.cast(type)
+        return array.cast(pa.string()) if decode else array
+    if type is not None:
+        # NaN, HDF5's missing value, becomes null as with the inferred types
+        return pa.array(values.astype(type.to_pandas_dtype(), copy=False), type, from_pandas=True)
+    if values.dtype.kind in 'iub':
+        return pa.array(values.astype(np.int64, copy=False))
+    return pa.array(values.astype(np.float64, copy=False), from_pandas=True)
+
+
+def extract_h5_batch(
+    members: list[tuple[str, str, bytes]],
+    fields: Iterable[str] | None = None,
+) -> pa.Table:
+    """
+    Extract a batch of (track_id, file_path, file_content) H5 members into an arrow table.
+    Top level so it can be shipped to worker processes. `fields` limits the
+    extract to those dotted paths, e.g. H5_SCALAR_FIELDS.
+    """
+    builder = H5BatchBuilder(H5_EXTRACT_SCHEMA, fields)
+    for track_id, file_path, file_content in members:
+        builder.append(
+            file_content,
+            track_id=track_id,
+            file_path=file_path,
+            file_size_bytes=len(file_content)
+        )
+    return builder.finish()
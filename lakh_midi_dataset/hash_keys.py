@@ -0,0 +1,82 @@
+"""
+Data Vault hash keys computed once, in bronze
+
+The silver hubs, links and satellites are keyed by
+`dbt_utils.generate_surrogate_key`, an md5 over the business key fields cast
+to varchar, with nulls replaced by a marker and fields joined by '-'. The
+bronze tables carry those keys as columns, computed with duckdb's md5 in the
+same form the macro renders to, so silver can select them instead of
+rehashing and joining back to the hubs.
+"""
+
+import hashlib
+
+NULL_KEY = "_dbt_utils_surrogate_key_null_"
+
+
+def surrogate_key_sql(*fields: str) -> str:
+    """duckdb expression equal to `generate_surrogate_key([fields])`"""
+    parts = " || '-' || ".join(
+        f"coalesce(CAST({field} AS VARCHAR), '{NULL_KEY}')" for field in fields
+    )
+    return f"md5(CAST({parts} AS VARCHAR))"
+
+
+def surrogate_key(*values) -> str:
+    """The same hash key for string business keys, for stages that run outside duckdb"""
+    parts = "-".join(NULL_KEY if value is None else str(value) for value in values)
+    return hashlib.md5(parts.encode("utf-8")).hexdigest()
+
+
+_TRACK_HK = surrogate_key_sql("track_id")
+_MIDI_HK = surrogate_key_sql("midi_md5")
+_ARTIST_HK = surrogate_key_sql("metadata.songs.artist_id")
+_RELEASE_HK = surrogate_key_sql("metadata.songs.release_7digitalid")
+_SOURCE_HK = surrogate_key_sql("source_path")
+
+# table name: {column: (expression, fields it reads)}, the hash keys added to
+# each bronze table. Link keys hash the hub keys, exactly as the link models do.
+HASH_KEYS = {
+    "raw_midi_files": {
+        "midi_hk": (_MIDI_HK, ["midi_md5"]),
+    },
+    "h5_extract": {
+        "track_hk": (_TRACK_HK, ["track_id"]),
+        "artist_hk": (_ARTIST_HK, ["metadata.songs.artist_id"]),
+        "release_hk": (_RELEASE_HK, ["metadata.songs.release_7digitalid"]),
+        "similar_artist_hks": (
+            f"list_transform(metadata.similar_artists, lambda x: {surrogate_key_sql('x')})",
+            ["metadata.similar_artists"],
+        ),
+        "link_track_artist_hk": (
+            surrogate_key_sql(_TRACK_HK, _ARTIST_HK), ["track_id", "metadata.songs.artist_id"]
+        ),
+        "link_track_release_hk": (
+            surrogate_key_sql(_TRACK_HK, _RELEASE_HK), ["track_id", "metadata.songs.release_7digitalid"]
+        ),
+    },
+    "raw_match_scores": {
+        "track_hk": (_TRACK_HK, ["track_id"]),
+        "midi_hk": (_MIDI_HK, ["midi_md5"]),
+        "link_track_midi_hk": (surrogate_key_sql(_TRACK_HK, _MIDI_HK), ["track_id", "midi_md5"]),
+    },
+    "raw_md5_paths": {
+        "midi_hk": (_MIDI_HK, ["midi_md5"]),
+        "source_hk": (_SOURCE_HK, ["source_path"]),
+        "link_midi_source_hk": (surrogate_key_sql(_MIDI_HK, _SOURCE_HK), ["midi_md5", "source_path"]),
+    },
+}
+
+
+def hash_key_select(table: str, available: set[str] | None = None) -> str:
+    """
+    Select list adding the hash key columns of `table` to its rows, leaving
+    out keys whose fields are not in `available` (dotted paths), as when
+    only part of the H5 files was extracted
+    """
+    columns = "".join(
+        f", {expression} AS {column}"
+        for column, (expression, fields) in HASH_KEYS.get(table, {}).items()
+        if available is None or available.issuperset(fields)
+    )
+    return f"*{columns}"
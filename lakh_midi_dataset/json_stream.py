@@ -0,0 +1,84 @@
+"""
+Incremental parsing of the large top level JSON objects in the Lakh sources
+
+`match_scores.json` and `md5_to_paths.json` are single objects mapping a key
+to a small value. `iter_json_object` walks such a file in fixed size chunks
+and yields one (key, value) pair at a time, so memory is bounded by the chunk
+size and the largest single value rather than by the file.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Iterator
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+
+class _ChunkReader:
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Drop consumed text and read another chunk, False at end of file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """Next non whitespace character, or '' at end of file"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expected {char!r}, found {found!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def decode(self, decoder: json.JSONDecoder) -> Any:
+        """Decode the next complete JSON value, reading more input as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number may have been cut short by the chunk boundary, so only
+            # accept a value once the character after it is visible
+            if (end == len(self.buf) or self.buf[end] not in _DELIMITERS) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_object(path: str | Path, chunk_size: int = 1 << 20) -> Iterator[tuple[str, Any]]:
+    """
+    Yield the (key, value) pairs of a file holding one top level JSON object
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _ChunkReader(f, chunk_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.decode(decoder)
+            reader.expect(":")
+            yield key, reader.decode(decoder)
+            if reader.peek() == "}":
+                return
+            reader.expect(",")
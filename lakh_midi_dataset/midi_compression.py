@@ -0,0 +1,142 @@
+"""
+Dictionary trained zstd compression of MIDI blobs
+
+MIDI files are a few KB each and share most of their header and event
+structure, which parquet's page level compression barely exploits. Each blob
+is instead compressed on its own against a zstd dictionary trained on a
+sample of the corpus. Dictionaries are stored beside the dataset, named by a
+hash of their contents, and every row records the codec it was written with
+in `content_codec`:
+
+    raw                     stored as is
+    zstd-dict:<version>     zstd with data/_midi_dictionaries/<version>.zdict
+
+so rows written with different dictionaries can be mixed, and `decompress`
+restores any of them.
+"""
+
+import hashlib
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Iterable
+
+import zstandard
+
+from lakh_midi_dataset.sharding import bronze_dir
+
+CODEC_RAW = "raw"
+_CODEC_PREFIX = "zstd-dict:"
+
+DEFAULT_DICT_SIZE = 112 * 1024
+DEFAULT_SAMPLE_SIZE = 20_000
+DEFAULT_LEVEL = 9
+
+
+def dictionary_dir() -> Path:
+    return bronze_dir().parent / "_midi_dictionaries"
+
+
+def codec_for(version: str) -> str:
+    return _CODEC_PREFIX + version
+
+
+def train_dictionary(samples: Iterable[bytes], dict_size: int = DEFAULT_DICT_SIZE) -> bytes:
+    """Train a dictionary of up to `dict_size` bytes on sample MIDI blobs"""
+    return zstandard.train_dictionary(dict_size, list(samples)).as_bytes()
+
+
+def save_dictionary(dictionary: bytes, directory: str | Path | None = None) -> str:
+    """Store a dictionary and return its version"""
+    directory = Path(directory) if directory is not None else dictionary_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    version = hashlib.sha256(dictionary).hexdigest()[:16]
+    path = directory / f"{version}.zdict"
+    if not path.exists():
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(dictionary)
+        tmp_path.replace(path)
+    return version
+
+
+def latest_dictionary(directory: str | Path | None = None) -> str | None:
+    """Version of the most recently saved dictionary, if any"""
+    directory = Path(directory) if directory is not None else dictionary_dir()
+    paths = sorted(directory.glob("*.zdict"), key=lambda path: path.stat().st_mtime)
+    return paths[-1].stem if paths else None
+
+
+def load_dictionary(version: str, directory: str | Path | None = None) -> zstandard.ZstdCompressionDict:
+    directory = Path(directory) if directory is not None else dictionary_dir()
+    return zstandard.ZstdCompressionDict((directory / f"{version}.zdict").read_bytes())
+
+
+class MidiCompressor:
+    """Compresses blobs one at a time with a saved dictionary"""
+    def __init__(self, version: str, directory: str | Path | None = None, level: int = DEFAULT_LEVEL):
+        self.version = version
+        self.codec = codec_for(version)
+        self._compressor = zstandard.ZstdCompressor(
+            level=level,
+            dict_data=load_dictionary(version, directory),
+            # The dictionary identifies itself through content_codec instead
+            write_dict_id=False,
+            write_checksum=False,
+        )
+
+    def compress(self, blob: bytes | memoryview) -> bytes:
+        return self._compressor.compress(blob)
+
+
+# (directory, version): decompressor, one per thread as zstd contexts are not thread safe
+_decompressors = threading.local()
+
+
+def _decompressor(version: str, directory: str | Path | None) -> zstandard.ZstdDecompressor:
+    cache = _decompressors.__dict__.setdefault("cache", {})
+    key = (str(directory), version)
+    if key not in cache:
+        cache[key] = zstandard.ZstdDecompressor(dict_data=load_dictionary(version, directory))
+    return cache[key]
+
+
+def decompress(content: bytes | memoryview, codec: str | None, directory: str | Path | None = None) -> bytes:
+    """
+    The original MIDI bytes of a stored blob. A missing codec is read as
+    raw, as in tables written before compression was added.
+    """
+    if codec is None or codec == CODEC_RAW:
+        return bytes(content)
+    if not codec.startswith(_CODEC_PREFIX):
+        raise ValueError(f"Unknown MIDI content codec {codec!r}")
+    return _decompressor(codec.removeprefix(_CODEC_PREFIX), directory).decompress(content)
+
+
+def ensure_dictionary(
+    samples: Iterable[bytes],
+    sample_size: int = DEFAULT_SAMPLE_SIZE,
+    directory: str | Path | None = None,
+) -> str:
+    """
+    The latest saved dictionary, training and saving one on the first
+    `sample_size` of `samples` if none exists yet
+    """
+    version = latest_dictionary(directory)
+    if version is None:
+        version = save_dictionary(train_dictionary(islice(samples, sample_size)), directory)
+    return version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from lakh_midi_dataset.bronze_pipeline import read_midi_members
+
+    parser = argparse.ArgumentParser(description="Train a zstd dictionary on MIDI files from lmd_full.tar.gz")
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE, help="MIDI files to train on")
+    parser.add_argument("--dict-size-kb", type=int, default=DEFAULT_DICT_SIZE // 1024, help="Dictionary size")
+    args = parser.parse_args()
+
+    samples = (content for _, _, content in islice(read_midi_members(), args.sample_size))
+    version = save_dictionary(train_dictionary(samples, args.dict_size_kb * 1024))
+    print(f"Saved MIDI dictionary {version} to {dictionary_dir()}")
@@ -0,0 +1,101 @@
+"""
+Note events of every MIDI file, parsed in bulk
+
+Parses the blobs of bronze `raw_midi_files` with `midi_parser` in worker
+processes and writes one row per note, hash partitioned like the source, to
+
+    data/bronze_lakh_midi/midi_notes/partition_col=<digit>/*.parquet
+
+which the silver `sat_midi_notes` satellite selects from. Files that fail
+to parse get no rows.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+from lakh_midi_dataset import derived_tables, midi_compression, midi_parser
+from lakh_midi_dataset.checkpoint import code_version
+from lakh_midi_dataset.derived_tables import build_derived_table
+from lakh_midi_dataset.midi_compression import decompress
+from lakh_midi_dataset.midi_parser import MidiParseError, parse_midi
+from lakh_midi_dataset.sharding import bronze_dir
+
+NOTES_SCHEMA = pa.schema([
+    ("midi_hk", pa.string()),
+    ("track", pa.int16()),
+    ("channel", pa.int8()),
+    ("program", pa.int8()),
+    ("pitch", pa.int8()),
+    ("velocity", pa.int8()),
+    ("onset_tick", pa.int64()),
+    ("duration_ticks", pa.int64()),
+    ("onset_seconds", pa.float64()),
+    ("duration_seconds", pa.float64()),
+])
+
+SOURCE_COLUMNS = ["midi_hk", "file_content", "content_codec"]
+
+
+def parse_notes_batch(batch: pa.RecordBatch) -> pa.Table:
+    """Notes of every MIDI file in a batch of `SOURCE_COLUMNS`"""
+    names = batch.schema.names
+    contents = batch.column("file_content")
+    codecs = batch.column("content_codec").to_pylist() if "content_codec" in names else [None] * len(batch)
+
+    parsed, rows = [], []
+    for row, (content, codec) in enumerate(zip(contents, codecs)):
+        if not content.is_valid:
+            continue
+        try:
+            notes = parse_midi(decompress(content.as_buffer(), codec)).notes
+        except MidiParseError:
+            continue
+        parsed.append(notes)
+        rows.append(np.full(len(notes), row, np.int64))
+
+    if not parsed:
+        return NOTES_SCHEMA.empty_table()
+    columns = [np.concatenate(field) for field in zip(*parsed)]
+    return pa.Table.from_arrays(
+        [batch.column("midi_hk").take(np.concatenate(rows))]
+        + [pa.array(values, field.type) for values, field in zip(columns, list(NOTES_SCHEMA)[1:])],
+        schema=NOTES_SCHEMA,
+    )
+
+
+def build_midi_notes(
+    source: str | Path | None = None,
+    output: str | Path | None = None,
+    workers: int | None = None,
+) -> tuple[int, int]:
+    """
+    Parse the notes of any `raw_midi_files` file not yet parsed by the
+    current parser. Returns the files written and stale files removed.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return build_derived_table(
+        parse_notes_batch, NOTES_SCHEMA,
+        source=Path(source) if source is not None else bronze_dir() / "raw_midi_files",
+        output=Path(output) if output is not None else bronze_dir() / "midi_notes",
+        version=code_version(sys.modules[__name__], midi_parser, midi_compression, derived_tables),
+        columns=SOURCE_COLUMNS,
+        workers=workers,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Parse the notes of the bronze MIDI files")
+    parser.add_argument("--source", default=None, help="raw_midi_files directory to parse")
+    parser.add_argument("--output", default=None, help="Directory to write midi_notes to")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes")
+    args = parser.parse_args()
+
+    written, removed = build_midi_notes(args.source, args.output, args.workers)
+    print(f"Wrote midi_notes for {written} raw_midi_files files, removed {removed} stale")
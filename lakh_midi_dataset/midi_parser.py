@@ -0,0 +1,265 @@
+"""
+Standard MIDI File parser producing note arrays
+
+Decodes a whole SMF from memory in one pass over its track chunks, pairing
+note on/off events into notes. The event decoding is a plain python loop over
+the bytes, as running status and variable length deltas make each event
+depend on the one before. Only what depends on state shared across tracks is
+vectorized, resolved afterwards with lookups over all notes at once: the
+program sounding on each note's channel, and tick to seconds conversion
+through the tempo map.
+"""
+
+from array import array
+from typing import NamedTuple
+
+import numpy as np
+
+DEFAULT_TEMPO = 500_000  # microseconds per beat, 120 bpm
+DRUM_CHANNEL = 9
+
+
+class MidiParseError(ValueError):
+    pass
+
+
+class Notes(NamedTuple):
+    """One array per field, a row per note, sorted by onset"""
+    track: np.ndarray           # int16, index of the track chunk
+    channel: np.ndarray         # int8
+    program: np.ndarray         # int8, program on the channel at the onset
+    pitch: np.ndarray           # int8
+    velocity: np.ndarray        # int8
+    onset_tick: np.ndarray      # int64
+    duration_ticks: np.ndarray  # int64
+    onset_seconds: np.ndarray   # float64
+    duration_seconds: np.ndarray  # float64
+
+    def __len__(self) -> int:
+        return len(self.pitch)
+
+
+class ParsedMidi(NamedTuple):
+    ticks_per_beat: int | None  # None for SMPTE timed files
+    num_tracks: int
+    end_tick: int
+    end_seconds: float
+    tempo_ticks: np.ndarray     # int64, tick of each tempo change, starting at 0
+    tempos: np.ndarray          # int64, microseconds per beat from that tick
+    tempo_seconds: np.ndarray   # float64, time of each tempo change
+    time_signatures: list[tuple[int, int, int]]  # (tick, numerator, denominator)
+    notes: Notes
+
+
+class _TimeMap:
+    """Tick to seconds conversion through a tempo map"""
+    def __init__(self, tempo_ticks: np.ndarray, tempos: np.ndarray, ticks_per_beat: int | None, ticks_per_second: float):
+        self.ticks = tempo_ticks
+        if ticks_per_beat is None:
+            # SMPTE timing ignores tempo
+            self.rates = np.full(len(tempo_ticks), 1.0 / ticks_per_second)
+        else:
+            self.rates = tempos / (1e6 * ticks_per_beat)
+        self.starts = np.concatenate([[0.0], np.cumsum(np.diff(tempo_ticks) * self.rates[:-1])])
+
+    def seconds(self, ticks: np.ndarray) -> np.ndarray:
+        segment = np.searchsorted(self.ticks, ticks, side="right") - 1
+        return self.starts[segment] + (ticks - self.ticks[segment]) * self.rates[segment]
+
+
+def _read_varlen(data: bytes, pos: int, end: int) -> tuple[int, int]:
+    value = 0
+    while pos < end:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+    raise MidiParseError("Truncated variable length quantity")
+
+
+def parse_midi(data: bytes | memoryview) -> ParsedMidi:
+    """Parse an SMF, raising MidiParseError if it is malformed"""
+    try:
+        return _parse(bytes(data))
+    except IndexError:
+        raise MidiParseError("Truncated event") from None
+
+
+def _header(data: bytes) -> tuple[int, int | None, float]:
+    """(header length, ticks per beat, ticks per second for SMPTE timing)"""
+    if len(data) < 14 or data[:4] != b"MThd":
+        raise MidiParseError("Missing MThd header")
+    header_length = int.from_bytes(data[4:8], "big")
+    division = int.from_bytes(data[12:14], "big")
+    if division & 0x8000:
+        # SMPTE: frames per second (negative) times ticks per frame
+        ticks_per_second = float((256 - (division >> 8)) * (division & 0xFF))
+        if ticks_per_second == 0:
+            raise MidiParseError("Invalid SMPTE division")
+        return header_length, None, ticks_per_second
+    if division == 0:
+        raise MidiParseError("Zero ticks per beat")
+    return header_length, division, 0.0
+
+
+def _parse(data: bytes) -> ParsedMidi:
+    header_length, ticks_per_beat, ticks_per_second = _header(data)
+
+    note_track, note_channel, note_pitch = array("h"), array("b"), array("b")
+    note_velocity, note_onset, note_offset = array("b"), array("q"), array("q")
+    program_ticks, program_channels, program_values = array("q"), array("b"), array("b")
+    tempo_ticks, tempos = array("q"), array("q")
+    time_signatures = []
+    end_tick = 0
+
+    pos = 8 + header_length
+    track = 0
+    while pos + 8 <= len(data):
+        chunk_type = data[pos:pos + 4]
+        chunk_length = int.from_bytes(data[pos + 4:pos + 8], "big")
+        pos += 8
+        chunk_end = min(pos + chunk_length, len(data))
+        if chunk_type != b"MTrk":
+            pos = chunk_end
+            continue
+
+        # (channel << 7 | pitch): [(onset, velocity), ...] of sounding notes
+        active: dict[int, list[tuple[int, int]]] = {}
+        tick = 0
+        status = 0
+        while pos < chunk_end:
+            delta, pos = _read_varlen(data, pos, chunk_end)
+            tick += delta
+            byte = data[pos]
+            if byte >= 0x80:
+                status = byte
+                pos += 1
+            elif status < 0x80:
+                raise MidiParseError("Data byte without running status")
+            kind = status & 0xF0
+
+            if kind == 0x90 or kind == 0x80:
+                if pos + 2 > chunk_end:
+                    raise MidiParseError("Truncated note event")
+                channel = status & 0x0F
+                pitch = data[pos]
+                velocity = data[pos + 1]
+                if pitch >= 0x80 or velocity >= 0x80:
+                    raise MidiParseError("Note data byte out of range")
+                pos += 2
+                key = channel << 7 | pitch
+                if kind == 0x90 and velocity > 0:
+                    active.setdefault(key, []).append((tick, velocity))
+                elif sounding := active.get(key):
+                    onset, on_velocity = sounding.pop(0)
+                    note_track.append(track)
+                    note_channel.append(channel)
+                    note_pitch.append(pitch)
+                    note_velocity.append(on_velocity)
+                    note_onset.append(onset)
+                    note_offset.append(tick)
+            elif kind == 0xC0:
+                program_ticks.append(tick)
+                program_channels.append(status & 0x0F)
+                if data[pos] >= 0x80:
+                    raise MidiParseError("Program data byte out of range")
+                program_values.append(data[pos])
+                pos += 1
+            elif kind == 0xD0:
+                pos += 1
+            elif kind != 0xF0:
+                # Aftertouch, control change and pitch bend
+                pos += 2
+            elif status == 0xFF:
+                meta_type = data[pos]
+                length, pos = _read_varlen(data, pos + 1, chunk_end)
+                if meta_type == 0x51 and length == 3:
+                    tempo_ticks.append(tick)
+                    tempos.append(int.from_bytes(data[pos:pos + 3], "big"))
+                elif meta_type == 0x58 and length >= 2 and data[pos + 1] < 8:
+                    time_signatures.append((tick, data[pos], 2 ** data[pos + 1]))
+                pos += length
+                if meta_type == 0x2F:
+                    break
+            elif status == 0xF0 or status == 0xF7:
+                length, pos = _read_varlen(data, pos, chunk_end)
+                pos += length
+                # Sysex cancels running status
+                status = 0
+            else:
+                raise MidiParseError(f"Unexpected status byte {status:#x}")
+        # Notes never turned off are dropped
+        end_tick = max(end_tick, tick)
+        pos = chunk_end
+        track += 1
+
+    if track == 0:
+        raise MidiParseError("No MTrk chunks")
+
+    tempo_tick_array = np.frombuffer(tempo_ticks, np.int64)
+    tempo_array = np.frombuffer(tempos, np.int64)
+    order = np.argsort(tempo_tick_array, kind="stable")
+    tempo_tick_array, tempo_array = tempo_tick_array[order], tempo_array[order]
+    if len(tempo_tick_array) == 0 or tempo_tick_array[0] > 0:
+        tempo_tick_array = np.concatenate([[0], tempo_tick_array])
+        tempo_array = np.concatenate([[DEFAULT_TEMPO], tempo_array])
+    time_map = _TimeMap(tempo_tick_array, tempo_array, ticks_per_beat, ticks_per_second)
+
+    onset = np.frombuffer(note_onset, np.int64)
+    offset = np.frombuffer(note_offset, np.int64)
+    channel = np.frombuffer(note_channel, np.int8)
+    program = _programs_at(
+        channel, onset,
+        np.frombuffer(program_channels, np.int8),
+        np.frombuffer(program_ticks, np.int64),
+        np.frombuffer(program_values, np.int8),
+    )
+    onset_seconds = time_map.seconds(onset)
+    order = np.lexsort((np.frombuffer(note_pitch, np.int8), onset))
+    notes = Notes(
+        track=np.frombuffer(note_track, np.int16)[order],
+        channel=channel[order],
+        program=program[order],
+        pitch=np.frombuffer(note_pitch, np.int8)[order],
+        velocity=np.frombuffer(note_velocity, np.int8)[order],
+        onset_tick=onset[order],
+        duration_ticks=(offset - onset)[order],
+        onset_seconds=onset_seconds[order],
+        duration_seconds=(time_map.seconds(offset) - onset_seconds)[order],
+    )
+    return ParsedMidi(
+        ticks_per_beat=ticks_per_beat,
+        num_tracks=track,
+        end_tick=end_tick,
+        end_seconds=float(time_map.seconds(np.array([end_tick]))[0]),
+        tempo_ticks=tempo_tick_array,
+        tempos=tempo_array,
+        tempo_seconds=time_map.starts,
+        time_signatures=sorted(time_signatures),
+        notes=notes,
+    )
+
+
+def _programs_at(
+    channel: np.ndarray, tick: np.ndarray,
+    change_channel: np.ndarray, change_tick: np.ndarray, change_program: np.ndarray,
+) -> np.ndarray:
+    """
+    Program of each note's channel at its onset, 0 before any change. A change
+    at the same tick as a note applies to it.
+    """
+    program = np.zeros(len(channel), np.int8)
+    if len(change_tick) == 0:
+        return program
+    # Sort the changes by (channel, tick) and look every note up in one pass
+    order = np.lexsort((change_tick, change_channel))
+    change_channel, change_tick, change_program = change_channel[order], change_tick[order], change_program[order]
+    # Channels are < 16 and ticks < 2^58 in practice, so one key orders both
+    change_key = change_channel.astype(np.int64) << 58 | change_tick
+    note_key = channel.astype(np.int64) << 58 | tick
+    index = np.searchsorted(change_key, note_key, side="right") - 1
+    valid = index >= 0
+    valid[valid] = change_channel[index[valid]] == channel[valid]
+    program[valid] = change_program[index[valid]]
+    return program
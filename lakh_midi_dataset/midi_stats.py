@@ -0,0 +1,239 @@
+"""
+Summary statistics of every MIDI file, computed in bulk
+
+Parses the bronze `raw_midi_files` blobs in worker processes like
+`midi_notes` and writes one row of content statistics per file to
+
+    data/bronze_lakh_midi/midi_stats/partition_col=<digit>/*.parquet
+
+for the silver `sat_midi_stats` satellite. Files that fail to parse keep
+their row, with `parse_error` set and the statistics null, so the table also
+records which files are unreadable.
+
+Keys are estimated for a whole batch at once, correlating the pitch class
+histograms with the 24 rotations of the Krumhansl-Kessler key profiles, and
+are numbered like the Echo Nest `key`/`mode` (0 = C, mode 1 = major) so they
+join to hub_key_signature and hub_mode.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+from lakh_midi_dataset import derived_tables, midi_compression, midi_parser
+from lakh_midi_dataset.batching import ColumnBatch
+from lakh_midi_dataset.checkpoint import code_version
+from lakh_midi_dataset.derived_tables import build_derived_table
+from lakh_midi_dataset.midi_compression import decompress
+from lakh_midi_dataset.midi_notes import SOURCE_COLUMNS
+from lakh_midi_dataset.midi_parser import DRUM_CHANNEL, MidiParseError, ParsedMidi, parse_midi
+from lakh_midi_dataset.sharding import bronze_dir
+
+STATS_SCHEMA = pa.schema([
+    ("midi_hk", pa.string()),
+    ("parse_error", pa.string()),
+    ("ticks_per_beat", pa.int32()),
+    ("num_tracks", pa.int16()),
+    ("duration_seconds", pa.float64()),
+    ("note_count", pa.int64()),
+    ("drum_note_count", pa.int64()),
+    ("has_drums", pa.bool_()),
+    ("programs", pa.list_(pa.int8())),
+    ("pitch_min", pa.int8()),
+    ("pitch_max", pa.int8()),
+    ("max_polyphony", pa.int32()),
+    ("mean_polyphony", pa.float64()),
+    ("initial_tempo", pa.float64()),
+    ("mean_tempo", pa.float64()),
+    ("min_tempo", pa.float64()),
+    ("max_tempo", pa.float64()),
+    ("tempo_change_count", pa.int32()),
+    ("time_signature_numerator", pa.int16()),
+    ("time_signature_denominator", pa.int16()),
+    ("pitch_class_histogram", pa.list_(pa.float32(), 12)),
+    ("estimated_key_signature_id", pa.int8()),
+    ("estimated_mode_id", pa.int8()),
+    ("key_confidence", pa.float64()),
+])
+
+# Krumhansl-Kessler probe tone profiles, from the tonic up
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _key_profiles() -> np.ndarray:
+    """(24, 12) standardised profiles, C..B major then C..B minor"""
+    profiles = np.array([
+        np.roll(profile, tonic)
+        for profile in (MAJOR_PROFILE, MINOR_PROFILE)
+        for tonic in range(12)
+    ])
+    return _standardise(profiles)
+
+
+def _standardise(rows: np.ndarray) -> np.ndarray:
+    centred = rows - rows.mean(axis=1, keepdims=True)
+    scale = np.sqrt((centred ** 2).mean(axis=1, keepdims=True))
+    return np.divide(centred, scale, out=np.zeros_like(centred), where=scale > 0)
+
+
+_KEY_PROFILES = _key_profiles()
+
+
+def estimate_keys(histograms: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (key, mode, correlation) of each row of an (n, 12) pitch class histogram
+    matrix, with mode 1 for major and 0 for minor
+    """
+    correlations = _standardise(histograms) @ _KEY_PROFILES.T / 12
+    best = correlations.argmax(axis=1)
+    return best % 12, (best < 12).astype(np.int8), correlations[np.arange(len(best)), best]
+
+
+def midi_summary(parsed: ParsedMidi) -> tuple[tuple, np.ndarray | None]:
+    """
+    Every STATS_SCHEMA column of one file from ticks_per_beat to
+    time_signature_denominator, and its duration weighted pitch class
+    histogram (None without pitched notes)
+    """
+    notes = parsed.notes
+    drums = notes.channel == DRUM_CHANNEL
+    pitched = ~drums
+    pitches = notes.pitch[pitched]
+
+    histogram = None
+    if pitched.any():
+        histogram = np.bincount(pitches % 12, weights=notes.duration_seconds[pitched], minlength=12)
+        if histogram.sum() > 0:
+            histogram = histogram / histogram.sum()
+        else:
+            # Only zero length notes, count them instead
+            histogram = np.bincount(pitches % 12, minlength=12) / len(pitches)
+
+    max_polyphony, mean_polyphony = _polyphony(notes.onset_seconds, notes.duration_seconds)
+
+    # Of tempo events at the same tick (often one per track at 0) only the
+    # last takes effect, as in the time map
+    last = np.append(parsed.tempo_ticks[1:] != parsed.tempo_ticks[:-1], True)
+    tempos, tempo_seconds = parsed.tempos[last], parsed.tempo_seconds[last]
+
+    # Tempo in bpm over each segment of the tempo map that falls within the file
+    bpm = 60e6 / np.maximum(tempos, 1)
+    ends = np.append(tempo_seconds[1:], parsed.end_seconds)
+    lengths = np.clip(ends, None, parsed.end_seconds) - np.clip(tempo_seconds, None, parsed.end_seconds)
+    lengths = np.maximum(lengths, 0)
+    mean_tempo = float(bpm @ lengths / lengths.sum()) if lengths.sum() > 0 else float(bpm[0])
+
+    numerator, denominator = parsed.time_signatures[0][1:] if parsed.time_signatures else (None, None)
+    summary = (
+        parsed.ticks_per_beat,
+        parsed.num_tracks,
+        parsed.end_seconds,
+        len(notes),
+        int(drums.sum()),
+        bool(drums.any()),
+        np.unique(notes.program[pitched]).tolist(),
+        int(pitches.min()) if len(pitches) else None,
+        int(pitches.max()) if len(pitches) else None,
+        max_polyphony,
+        mean_polyphony,
+        float(bpm[0]),
+        mean_tempo,
+        float(bpm.min()),
+        float(bpm.max()),
+        len(bpm) - 1,
+        numerator,
+        denominator,
+    )
+    return summary, histogram
+
+
+def _polyphony(onsets: np.ndarray, durations: np.ndarray) -> tuple[int, float | None]:
+    """
+    Most notes sounding at once, and the mean number sounding over the time
+    at least one does
+    """
+    if len(onsets) == 0:
+        return 0, None
+    times = np.concatenate([onsets, onsets + durations])
+    steps = np.concatenate([np.ones(len(onsets), np.int32), -np.ones(len(onsets), np.int32)])
+    # Note offs sort before note ons at the same time
+    order = np.lexsort((steps, times))
+    times, levels = times[order], np.cumsum(steps[order])
+    spans = np.diff(times)
+    sounding = spans[levels[:-1] > 0].sum()
+    mean = float(levels[:-1] @ spans / sounding) if sounding > 0 else None
+    return int(levels.max()), mean
+
+
+def compute_stats_batch(batch: pa.RecordBatch) -> pa.Table:
+    """STATS_SCHEMA row of every MIDI file in a batch of midi_notes.SOURCE_COLUMNS"""
+    names = batch.schema.names
+    contents = batch.column("file_content")
+    codecs = batch.column("content_codec").to_pylist() if "content_codec" in names else [None] * len(batch)
+
+    summaries, errors = [], []
+    histograms = np.zeros((len(batch), 12))
+    has_histogram = np.zeros(len(batch), bool)
+    for row, (content, codec) in enumerate(zip(contents, codecs)):
+        try:
+            if not content.is_valid:
+                raise MidiParseError("No content")
+            summary, histogram = midi_summary(parse_midi(decompress(content.as_buffer(), codec)))
+        except MidiParseError as e:
+            summaries.append(None)
+            errors.append(str(e))
+            continue
+        summaries.append(summary)
+        errors.append(None)
+        if histogram is not None:
+            histograms[row] = histogram
+            has_histogram[row] = True
+
+    keys, modes, confidences = estimate_keys(histograms)
+    rows = ColumnBatch(STATS_SCHEMA)
+    empty = (None,) * (len(STATS_SCHEMA) - 6)
+    for row, (midi_hk, summary, error) in enumerate(zip(batch.column("midi_hk").to_pylist(), summaries, errors)):
+        key_columns = (
+            (histograms[row].tolist(), int(keys[row]), int(modes[row]), float(confidences[row]))
+            if has_histogram[row] else (None, None, None, None)
+        )
+        rows.append(midi_hk, error, *(summary or empty), *key_columns)
+    return rows.flush()
+
+
+def build_midi_stats(
+    source: str | Path | None = None,
+    output: str | Path | None = None,
+    workers: int | None = None,
+) -> tuple[int, int]:
+    """
+    Summarise any `raw_midi_files` file not yet summarised by the current
+    code. Returns the files written and stale files removed.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return build_derived_table(
+        compute_stats_batch, STATS_SCHEMA,
+        source=Path(source) if source is not None else bronze_dir() / "raw_midi_files",
+        output=Path(output) if output is not None else bronze_dir() / "midi_stats",
+        version=code_version(sys.modules[__name__], midi_parser, midi_compression, derived_tables),
+        columns=SOURCE_COLUMNS,
+        workers=workers,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise the content of the bronze MIDI files")
+    parser.add_argument("--source", default=None, help="raw_midi_files directory to summarise")
+    parser.add_argument("--output", default=None, help="Directory to write midi_stats to")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes")
+    args = parser.parse_args()
+
+    written, removed = build_midi_stats(args.source, args.output, args.workers)
+    print(f"Wrote midi_stats for {written} raw_midi_files files, removed {removed} stale")
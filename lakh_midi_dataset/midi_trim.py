@@ -0,0 +1,146 @@
+"""
+Time windows of Standard MIDI Files
+
+`trim_midi` cuts a time window out of an SMF, e.g. for rendering previews.
+It is kept apart from `midi_parser`, whose source versions the derived
+note and statistics tables, so changes here don't rebuild them.
+"""
+
+import numpy as np
+
+from lakh_midi_dataset.midi_parser import MidiParseError, _header, _parse, _read_varlen, _TimeMap
+
+
+def _ticks_at(time_map: _TimeMap, seconds: float) -> int:
+    """First tick at or after a time"""
+    segment = int(np.searchsorted(time_map.starts, seconds, side="right")) - 1
+    rate = time_map.rates[segment]
+    if rate <= 0:
+        return int(time_map.ticks[segment])
+    return int(time_map.ticks[segment] + np.ceil((seconds - time_map.starts[segment]) / rate))
+
+
+def _write_varlen(value: int) -> bytes:
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def trim_midi(data: bytes | memoryview, start_seconds: float, duration_seconds: float | None = None) -> bytes:
+    """
+    The part of an SMF from `start_seconds`, `duration_seconds` long (default
+    to the end), as a new SMF starting at 0.
+
+    Tempo, program, controller and other state events before the window are
+    kept at its start, so it sounds as it does in the full file. Notes
+    struck before the window are dropped, and notes still sounding at its
+    end are turned off there.
+    """
+    try:
+        return _trim(bytes(data), start_seconds, duration_seconds)
+    except IndexError:
+        raise MidiParseError("Truncated event") from None
+
+
+def _trim(data: bytes, start_seconds: float, duration_seconds: float | None) -> bytes:
+    parsed = _parse(data)
+    header_length, ticks_per_beat, ticks_per_second = _header(data)
+    time_map = _TimeMap(parsed.tempo_ticks, parsed.tempos, ticks_per_beat, ticks_per_second)
+    start = _ticks_at(time_map, max(start_seconds, 0.0))
+    end = None
+    if duration_seconds is not None:
+        end = _ticks_at(time_map, max(start_seconds, 0.0) + duration_seconds)
+
+    tracks = []
+    pos = 8 + header_length
+    while pos + 8 <= len(data):
+        chunk_type = data[pos:pos + 4]
+        chunk_length = int.from_bytes(data[pos + 4:pos + 8], "big")
+        pos += 8
+        chunk_end = min(pos + chunk_length, len(data))
+        if chunk_type == b"MTrk":
+            tracks.append(_trim_track(data, pos, chunk_end, start, end))
+        pos = chunk_end
+
+    header = bytearray(data[:8 + header_length])
+    header[10:12] = len(tracks).to_bytes(2, "big")
+    return bytes(header) + b"".join(
+        b"MTrk" + len(track).to_bytes(4, "big") + track for track in tracks
+    )
+
+
+def _trim_track(data: bytes, pos: int, chunk_end: int, start: int, end: int | None) -> bytes:
+    out = bytearray()
+    out_tick = 0
+    # Notes struck in the window and not yet released, (channel << 7 | pitch): count
+    sounding: dict[int, int] = {}
+
+    def emit(tick: int, event: bytes):
+        nonlocal out_tick
+        out.extend(_write_varlen(tick - out_tick))
+        out.extend(event)
+        out_tick = tick
+
+    tick = 0
+    status = 0
+    while pos < chunk_end:
+        delta, pos = _read_varlen(data, pos, chunk_end)
+        tick += delta
+        if end is not None and tick >= end:
+            break
+        event_start = pos
+        byte = data[pos]
+        if byte >= 0x80:
+            status = byte
+            pos += 1
+        elif status < 0x80:
+            raise MidiParseError("Data byte without running status")
+        kind = status & 0xF0
+
+        if kind in (0xC0, 0xD0):
+            pos += 1
+        elif kind != 0xF0:
+            pos += 2
+        elif status == 0xFF:
+            meta_type = data[pos]
+            length, pos = _read_varlen(data, pos + 1, chunk_end)
+            pos += length
+            if meta_type == 0x2F:
+                break
+        elif status == 0xF0 or status == 0xF7:
+            length, pos = _read_varlen(data, pos, chunk_end)
+            pos += length
+        else:
+            raise MidiParseError(f"Unexpected status byte {status:#x}")
+        if pos > chunk_end:
+            raise MidiParseError("Truncated event")
+
+        # Always written with its status byte, as running status may not carry over
+        event = bytes([status]) + data[event_start + (data[event_start] >= 0x80):pos]
+        if kind != 0xF0 and max(event[1:]) >= 0x80:
+            raise MidiParseError("Channel data byte out of range")
+        if kind == 0x90 or kind == 0x80:
+            if tick < start:
+                continue
+            key = (status & 0x0F) << 7 | event[1]
+            if kind == 0x90 and event[2] > 0:
+                sounding[key] = sounding.get(key, 0) + 1
+            elif sounding.get(key):
+                sounding[key] -= 1
+            else:
+                # Release of a note struck before the window
+                continue
+        emit(max(tick - start, 0), event)
+        if status == 0xF0 or status == 0xF7:
+            # Sysex cancels running status
+            status = 0
+
+    end_tick = max(tick - start, out_tick) if end is None else end - start
+    for key, count in sounding.items():
+        for _ in range(count):
+            emit(end_tick, bytes([0x80 | key >> 7, key & 0x7F, 0]))
+    emit(end_tick, b"\xff\x2f\x00")
+    return bytes(out)
@@ -0,0 +1,320 @@
+"""
+Append-only pack files of MIDI payloads with memory mapped reads
+
+An optional storage mode alongside the `raw_midi_files` blob column. MIDI
+payloads are concatenated into pack files, each committed together with an
+index of where every payload landed:
+
+    data/midi_packs/pack-00000.bin            raw bytes, payload after payload
+    data/midi_packs/pack-00000.index.parquet  midi_hk / offset / length / content_codec
+
+Writers lock the pack they are filling, so several can append to one store
+at once. A pack without its index that no writer holds was left by an
+interrupted writer and is removed the next time the store is opened for
+writing. Indexes are written to a temporary file once the pack is synced
+and renamed into place, so readers never trust a partial pack or index.
+Readers map the packs and
+hand out `memoryview`s straight into the page cache, so a point lookup
+touches only that payload's pages and bulk reads copy nothing. Payloads are
+packed as stored in bronze, so `read` decompresses those written with a
+`midi_compression` codec.
+
+    >>> with PackReader("data/midi_packs") as store:
+    ...     midi = store.read(midi_hk)
+    ...     stored = bytes(store.get(midi_hk))
+
+Views returned by `get` and `iter_items` stay valid after `close`, which
+only drops the store's own references to the maps.
+"""
+
+import fcntl
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from lakh_midi_dataset.midi_compression import CODEC_RAW, decompress
+from lakh_midi_dataset.sharding import bronze_dir
+
+DEFAULT_PACK_BYTES = 1 << 30
+
+_PACK_NAME = re.compile(r"pack-(\d+)\.bin")
+
+INDEX_SCHEMA = pa.schema([
+    ("midi_hk", pa.string()),
+    ("offset", pa.int64()),
+    ("length", pa.int64()),
+    ("content_codec", pa.string()),
+])
+
+
+def default_pack_dir() -> Path:
+    return bronze_dir().parent / "midi_packs"
+
+
+def _index_path(pack_path: Path) -> Path:
+    return pack_path.with_name(pack_path.stem + ".index.parquet")
+
+
+def _remove_abandoned(pack_path: Path):
+    """Remove a pack left uncommitted, unless a writer is still filling it"""
+    try:
+        fd = os.open(pack_path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return
+    try:
+        # Committed by its writer between the glob and the lock
+        if not _index_path(pack_path).exists():
+            pack_path.unlink(missing_ok=True)
+            pack_path.with_name(_index_path(pack_path).name + ".tmp").unlink(missing_ok=True)
+    finally:
+        os.close(fd)
+
+
+class PackWriter:
+    """
+    Append payloads to new pack files in `directory`
+
+    Existing packs are never modified; each writer starts a fresh pack and
+    rolls over to another once one reaches `max_pack_bytes`. A pack becomes
+    visible to readers when its index is written, on rollover or `close`.
+    """
+    def __init__(self, directory: str | Path, max_pack_bytes: int = DEFAULT_PACK_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_pack_bytes = max_pack_bytes
+
+        for path in self.directory.glob("pack-*.bin"):
+            if not _index_path(path).exists():
+                _remove_abandoned(path)
+        self._file = None
+
+    def __enter__(self) -> "PackWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            # Leave the uncommitted pack to be cleaned up by the next writer
+            self._abandon()
+
+    def _open_pack(self):
+        numbers = [int(match.group(1)) for path in self.directory.glob("pack-*.bin")
+                   if (match := _PACK_NAME.fullmatch(path.name))]
+        number = max(numbers, default=-1) + 1
+        while True:
+            path = self.directory / f"pack-{number:05d}.bin"
+            try:
+                # Claims the number, which another writer may have just taken
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                number += 1
+                continue
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_nlink > 0:
+                break
+            # Removed as abandoned by another writer before we locked it
+            os.close(fd)
+        self._path = path
+        self._file = os.fdopen(fd, "wb")
+        self._keys: list[str] = []
+        self._offsets: list[int] = []
+        self._lengths: list[int] = []
+        self._codecs: list[str] = []
+        self._size = 0
+
+    def _commit_pack(self):
+        # The payloads must be durable before an index points readers at them
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        index_path = _index_path(self._path)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        pq.write_table(
+            pa.table([self._keys, self._offsets, self._lengths, self._codecs], schema=INDEX_SCHEMA),
+            tmp_path,
+        )
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+        # Closing releases the lock, once the index marks the pack committed
+        self._file.close()
+        self._file = None
+
+    def _abandon(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add(self, midi_hk: str, payload: bytes | memoryview, codec: str = CODEC_RAW):
+        """Append one payload"""
+        self.add_batch(pa.array([midi_hk]), pa.array([payload], pa.large_binary()), pa.array([codec]))
+
+    def add_batch(self, keys: pa.Array, payloads: pa.Array, codecs: pa.Array | None = None):
+        """
+        Append a binary or large_binary array of payloads, stored with
+        `codecs` (default raw). Their values are already contiguous in the
+        array's data buffer, so the whole batch is written with a single write.
+        """
+        if len(keys) == 0:
+            return
+        if self._file is None:
+            self._open_pack()
+
+        offset_type = np.int64 if pa.types.is_large_binary(payloads.type) else np.int32
+        _, offsets_buffer, data = payloads.buffers()
+        offsets = np.frombuffer(offsets_buffer, offset_type)[payloads.offset:payloads.offset + len(payloads) + 1]
+        start, end = int(offsets[0]), int(offsets[-1])
+        if data is not None:
+            self._file.write(memoryview(data)[start:end])
+
+        self._keys.extend(keys.to_pylist())
+        self._offsets.extend((offsets[:-1] - start + self._size).tolist())
+        self._lengths.extend(np.diff(offsets).tolist())
+        self._codecs.extend([CODEC_RAW] * len(keys) if codecs is None else codecs.to_pylist())
+        self._size += end - start
+
+        if self._size >= self.max_pack_bytes:
+            self._commit_pack()
+
+    def close(self):
+        if self._file is not None:
+            self._commit_pack()
+
+
+class PackReader:
+    """
+    Memory mapped view over the committed packs in `directory`
+    """
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self._packs: list[Path] = []
+        self._maps: list[mmap.mmap | None] = []
+        keys, packs, offsets, lengths, codecs = [], [], [], [], []
+        for index_path in sorted(self.directory.glob("pack-*.index.parquet")):
+            index = pq.read_table(index_path)
+            keys.extend(index.column("midi_hk").to_pylist())
+            packs.append(np.full(index.num_rows, len(self._packs), np.int32))
+            offsets.append(index.column("offset").to_numpy())
+            lengths.append(index.column("length").to_numpy())
+            codecs.extend(index.column("content_codec").to_pylist())
+            self._packs.append(index_path.with_name(index_path.name.replace(".index.parquet", ".bin")))
+            self._maps.append(None)
+
+        self._pack = np.concatenate(packs) if packs else np.empty(0, np.int32)
+        self._offset = np.concatenate(offsets) if offsets else np.empty(0, np.int64)
+        self._length = np.concatenate(lengths) if lengths else np.empty(0, np.int64)
+        # Later packs win if a key was written more than once
+        self._by_key = {key: i for i, key in enumerate(keys)}
+        self._codecs = codecs
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def __contains__(self, midi_hk: str) -> bool:
+        return midi_hk in self._by_key
+
+    def __enter__(self) -> "PackReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def keys(self) -> Iterator[str]:
+        return iter(self._by_key)
+
+    def _map(self, pack: int) -> memoryview:
+        if self._maps[pack] is None:
+            with open(self._packs[pack], "rb") as f:
+                self._maps[pack] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._maps[pack])
+
+    def _view(self, row: int) -> memoryview:
+        offset = int(self._offset[row])
+        return self._map(int(self._pack[row]))[offset:offset + int(self._length[row])]
+
+    def get(self, midi_hk: str) -> memoryview:
+        """The payload for `midi_hk`, as a read-only view into the mapped pack"""
+        return self._view(self._by_key[midi_hk])
+
+    def codec(self, midi_hk: str) -> str:
+        return self._codecs[self._by_key[midi_hk]]
+
+    def read(self, midi_hk: str) -> bytes:
+        """The original MIDI bytes for `midi_hk`, decompressed if need be"""
+        row = self._by_key[midi_hk]
+        return decompress(self._view(row), self._codecs[row])
+
+    def iter_items(self, keys: Iterable[str] | None = None) -> Iterator[tuple[str, memoryview]]:
+        """
+        Yield (midi_hk, payload) for `keys` (default all) in pack order, so
+        bulk reads walk each file sequentially
+        """
+        if keys is None:
+            items = list(self._by_key.items())
+        else:
+            items = [(key, self._by_key[key]) for key in keys]
+        items.sort(key=lambda item: (self._pack[item[1]], self._offset[item[1]]))
+        for key, row in items:
+            yield key, self._view(row)
+
+    def close(self):
+        """Drop the pack maps; views handed out keep theirs alive"""
+        for i in range(len(self._maps)):
+            self._maps[i] = None
+
+
+def build_pack_store(
+    directory: str | Path | None = None,
+    source: str | Path | None = None,
+    max_pack_bytes: int = DEFAULT_PACK_BYTES,
+) -> int:
+    """
+    Copy the MIDI payloads from bronze `raw_midi_files` into the pack store,
+    skipping any already packed. Returns the number of payloads added.
+    """
+    directory = Path(directory) if directory is not None else default_pack_dir()
+    source = Path(source) if source is not None else bronze_dir() / "raw_midi_files"
+    with PackReader(directory) as existing:
+        packed = pa.array(list(existing.keys()), pa.string())
+
+    dataset = ds.dataset(source, format="parquet", partitioning="hive")
+    columns = ["midi_hk", "file_content"]
+    if "content_codec" in dataset.schema.names:
+        columns.append("content_codec")
+    added = 0
+    with PackWriter(directory, max_pack_bytes) as writer:
+        for batch in dataset.to_batches(columns=columns):
+            if len(packed):
+                batch = batch.filter(pc.invert(pc.is_in(batch.column("midi_hk"), packed)))
+            writer.add_batch(
+                batch.column("midi_hk"), batch.column("file_content"),
+                batch.column("content_codec") if "content_codec" in columns else None,
+            )
+            added += batch.num_rows
+    return added
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack bronze MIDI payloads for memory mapped reads")
+    parser.add_argument("--directory", default=None, help="Pack store directory, default data/midi_packs")
+    parser.add_argument("--source", default=None, help="raw_midi_files directory to copy from")
+    parser.add_argument("--max-pack-mb", type=int, default=DEFAULT_PACK_BYTES >> 20, help="Size at which packs roll over")
+    args = parser.parse_args()
+
+    added = build_pack_store(args.directory, args.source, args.max_pack_mb << 20)
+    print(f"Packed {added} MIDI files")
@@ -0,0 +1,214 @@
+"""
+Sequence packing of the token shards into fixed context windows
+
+Training on fixed length contexts pads every short sequence up to the
+context length. This export packs the sequences instead, in one streaming
+pass over a `TokenDataset`: sequences longer than the context are cut into
+context length chunks, and chunks are placed best-fit into a bounded set of
+open windows, so memory depends on `max_open` and not on the corpus.
+
+    data/midi_tokens/aria_abs_packed_<context>/packed-00000.bin      (windows, context) token ids
+    data/midi_tokens/aria_abs_packed_<context>/packed-00000.parquet  one row per chunk placed
+    data/midi_tokens/aria_abs_packed_<context>/stats.json            padding efficiency
+
+Each index row records the window within its shard and the position of a
+chunk, with the `midi_hk` and token offset it was cut from, which gives the
+document boundaries for attention masking. Unused positions hold the pad
+token.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lakh_midi_dataset.token_dataset import TokenDataset
+from lakh_midi_dataset.tokenization import default_token_dir
+
+CHUNK_SCHEMA = pa.schema([
+    ("window", pa.int64()),
+    ("position", pa.int32()),
+    ("length", pa.int32()),
+    ("midi_hk", pa.string()),
+    ("source_offset", pa.int64()),
+])
+
+DEFAULT_SHARD_WINDOWS = 1 << 14
+PAD_TOKEN = "<P>"
+
+
+def default_packed_dir(context_length: int, source: str | Path | None = None) -> Path:
+    source = Path(source) if source is not None else default_token_dir()
+    return source.with_name(f"{source.name}_packed_{context_length}")
+
+
+class _ShardWriter:
+    """Writes finished windows to numbered shards of `shard_windows` windows"""
+    def __init__(self, directory: Path, dtype: np.dtype, shard_windows: int):
+        self.directory = directory
+        self.dtype = dtype
+        self.shard_windows = shard_windows
+        self.shards = 0
+        self._bin = None
+        self._chunks: list[tuple] = []
+        self._windows = 0
+
+    def write(self, tokens: np.ndarray, chunks: list[tuple]):
+        if self._bin is None:
+            self._bin = open(self.directory / f"packed-{self.shards:05d}.bin.tmp", "wb")
+        self._bin.write(tokens.tobytes())
+        self._chunks.extend((self._windows, *chunk) for chunk in chunks)
+        self._windows += 1
+        if self._windows == self.shard_windows:
+            self.close()
+
+    def close(self):
+        if self._bin is None:
+            return
+        self._bin.close()
+        name = f"packed-{self.shards:05d}"
+        columns = list(zip(*self._chunks)) if self._chunks else [[]] * len(CHUNK_SCHEMA)
+        arrays = [pa.array(column, field.type) for column, field in zip(columns, CHUNK_SCHEMA)]
+        pq.write_table(pa.Table.from_arrays(arrays, schema=CHUNK_SCHEMA), self.directory / f"{name}.parquet")
+        os.replace(self.directory / f"{name}.bin.tmp", self.directory / f"{name}.bin")
+        self.shards += 1
+        self._bin, self._chunks, self._windows = None, [], 0
+
+
+def pack_sequences(
+    context_length: int,
+    source: str | Path | None = None,
+    output: str | Path | None = None,
+    max_open: int = 64,
+    shard_windows: int = DEFAULT_SHARD_WINDOWS,
+) -> dict:
+    """
+    Pack every sequence of the token shards in `source` into windows of
+    `context_length` tokens, keeping at most `max_open` windows open. Returns
+    the packing stats, which are also written to stats.json.
+    """
+    dataset = TokenDataset(source)
+    output = Path(output) if output is not None else default_packed_dir(context_length, dataset.directory)
+    output.mkdir(parents=True, exist_ok=True)
+    for stale in output.glob("packed-*"):
+        stale.unlink()
+
+    vocabulary = json.loads((dataset.directory / "vocab.json").read_text())
+    pad_id = vocabulary.index(PAD_TOKEN)
+    writer = _ShardWriter(output, dataset.dtype, shard_windows)
+
+    # Open windows: tokens, tokens used and the chunks placed in each
+    open_tokens: list[np.ndarray] = []
+    open_used: list[int] = []
+    open_chunks: list[list[tuple]] = []
+    windows = chunks = 0
+
+    def emit(i: int):
+        nonlocal windows
+        tokens, used, placed = open_tokens.pop(i), open_used.pop(i), open_chunks.pop(i)
+        tokens[used:] = pad_id
+        writer.write(tokens, placed)
+        windows += 1
+
+    for row in range(len(dataset)):
+        midi_hk = dataset.midi_hk(row)
+        sequence = dataset[row]
+        for start in range(0, len(sequence), context_length):
+            chunk = sequence[start:start + context_length]
+            chunks += 1
+            # Best fit: the fullest open window with room for the chunk
+            free = context_length - np.array(open_used, np.int64)
+            fits = np.flatnonzero(free >= len(chunk))
+            if len(fits):
+                i = int(fits[free[fits].argmin()])
+            else:
+                if len(open_tokens) == max_open:
+                    emit(int(np.argmax(open_used)))
+                open_tokens.append(np.empty(context_length, dataset.dtype))
+                open_used.append(0)
+                open_chunks.append([])
+                i = len(open_tokens) - 1
+            used = open_used[i]
+            open_tokens[i][used:used + len(chunk)] = chunk
+            open_chunks[i].append((used, len(chunk), midi_hk, start))
+            open_used[i] = used + len(chunk)
+            if open_used[i] == context_length:
+                emit(i)
+
+    while open_tokens:
+        emit(0)
+    writer.close()
+
+    tokens = int(dataset.lengths.sum())
+    stats = {
+        "context_length": context_length,
+        "dtype": dataset.dtype.name if dataset.dtype is not None else None,
+        "sequences": len(dataset),
+        "chunks": chunks,
+        "windows": windows,
+        "shards": writer.shards,
+        "tokens": tokens,
+        "padding_tokens": windows * context_length - tokens,
+        "efficiency": tokens / (windows * context_length) if windows else 0.0,
+        "tokenizer_config": dataset.config,
+    }
+    (output / "stats.json").write_text(json.dumps(stats, indent=2))
+    return stats
+
+
+class PackedWindows:
+    """
+    Memory mapped packed windows of `directory`. Items are (tokens, segments)
+    where `segments` numbers the chunks of the window from 1, with 0 for
+    padding, so attention can be masked to tokens of the same chunk.
+    """
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        stats = json.loads((self.directory / "stats.json").read_text())
+        self.context_length = stats["context_length"]
+        self.dtype = np.dtype(stats["dtype"] or np.uint16)
+        self._shards = sorted(self.directory.glob("packed-*.bin"))
+        self._maps: list[np.memmap | None] = [None] * len(self._shards)
+        self._chunks: list[dict[str, np.ndarray] | None] = [None] * len(self._shards)
+        sizes = [path.stat().st_size // (self.context_length * self.dtype.itemsize) for path in self._shards]
+        self._ends = np.cumsum(sizes, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return int(self._ends[-1]) if len(self._ends) else 0
+
+    def __getitem__(self, window: int) -> tuple[np.ndarray, np.ndarray]:
+        if not 0 <= window < len(self):
+            raise IndexError(f"Window {window} out of range for {len(self)} windows")
+        shard = int(np.searchsorted(self._ends, window, side="right"))
+        local = window - (int(self._ends[shard - 1]) if shard else 0)
+        if self._maps[shard] is None:
+            self._maps[shard] = np.memmap(self._shards[shard], self.dtype, mode="r").reshape(-1, self.context_length)
+            chunks = pq.read_table(self._shards[shard].with_suffix(".parquet"), columns=["window", "position", "length"])
+            self._chunks[shard] = {name: chunks.column(name).to_numpy() for name in chunks.column_names}
+        chunks = self._chunks[shard]
+        first, last = np.searchsorted(chunks["window"], [local, local + 1])
+        segments = np.zeros(self.context_length, np.int32)
+        for segment, row in enumerate(range(first, last), 1):
+            position = chunks["position"][row]
+            segments[position:position + chunks["length"][row]] = segment
+        return self._maps[shard][local], segments
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack the token shards into fixed context windows")
+    parser.add_argument("--context-length", type=int, required=True, help="Tokens per window")
+    parser.add_argument("--source", default=None, help="Token shard directory to pack")
+    parser.add_argument("--output", default=None, help="Directory to write the packed shards to")
+    parser.add_argument("--max-open", type=int, default=64, help="Windows kept open for best-fit packing")
+    args = parser.parse_args()
+
+    stats = pack_sequences(args.context_length, args.source, args.output, args.max_open)
+    print(
+        f"Packed {stats['sequences']} sequences into {stats['windows']} windows of {stats['context_length']} tokens, "
+        f"{stats['efficiency']:.1%} non-padding"
+    )
@@ -0,0 +1,146 @@
+"""
+Process pool helpers for the CPU bound stages of the pipeline
+"""
+
+import multiprocessing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def pipelined_map(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+    max_pending: int | None = None,
+    ordered: bool = True,
+    start_method: str = "spawn",
+) -> Iterator[R]:
+    """
+    Map `fn` over `items` in a pool of worker processes.
+
+    A reader thread pulls from `items` into a bounded queue while the calling
+    thread submits tasks, never holding more than `max_pending` tasks in
+    flight (default 2x workers). A slow consumer therefore stalls the reader
+    instead of letting inputs pile up in memory. Results are yielded in input
+    order unless `ordered` is False, in which case they are yielded as they
+    complete.
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be >= 1, got {workers}")
+    max_pending = max_pending or 2 * workers
+
+    context = multiprocessing.get_context(start_method)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending: deque[Future] = deque()
+        reader = _ReadAhead(items, max_pending)
+        exhausted = False
+
+        try:
+            while pending or not exhausted:
+                # Top up the in-flight window. Only wait on the reader when
+                # nothing is in flight: it may itself be waiting on whatever
+                # the consumer frees after taking the pending results.
+                while not exhausted and len(pending) < max_pending:
+                    item = reader.get(block=not pending)
+                    if item is _EMPTY:
+                        break
+                    if item is _SENTINEL:
+                        exhausted = True
+                    else:
+                        pending.append(pool.submit(fn, item))
+
+                if not pending:
+                    break
+
+                # Poll while the window has room so newly read items are
+                # submitted without waiting for the oldest task
+                can_submit = not exhausted and len(pending) < max_pending
+                waiting = [pending[0]] if ordered else pending
+                wait(waiting, timeout=_POLL_INTERVAL if can_submit else None, return_when=FIRST_COMPLETED)
+
+                if ordered:
+                    while pending and pending[0].done():
+                        yield pending.popleft().result()
+                else:
+                    for future in [f for f in pending if f.done()]:
+                        pending.remove(future)
+                        yield future.result()
+        finally:
+            reader.close()
+
+
+def read_ahead(items: Iterable[T], maxsize: int) -> Iterator[T]:
+    """
+    Iterate `items` on a background thread, buffering at most `maxsize` items
+    """
+    reader = _ReadAhead(items, maxsize)
+    try:
+        while (item := reader.get()) is not _SENTINEL:
+            yield item
+    finally:
+        reader.close()
+
+
+class _ReadAhead:
+    """
+    Background thread filling a bounded queue from an iterable
+    """
+    def __init__(self, items: Iterable, maxsize: int):
+        self._buffer: queue.Queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, args=(items,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        # Give up once the consumer has gone away so the thread can exit
+        while not self._stop.is_set():
+            try:
+                self._buffer.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, items: Iterable):
+        try:
+            for item in items:
+                if not self._put(item):
+                    return
+            self._put(_SENTINEL)
+        except BaseException as e:
+            self._put(_ReaderError(e))
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        """
+        Next item, `_SENTINEL` at the end, or `_EMPTY` if none is ready without
+        blocking or within `timeout` seconds
+        """
+        try:
+            item = self._buffer.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return _EMPTY
+        if isinstance(item, _ReaderError):
+            raise item.error
+        return item
+
+    def close(self):
+        self._stop.set()
+        # The source may be blocked on something only the consumer would have
+        # freed (e.g. a memory budget); the thread is a daemon, so don't hang
+        self._thread.join(timeout=1.0)
+
+
+class _ReaderError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_SENTINEL = object()
+_EMPTY = object()
+_POLL_INTERVAL = 0.1
@@ -0,0 +1,99 @@
+"""
+Final layout of the bronze tables
+
+Once a window is loaded its flat parquet files are rewritten with the Data
+Vault hash keys added (see `hash_keys`), and the blob heavy tables are split
+into the hive partitions the silver satellites are built in, keyed by the
+first hex digit of the hub hash key
+
+    h5_extract/partition_col=a/<load_id>.<i>.parquet
+
+so each silver partition run only reads its sixteenth of bronze.
+"""
+
+import os
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lakh_midi_dataset.hash_keys import hash_key_select
+
+PARTITION_COLUMN = "partition_col"
+
+# table name: hub hash key its partition is taken from
+PARTITIONED_TABLES = {
+    "raw_midi_files": "midi_hk",
+    "h5_extract": "track_hk",
+}
+
+# Keeps row groups of MIDI and H5 blobs near the size they were written with
+ROW_GROUP_SIZE_BYTES = "32MB"
+
+
+def finalize_load(table_dir: Path, table: str, load_ids: list[str]) -> list[Path]:
+    """
+    Rewrite the flat parquet files of `load_ids` with hash keys, partitioning
+    the tables in PARTITIONED_TABLES
+
+    Output files keep the `<load_id>.` prefix so checkpoint rollbacks and the
+    shard manifests still find them. Returns the files written. Every load
+    must have written files for `table` to `table_dir`; if not, the tables
+    are not where they are expected and FileNotFoundError is raised.
+    """
+    table_dir = Path(table_dir)
+    written = []
+    con = duckdb.connect()
+    # Needed for ROW_GROUP_SIZE_BYTES; row order within a file is not relied on
+    con.execute("SET preserve_insertion_order = false")
+    for load_id in load_ids:
+        files = sorted(table_dir.glob(f"{load_id}.*.parquet"))
+        if not files:
+            raise FileNotFoundError(f"Load {load_id} wrote no {table} files to {table_dir}")
+        select = hash_key_select(table, _field_paths(pq.read_schema(files[0])))
+        if table in PARTITIONED_TABLES:
+            con.execute(
+                f"""
+                COPY (
+                    SELECT *, substring({PARTITIONED_TABLES[table]}, 1, 1) AS {PARTITION_COLUMN}
+                    FROM (SELECT {select} FROM read_parquet($files))
+                ) TO '{table_dir}' (
+                    FORMAT parquet,
+                    PARTITION_BY ({PARTITION_COLUMN}),
+                    FILENAME_PATTERN '{load_id}.{{i}}',
+                    OVERWRITE_OR_IGNORE,
+                    ROW_GROUP_SIZE_BYTES '{ROW_GROUP_SIZE_BYTES}'
+                )
+                """,
+                {"files": [str(path) for path in files]},
+            )
+            for path in files:
+                path.unlink()
+            written.extend(sorted(table_dir.glob(f"{PARTITION_COLUMN}=*/{load_id}.*.parquet")))
+        else:
+            for path in files:
+                tmp_path = path.with_suffix(".tmp")
+                con.execute(
+                    f"""
+                    COPY (SELECT {select} FROM read_parquet('{path}'))
+                    TO '{tmp_path}' (FORMAT parquet, ROW_GROUP_SIZE_BYTES '{ROW_GROUP_SIZE_BYTES}')
+                    """
+                )
+                os.replace(tmp_path, path)
+                written.append(path)
+    con.close()
+    return written
+
+
+def _field_paths(schema: pa.Schema) -> set[str]:
+    """Dotted paths of every field, including those nested in structs"""
+    paths = set()
+    def visit(field: pa.Field, prefix: str):
+        paths.add(prefix + field.name)
+        if pa.types.is_struct(field.type):
+            for child in field.type:
+                visit(child, prefix + field.name + ".")
+    for field in schema:
+        visit(field, "")
+    return paths
@@ -0,0 +1,201 @@
+"""
+On-disk cache of rendered audio previews
+
+Renders are stored under a hash of everything that determines the audio:
+the `midi_hk` (itself a hash of the MIDI content), the time window, sample
+rate, sound font content and encoder options:
+
+    data/_render_cache/<key[:2]>/<key>.ogg
+
+so repeated doc builds and listening sessions only synthesise what they
+have not heard before. Hits touch the file's mtime, and once the cache
+grows past `max_bytes` the least recently used renders are evicted.
+
+A miss holds an flock on `<key>.lock` while it renders, so threads and
+processes sharing the directory render each key once, the others waiting
+and then reading the result.
+
+    >>> cache = RenderCache()
+    >>> path = cache.render(midi_hk, lambda: load_midi(midi_hk), start=30, duration=15)
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+from midi2audio import DEFAULT_SOUND_FONT
+
+from lakh_midi_dataset.render_midi import DEFAULT_CODEC_ARGS, DEFAULT_SAMPLE_RATE, render_midi_to_audio
+from lakh_midi_dataset.sharding import bronze_dir
+
+DEFAULT_CACHE_BYTES = 2 << 30
+
+# (path, size, mtime_ns) -> sha256 of the sound font, hashed once per process
+_sound_font_hashes: dict[tuple[str, int, int], str] = {}
+
+
+def default_cache_dir() -> Path:
+    return bronze_dir().parent / "_render_cache"
+
+
+def sound_font_hash(sound_font: str) -> str:
+    path = os.path.realpath(os.path.expanduser(sound_font))
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    if key not in _sound_font_hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+        _sound_font_hashes[key] = digest.hexdigest()
+    return _sound_font_hashes[key]
+
+
+def render_key(
+    midi_hk: str,
+    start: float = 0.0,
+    duration: float | None = None,
+    fs: int = DEFAULT_SAMPLE_RATE,
+    sound_font: str = DEFAULT_SOUND_FONT,
+    codec_args: tuple[str, ...] = DEFAULT_CODEC_ARGS,
+) -> str:
+    settings = {
+        "midi_hk": midi_hk,
+        "start": float(start),
+        "duration": None if duration is None else float(duration),
+        "sample_rate": fs,
+        "sound_font": sound_font_hash(sound_font),
+        "codec_args": list(codec_args),
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+class RenderCache:
+    """
+    Size bounded LRU cache of renders in `directory`, which any number of
+    threads and processes can share
+
+    The size is scanned once, then grown by each render this instance adds,
+    so renders added by other processes only count towards `max_bytes` from
+    the next eviction scan.
+    """
+    def __init__(self, directory: str | Path | None = None, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.directory = Path(directory) if directory is not None else default_cache_dir()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size: int | None = None
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.ogg"
+
+    def get(self, key: str) -> Path | None:
+        """The cached render for `key`, marked as just used, or None"""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def render(
+        self,
+        midi_hk: str,
+        midi_bytes: bytes | memoryview | Callable[[], bytes | memoryview],
+        start: float = 0.0,
+        duration: float | None = None,
+        fs: int = DEFAULT_SAMPLE_RATE,
+        sound_font: str = DEFAULT_SOUND_FONT,
+        codec_args: tuple[str, ...] = DEFAULT_CODEC_ARGS,
+    ) -> Path:
+        """
+        Path of the render of `midi_hk` with these settings, rendering it on
+        a miss. `midi_bytes` may be a function loading them, so hits never
+        read the MIDI file.
+        """
+        key = render_key(midi_hk, start, duration, fs, sound_font, codec_args)
+        path = self.get(key)
+        if path is not None:
+            return path
+        with self._key_lock(key):
+            # Rendered by whoever held the lock before us
+            path = self.get(key)
+            if path is not None:
+                return path
+            if callable(midi_bytes):
+                midi_bytes = midi_bytes()
+            path = self.path(key)
+            # Renders to a temporary file and renames, so readers never see a partial file
+            render_midi_to_audio(midi_bytes, path.parent, key, fs, sound_font, codec_args, start, duration)
+            size = path.stat().st_size
+        self._added(size)
+        return path
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        lock_path = self.path(key).with_suffix(".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_nlink > 0:
+                break
+            # Evicted while we waited, lock the file that replaced it
+            os.close(fd)
+        try:
+            yield
+        finally:
+            os.close(fd)
+
+    def _added(self, size: int):
+        with self._lock:
+            if self._size is None:
+                # The scan already includes the new render
+                self._size = self.size()
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def size(self) -> int:
+        total = 0
+        for path in self.directory.glob("*/*.ogg"):
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def evict(self) -> int:
+        """Remove the least recently used renders until within max_bytes, returning how many"""
+        with self._lock:
+            entries = []
+            for path in self.directory.glob("*/*.ogg"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                path.with_suffix(".lock").unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            self._size = total
+            return removed
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob("*/*.ogg"):
+                path.unlink(missing_ok=True)
+                path.with_suffix(".lock").unlink(missing_ok=True)
+            self._size = 0
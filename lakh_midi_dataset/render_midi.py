@@ -1,30 +1,245 @@
-# Initialize FluidSynth for MIDI to audio conversion
-from midi2audio import FluidSynth
-import subprocess
+"""
+MIDI to audio rendering with FluidSynth
+
+FluidSynth renders raw PCM to its stdout, which is piped straight into
+ffmpeg for encoding, so no WAV file is written. FluidSynth only reads MIDI
+from a path, so the bytes are handed to it as an anonymous in-memory file
+where the platform has `memfd_create` (Linux), and a temporary file
+elsewhere.
+
+Passing `duration` renders just that many seconds from `start`, trimming
+the MIDI events with `midi_trim.trim_midi` before synthesis, for
+previews. `render_cache` keeps such previews between runs.
+
+`render_batch` renders many files at once, one synth/encoder pair per
+worker, writing `<output_dir>/<midi_hk>.ogg`:
+
+    >>> report = render_batch(iter_bronze_midi(limit=1000), "data/audio")
+    >>> report.failures    # midi_hk -> error
+"""
+
 import os
+import subprocess
 import tempfile
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator
 
-def render_midi_to_audio(midi_bytes, output_dir, filename, fs=16000):
-    """Convert MIDI bytes to OGG audio at 16kHz and save to specified directory"""
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
-    
-    synth = FluidSynth(sample_rate=fs)
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Save MIDI bytes to temporary file
-        midi_path = os.path.join(temp_dir, f"midi.mid")
-        with open(midi_path, "wb") as f:
+import duckdb
+import pyarrow as pa
+from midi2audio import DEFAULT_SOUND_FONT
+from tqdm import tqdm
+
+from lakh_midi_dataset.midi_compression import decompress
+from lakh_midi_dataset.midi_trim import trim_midi
+from lakh_midi_dataset.sharding import bronze_dir
+
+DEFAULT_SAMPLE_RATE = 16000
+# ffmpeg output options; the audio goes into an ogg container
+DEFAULT_CODEC_ARGS = ("-c:a", "libvorbis", "-q:a", "4")
+
+
+class RenderError(RuntimeError):
+    pass
+
+
+@contextmanager
+def _midi_file(midi_bytes: bytes | memoryview) -> Iterator[tuple[str, tuple[int, ...]]]:
+    """A path FluidSynth can read the MIDI from, and the fds it must inherit to do so"""
+    if not hasattr(os, "memfd_create"):
+        with tempfile.NamedTemporaryFile(suffix=".mid") as f:
             f.write(midi_bytes)
+            f.flush()
+            yield f.name, ()
+        return
+    fd = os.memfd_create("midi")
+    try:
+        view = memoryview(midi_bytes)
+        while view:
+            view = view[os.write(fd, view):]
+        yield f"/proc/self/fd/{fd}", (fd,)
+    finally:
+        os.close(fd)
+
+
+def render_midi_to_audio(
+    midi_bytes: bytes | memoryview,
+    output_dir: str | Path,
+    filename: str,
+    fs: int = DEFAULT_SAMPLE_RATE,
+    sound_font: str = DEFAULT_SOUND_FONT,
+    codec_args: tuple[str, ...] = DEFAULT_CODEC_ARGS,
+    start: float = 0.0,
+    duration: float | None = None,
+) -> str:
+    """
+    Convert MIDI bytes to OGG audio at `fs` Hz and save to specified
+    directory, just `duration` seconds from `start` if given
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = Path(output_dir) / f"{filename}.ogg"
+    # Unique per render, so concurrent renders of one file never share an encoder output
+    tmp_path = output_path.with_name(f"{output_path.name}.{uuid.uuid4().hex}.tmp")
+    window_args = ()
+    if start > 0 or duration is not None:
+        midi_bytes = trim_midi(midi_bytes, start, duration)
+    if duration is not None:
+        # Cuts the release tail of notes still sounding at the end of the window
+        window_args = ("-t", str(duration))
+
+    # stderr goes to files, so a chatty process can never block on a full pipe
+    with (
+        _midi_file(midi_bytes) as (midi_path, pass_fds),
+        tempfile.TemporaryFile() as synth_log,
+        tempfile.TemporaryFile() as encoder_log,
+    ):
+        synth = subprocess.Popen(
+            [
+                "fluidsynth", "-ni", "-q", "-T", "raw", "-O", "s16", "-r", str(fs), "-F", "-",
+                os.path.expanduser(sound_font), midi_path,
+            ],
+            stdout=subprocess.PIPE, stderr=synth_log, stdin=subprocess.DEVNULL, pass_fds=pass_fds,
+        )
+        try:
+            encoder = subprocess.Popen(
+                [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "s16le", "-ar", str(fs), "-ac", "2", "-i", "pipe:0",
+                    *codec_args, *window_args, "-ar", str(fs), "-f", "ogg", str(tmp_path),
+                ],
+                stdin=synth.stdout, stderr=encoder_log,
+            )
+        except OSError:
+            synth.kill()
+            synth.wait()
+            raise
+        # Only the encoder holds the read end now, so it sees EOF when the synth exits
+        synth.stdout.close()
+        encoder_code, synth_code = encoder.wait(), synth.wait()
+        if synth_code != 0 or encoder_code != 0:
+            tmp_path.unlink(missing_ok=True)
+            synth_log.seek(0)
+            encoder_log.seek(0)
+            log = (synth_log.read() + encoder_log.read()).decode(errors="replace").strip()
+            raise RenderError(f"fluidsynth exited {synth_code}, ffmpeg exited {encoder_code}: {log[-500:]}")
+    os.replace(tmp_path, output_path)
+    return str(output_path)
+
+
+@dataclass
+class RenderReport:
+    rendered: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    failures: dict[str, str] = field(default_factory=dict)
+
+
+def render_batch(
+    items: Iterable[tuple[str, bytes | memoryview]],
+    output_dir: str | Path,
+    fs: int = DEFAULT_SAMPLE_RATE,
+    sound_font: str = DEFAULT_SOUND_FONT,
+    codec_args: tuple[str, ...] = DEFAULT_CODEC_ARGS,
+    workers: int | None = None,
+    overwrite: bool = False,
+    progress: bool = True,
+    start: float = 0.0,
+    duration: float | None = None,
+) -> RenderReport:
+    """
+    Render every (midi_hk, midi_bytes) to `<output_dir>/<midi_hk>.ogg`, in
+    `workers` concurrent renders (default one per core). Files already
+    rendered are skipped unless `overwrite`; files that fail are reported
+    rather than stopping the batch.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    output_dir = Path(output_dir)
+    report = RenderReport()
+
+    def render(item: tuple[str, bytes | memoryview]) -> tuple[str, str | None, bool]:
+        midi_hk, midi_bytes = item
+        if not overwrite and (output_dir / f"{midi_hk}.ogg").exists():
+            return midi_hk, None, False
+        try:
+            render_midi_to_audio(midi_bytes, output_dir, midi_hk, fs, sound_font, codec_args, start, duration)
+        except Exception as e:
+            # One bad file must not stop the batch
+            return midi_hk, f"{type(e).__name__}: {e}", True
+        return midi_hk, None, True
+
+    # The synths and encoders are child processes, so threads are enough to keep every core busy
+    with ThreadPoolExecutor(workers) as pool, tqdm(disable=not progress, unit="file", desc="Rendering") as bar:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(render, item))
+            if len(pending) >= 2 * workers:
+                _collect(pending, report, bar)
+        while pending:
+            _collect(pending, report, bar)
+    return report
+
+
+def _collect(pending: set, report: RenderReport, bar: tqdm):
+    """Wait for at least one render to finish and record its outcome"""
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        pending.remove(future)
+        midi_hk, error, attempted = future.result()
+        if error is not None:
+            report.failures[midi_hk] = error
+        elif attempted:
+            report.rendered.append(midi_hk)
+        else:
+            report.skipped.append(midi_hk)
+        bar.update()
+        bar.set_postfix(failed=len(report.failures), refresh=False)
+
+
+def iter_bronze_midi(
+    midi_hks: Iterable[str] | None = None,
+    limit: int | None = None,
+    source: str | Path | None = None,
+) -> Iterator[tuple[str, bytes]]:
+    """(midi_hk, MIDI bytes) of the bronze `raw_midi_files`, optionally just `midi_hks`"""
+    source = Path(source) if source is not None else bronze_dir() / "raw_midi_files"
+    connection = duckdb.connect()
+    relation = connection.read_parquet(f"{source}/*/*.parquet", union_by_name=True)
+    codec = "content_codec" if "content_codec" in relation.columns else "NULL AS content_codec"
+    if midi_hks is not None:
+        keys = connection.from_arrow(pa.table({"midi_hk": pa.array(list(midi_hks), pa.string())}))
+        relation = relation.join(keys, "midi_hk")
+    relation = relation.select(f"midi_hk, file_content, {codec}")
+    if limit is not None:
+        relation = relation.limit(limit)
+    relation.execute()
+    while rows := relation.fetchmany(256):
+        for midi_hk, content, codec in rows:
+            yield midi_hk, decompress(content, codec)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render bronze MIDI files to OGG audio")
+    parser.add_argument("output_dir", help="Directory to write <midi_hk>.ogg files to")
+    parser.add_argument("--midi-hk", nargs="*", default=None, help="Files to render (default all)")
+    parser.add_argument("--limit", type=int, default=None, help="Render at most this many files")
+    parser.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument("--sound-font", default=DEFAULT_SOUND_FONT)
+    parser.add_argument("--start", type=float, default=0.0, help="Seconds into each file to start from")
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to render (default to the end)")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent renders")
+    parser.add_argument("--overwrite", action="store_true", help="Render files that already have audio")
+    args = parser.parse_args()
 
-        # Convert MIDI to WAV first (FluidSynth default)
-        wav_path = os.path.join(temp_dir, f"audio.wav")
-        synth.midi_to_audio(midi_path, wav_path)
-        
-        # Convert WAV to OGG using ffmpeg
-        ogg_path = os.path.join(output_dir, f"{filename}.ogg")
-        subprocess.run([
-            'ffmpeg', '-i', wav_path, '-c:a', 'libvorbis', '-q:a', '4', 
-            '-ar', str(fs), ogg_path, '-y'
-        ], check=True, capture_output=True)
-
-        return ogg_path
\ No newline at end of file
+    report = render_batch(
+        iter_bronze_midi(args.midi_hk, args.limit), args.output_dir,
+        fs=args.sample_rate, sound_font=args.sound_font, workers=args.workers, overwrite=args.overwrite,
+        start=args.start, duration=args.duration,
+    )
+    print(f"Rendered {len(report.rendered)} files, skipped {len(report.skipped)} already rendered")
+    for midi_hk, error in report.failures.items():
+        print(f"Failed {midi_hk}: {error}")
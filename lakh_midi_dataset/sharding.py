@@ -0,0 +1,111 @@
+"""
+Deterministic shard-of-N assignment for the bronze resources
+
+Every member is assigned to a shard by a stable hash of its business key
+(midi_md5 or track_id), so any number of processes or machines sharing a
+filesystem can each run `--shard i --num-shards N` and together cover every
+member exactly once. Each shard records the parquet files it wrote in a
+manifest and `merge_shard_manifests` checks the set is complete.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import dlt
+import pyarrow.parquet as pq
+
+
+def shard_of(key: str, num_shards: int) -> int:
+    """Stable shard for a business key, independent of python's hash seed"""
+    digest = hashlib.md5(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def in_shard(key: str, shard: int, num_shards: int) -> bool:
+    return num_shards == 1 or shard_of(key, num_shards) == shard
+
+
+def validate_shard(shard: int, num_shards: int):
+    if num_shards < 1 or not 0 <= shard < num_shards:
+        raise ValueError(f"Invalid shard {shard} of {num_shards}")
+
+
+def bronze_dir(dataset_name: str = "bronze_lakh_midi") -> Path:
+    """
+    Local directory the filesystem destination writes the dataset to
+
+    Resolved through dlt's own filesystem destination configuration, as the
+    pipeline resolves it, so the derived stages read the tree dlt wrote. A
+    relative `bucket_url` is relative to dlt's local directory: the working
+    directory, unless `DLT_LOCAL_DIR` is set.
+    """
+    destination = dlt.destinations.filesystem()
+    config = destination.configuration(destination.spec()._bind_dataset_name(dataset_name=dataset_name))
+    if not config.is_local_filesystem:
+        raise ValueError(f"The bronze layer must be on a local filesystem, not {config.bucket_url}")
+    return Path(config.make_local_path(config.bucket_url)) / dataset_name
+
+
+def manifest_dir(dataset_name: str = "bronze_lakh_midi") -> Path:
+    return bronze_dir(dataset_name) / "_manifests"
+
+
+def write_shard_manifest(
+    shard: int,
+    num_shards: int,
+    load_ids: list[str],
+    tables: list[str],
+    dataset_name: str = "bronze_lakh_midi",
+) -> Path:
+    """
+    Record the parquet files (and their row counts) written by one shard's loads
+    """
+    root = bronze_dir(dataset_name)
+    manifest = {
+        "shard": shard,
+        "num_shards": num_shards,
+        "load_ids": load_ids,
+        "tables": {},
+    }
+    for table in tables:
+        files = sorted(
+            path for path in (root / table).rglob("*.parquet")
+            if any(path.name.startswith(f"{load_id}.") for load_id in load_ids)
+        )
+        manifest["tables"][table] = [
+            {"path": str(path.relative_to(root)), "rows": pq.read_metadata(path).num_rows}
+            for path in files
+        ]
+
+    path = manifest_dir(dataset_name) / f"shard-{shard}-of-{num_shards}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(manifest, indent=2))
+    return path
+
+
+def merge_shard_manifests(num_shards: int, dataset_name: str = "bronze_lakh_midi") -> Path:
+    """
+    Combine the per shard manifests into one, failing if any shard is missing.
+
+    The shards already wrote into the shared table directories, so nothing is
+    copied; the merged manifest is the record that the bronze layer is complete.
+    """
+    directory = manifest_dir(dataset_name)
+    shards = []
+    for shard in range(num_shards):
+        path = directory / f"shard-{shard}-of-{num_shards}.json"
+        if not path.exists():
+            raise FileNotFoundError(f"Shard {shard} of {num_shards} has not finished: {path}")
+        shards.append(json.loads(path.read_text()))
+
+    tables: dict[str, dict] = {}
+    for manifest in shards:
+        for table, files in manifest["tables"].items():
+            merged = tables.setdefault(table, {"rows": 0, "files": []})
+            merged["rows"] += sum(f["rows"] for f in files)
+            merged["files"].extend(f["path"] for f in files)
+
+    path = directory / "manifest.json"
+    path.write_text(json.dumps({"num_shards": num_shards, "tables": tables}, indent=2))
+    return path
@@ -0,0 +1,373 @@
+"""
+Multi-node build of the partitioned silver satellites
+
+A queue of (model, partition) jobs kept in a directory every node can see,
+for builds beyond one machine's disk and memory. A coordinator compiles the
+models once (`silver_runner.compile_models`) and submits them; workers on
+any node claim jobs, write their `partition_col=<digit>` outputs with
+`silver_runner.run_partition` and record the result; the coordinator then
+writes a completion manifest and recreates the silver views.
+
+    queue/queue.json                   compiled models, partitions and settings
+    queue/leases/<job>.<attempt>.lease claim of a job, its mtime the heartbeat
+    queue/leases/<job>.<attempt>.failed error of a failed attempt
+    queue/done/<job>.json              rows, time and node of a finished job
+    queue/manifest.json                every job and output file, once complete
+
+Claims only ever create files with O_EXCL, which is atomic on local and NFS
+filesystems, so two workers cannot hold the same attempt. Workers touch
+their lease while they run; a lease not touched for `lease_timeout`
+seconds belongs to a lost worker, and the job is claimed again as the next
+attempt. Failed and lost attempts are retried up to `max_attempts` times.
+Lease ages are measured against the mtime of a file the worker just
+touched, so clock skew between nodes does not matter.
+
+Nodes must run from the same project directory on the shared filesystem,
+as the bronze sources and silver outputs are relative paths:
+
+    python -m lakh_midi_dataset.silver_queue submit /shared/queue
+    python -m lakh_midi_dataset.silver_queue work /shared/queue --workers 8     # on every node
+    python -m lakh_midi_dataset.silver_queue finalize /shared/queue
+"""
+
+import json
+import os
+import random
+import shutil
+import socket
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from functools import partial
+from pathlib import Path
+
+from lakh_midi_dataset.parallel import pipelined_map
+from lakh_midi_dataset.silver_runner import PARTITIONS, SilverModel, create_views, run_partition
+
+DEFAULT_LEASE_TIMEOUT = 600.0
+DEFAULT_HEARTBEAT = 30.0
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_INTERVAL = 5.0
+
+
+def _write_json(path: Path, value):
+    """Write atomically, so readers on other nodes never see a partial file"""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(value, indent=2))
+    os.replace(tmp, path)
+
+
+class SilverQueue:
+    """The job queue in `directory`"""
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.leases = self.directory / "leases"
+        self.done = self.directory / "done"
+        self._config = None
+
+    @property
+    def config(self) -> dict:
+        if self._config is None:
+            self._config = json.loads((self.directory / "queue.json").read_text())
+        return self._config
+
+    @property
+    def models(self) -> dict[str, SilverModel]:
+        return {model["name"]: SilverModel(**model) for model in self.config["models"]}
+
+    def jobs(self) -> list[str]:
+        partitions = self.config["partitions"]
+        return [f"{model['name']}-{partition}" for model in self.config["models"] for partition in partitions]
+
+    def submit(
+        self,
+        models: list[SilverModel],
+        partitions: str | list[str] = PARTITIONS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        lease_timeout: float = DEFAULT_LEASE_TIMEOUT,
+        reset: bool = False,
+    ):
+        """Enqueue every partition of every model; `reset` discards a previous queue"""
+        if (self.directory / "queue.json").exists():
+            if not reset:
+                raise FileExistsError(f"{self.directory} already holds a queue, reset it to resubmit")
+            shutil.rmtree(self.directory)
+        for model in models:
+            if "." in model.name:
+                raise ValueError(f"Model name {model.name} contains a '.'")
+        for directory in (self.leases, self.done, self.directory / "clock"):
+            directory.mkdir(parents=True, exist_ok=True)
+        self._config = {
+            "models": [asdict(model) for model in models],
+            "partitions": list(partitions),
+            "max_attempts": max_attempts,
+            "lease_timeout": lease_timeout,
+            "submitted": time.time(),
+        }
+        _write_json(self.directory / "queue.json", self._config)
+
+    def _now(self, worker: str) -> float:
+        """The shared filesystem's current time"""
+        clock = self.directory / "clock" / worker
+        clock.touch()
+        return clock.stat().st_mtime
+
+    def _attempts(self) -> dict[str, dict[int, str]]:
+        """job -> attempt -> "lease" or "failed" """
+        attempts = {}
+        for name in os.listdir(self.leases):
+            if name.startswith("."):
+                # Partly written
+                continue
+            job, attempt, kind = name.rsplit(".", 2)
+            if kind == "lease":
+                attempts.setdefault(job, {}).setdefault(int(attempt), "lease")
+            elif kind == "failed":
+                attempts.setdefault(job, {})[int(attempt)] = "failed"
+        return attempts
+
+    def status(self, worker: str | None = None) -> dict[str, str]:
+        """job -> pending, running, done or failed"""
+        return self._states(self._attempts(), worker)
+
+    def _states(self, attempts: dict[str, dict[int, str]], worker: str | None) -> dict[str, str]:
+        done = {path.stem for path in self.done.glob("*.json")}
+        now = self._now(worker or _worker_id())
+        states = {}
+        for job in self.jobs():
+            job_attempts = attempts.get(job, {})
+            if job in done:
+                states[job] = "done"
+            elif not job_attempts:
+                states[job] = "pending"
+            else:
+                last = max(job_attempts)
+                running = job_attempts[last] == "lease" and not self._expired(job, last, now)
+                if running:
+                    states[job] = "running"
+                elif last >= self.config["max_attempts"]:
+                    states[job] = "failed"
+                else:
+                    states[job] = "pending"
+        return states
+
+    def _lease(self, job: str, attempt: int) -> Path:
+        return self.leases / f"{job}.{attempt}.lease"
+
+    def _expired(self, job: str, attempt: int, now: float) -> bool:
+        try:
+            return now - self._lease(job, attempt).stat().st_mtime > self.config["lease_timeout"]
+        except FileNotFoundError:
+            return True
+
+    def claim(self, worker: str) -> tuple[str, int] | None | bool:
+        """
+        Claim a pending job, returning (job, attempt). None when every job is
+        done or failed, False when the remaining jobs are held by live workers.
+        """
+        # The attempt numbers must come from the listing the states do, or a
+        # claim made in between would be skipped over
+        attempts = self._attempts()
+        states = self._states(attempts, worker)
+        pending = [job for job, state in states.items() if state == "pending"]
+        # Workers start from different jobs rather than all racing for the first
+        random.shuffle(pending)
+        for job in pending:
+            attempt = max(attempts.get(job, {0: None})) + 1
+            try:
+                fd = os.open(self._lease(job, attempt), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump({"worker": worker, "claimed": time.time()}, f)
+            return job, attempt
+        if any(state == "running" for state in states.values()):
+            return False
+        return None if not pending else False
+
+    def current(self, job: str, attempt: int) -> bool:
+        """Whether `attempt` is still the latest claim of `job`"""
+        return not any(self.leases.glob(f"{job}.{attempt + 1}.*"))
+
+    def complete(self, job: str, attempt: int, worker: str, rows: int, seconds: float):
+        if not self.current(job, attempt):
+            # Presumed lost and claimed again, the newer attempt records the result
+            return
+        _write_json(self.done / f"{job}.json", {
+            "job": job, "attempt": attempt, "worker": worker, "rows": rows, "seconds": seconds,
+        })
+
+    def fail(self, job: str, attempt: int, error: str):
+        _write_json(self.leases / f"{job}.{attempt}.failed", {"error": error})
+
+    def errors(self) -> dict[str, list[str]]:
+        """job -> error of each failed attempt"""
+        errors = {}
+        for path in sorted(self.leases.glob("*.failed")):
+            job = path.name.rsplit(".", 2)[0]
+            errors.setdefault(job, []).append(json.loads(path.read_text())["error"])
+        return errors
+
+    def work(
+        self,
+        memory_limit: str | None = None,
+        threads: int | None = None,
+        heartbeat: float = DEFAULT_HEARTBEAT,
+        poll_interval: float = POLL_INTERVAL,
+    ) -> list[str]:
+        """Run jobs until none are left to claim, returning the jobs this worker finished"""
+        worker = _worker_id()
+        models = self.models
+        finished = []
+        while True:
+            claimed = self.claim(worker)
+            if claimed is None:
+                return finished
+            if claimed is False:
+                # Wait for the other workers, or for their leases to expire
+                time.sleep(poll_interval)
+                continue
+            job, attempt = claimed
+            name, partition = job.rsplit("-", 1)
+            stop = threading.Event()
+            beat = threading.Thread(target=self._heartbeat, args=(job, attempt, heartbeat, stop), daemon=True)
+            beat.start()
+            try:
+                result = run_partition(models[name], partition, memory_limit, threads)
+            except Exception as e:
+                self.fail(job, attempt, f"{type(e).__name__}: {e}")
+                print(f"{worker} {job} attempt {attempt} failed: {e}", flush=True)
+                continue
+            finally:
+                stop.set()
+                beat.join()
+            self.complete(job, attempt, worker, result.rows, result.seconds)
+            print(f"{worker} {job}: {result.rows} rows in {result.seconds:.1f}s", flush=True)
+            finished.append(job)
+
+    def _heartbeat(self, job: str, attempt: int, interval: float, stop: threading.Event):
+        lease = self._lease(job, attempt)
+        while not stop.wait(interval):
+            try:
+                os.utime(lease)
+            except FileNotFoundError:
+                return
+
+    def finalize(self, poll_interval: float = POLL_INTERVAL, views: bool = True) -> dict:
+        """
+        Wait for every job to finish, then write manifest.json and, if none
+        failed, recreate the silver views. Returns the manifest.
+        """
+        states = self.status()
+        while any(state in ("pending", "running") for state in states.values()):
+            time.sleep(poll_interval)
+            states = self.status()
+        models = self.models
+        errors = self.errors()
+        jobs = []
+        for job, state in states.items():
+            name, partition = job.rsplit("-", 1)
+            entry = {"job": job, "model": name, "partition": partition, "state": state}
+            if state == "done":
+                entry.update(json.loads((self.done / f"{job}.json").read_text()))
+                output = Path(models[name].location) / f"{models[name].options['partition_by']}={partition}"
+                entry["files"] = {str(path): path.stat().st_size for path in sorted(output.glob("*.parquet"))}
+            else:
+                entry["errors"] = errors.get(job, [])
+            jobs.append(entry)
+        manifest = {
+            "complete": all(job["state"] == "done" for job in jobs),
+            "submitted": self.config["submitted"],
+            "finished": time.time(),
+            "models": list(models),
+            "partitions": self.config["partitions"],
+            "rows": sum(job.get("rows", 0) for job in jobs),
+            "jobs": jobs,
+        }
+        _write_json(self.directory / "manifest.json", manifest)
+        if views and manifest["complete"]:
+            create_views(list(models.values()))
+        return manifest
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _work(directory: str, memory_limit: str | None, threads: int | None, heartbeat: float, _: int) -> list[str]:
+    return SilverQueue(directory).work(memory_limit, threads, heartbeat)
+
+
+def work(
+    directory: str | Path,
+    workers: int | None = None,
+    memory_limit: str | None = None,
+    threads: int | None = None,
+    heartbeat: float = DEFAULT_HEARTBEAT,
+) -> list[str]:
+    """Run `workers` worker processes on this node until the queue is drained"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    fn = partial(_work, str(directory), memory_limit, threads, heartbeat)
+    return [job for jobs in pipelined_map(fn, range(workers), workers, ordered=False) for job in jobs]
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from collections import Counter
+
+    from lakh_midi_dataset.silver_runner import DEFAULT_SELECT, compile_models
+
+    parser = argparse.ArgumentParser(description="Build the partitioned silver models through a shared job queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Compile the models and enqueue their partitions")
+    submit_parser.add_argument("queue", help="Queue directory on the shared filesystem")
+    submit_parser.add_argument("--select", default=DEFAULT_SELECT, help="dbt selector of the models to build")
+    submit_parser.add_argument("--partitions", nargs="*", default=list(PARTITIONS), help="Partitions to build")
+    submit_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    submit_parser.add_argument("--lease-timeout", type=float, default=DEFAULT_LEASE_TIMEOUT,
+                               help="Seconds without a heartbeat before a job is claimed again")
+    submit_parser.add_argument("--target", default=None)
+    submit_parser.add_argument("--reset", action="store_true", help="Discard an existing queue")
+
+    work_parser = commands.add_parser("work", help="Run jobs on this node until the queue is drained")
+    work_parser.add_argument("queue")
+    work_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default one per core)")
+    work_parser.add_argument("--memory-limit", default=None, help="DuckDB memory limit per worker, e.g. 4GB")
+    work_parser.add_argument("--threads", type=int, default=None, help="DuckDB threads per worker")
+    work_parser.add_argument("--heartbeat", type=float, default=DEFAULT_HEARTBEAT, help="Seconds between heartbeats")
+
+    status_parser = commands.add_parser("status", help="Count the jobs in each state")
+    status_parser.add_argument("queue")
+
+    finalize_parser = commands.add_parser("finalize", help="Wait for the jobs, write the manifest and views")
+    finalize_parser.add_argument("queue")
+    finalize_parser.add_argument("--no-views", action="store_true", help="Only write the manifest")
+    args = parser.parse_args()
+
+    queue = SilverQueue(args.queue)
+    if args.command == "submit":
+        models = compile_models(args.select, target=args.target)
+        queue.submit(models, args.partitions, args.max_attempts, args.lease_timeout, args.reset)
+        print(f"Submitted {len(queue.jobs())} jobs to {args.queue}")
+    elif args.command == "work":
+        jobs = work(args.queue, args.workers, args.memory_limit, args.threads, args.heartbeat)
+        print(f"Finished {len(jobs)} jobs on {socket.gethostname()}")
+    elif args.command == "status":
+        for state, count in sorted(Counter(queue.status().values()).items()):
+            print(f"{state}: {count}")
+        for job, errors in queue.errors().items():
+            print(f"{job}: {errors[-1]}")
+    else:
+        manifest = queue.finalize(views=not args.no_views)
+        failed = [job for job in manifest["jobs"] if job["state"] != "done"]
+        print(f"Built {len(manifest['jobs']) - len(failed)} of {len(manifest['jobs'])} jobs, {manifest['rows']} rows")
+        for job in failed:
+            print(f"Failed {job['job']}: {job['errors'][-1] if job['errors'] else 'no error recorded'}")
+        if failed:
+            sys.exit(1)
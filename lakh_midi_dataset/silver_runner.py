@@ -0,0 +1,231 @@
+"""
+Parallel build of the partitioned silver satellites
+
+Replaces sixteen serial `dbt run --vars '{"partition_filter": ...}'`
+invocations. dbt compiles the `tag:incremental` models once, with a
+placeholder for the partition filter. Each (model, partition) job then runs
+in a worker process on its own in-memory DuckDB connection, writing its
+hive partition with the same `COPY ... (PARTITION_BY partition_col)` as
+dbt-duckdb's external materialization. Finally the dbt views over the
+outputs are recreated in the project database.
+
+Models that reference other models see the project database attached read
+only, so any number of workers can read it at once.
+
+    python -m lakh_midi_dataset.silver_runner --workers 16 --memory-limit 4GB
+"""
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+import duckdb
+import yaml
+
+from lakh_midi_dataset.parallel import pipelined_map
+
+PARTITIONS = "0123456789abcdef"
+PARTITION_PLACEHOLDER = "__partition_filter__"
+DEFAULT_SELECT = "tag:silver,tag:incremental"
+DEFAULT_PROJECT_DIR = Path(os.environ.get("DBT_PROJECT_DIR", "lakh_midi_dbt"))
+
+
+@dataclass(frozen=True)
+class SilverModel:
+    """A compiled external model, its SQL filtering on PARTITION_PLACEHOLDER"""
+    name: str
+    relation: str
+    sql: str
+    location: str
+    options: dict
+    database: str
+    database_path: str
+
+    def partition_sql(self, partition: str) -> str:
+        return self.sql.replace(PARTITION_PLACEHOLDER, partition)
+
+    def copy_options(self) -> str:
+        options = {"format": "parquet", **{key.lower(): value for key, value in self.options.items()}}
+        rendered = []
+        for key, value in options.items():
+            if isinstance(value, bool):
+                value = str(value).lower()
+            rendered.append(f"{key.upper()} {value}")
+        return ", ".join(rendered)
+
+    def read_location(self) -> str:
+        """The glob dbt-duckdb reads the outputs through"""
+        partition_by = self.options.get("partition_by")
+        if not partition_by:
+            return self.location
+        return "/".join([self.location, "*", *["*"] * len(str(partition_by).split(","))]) + ".parquet"
+
+
+@dataclass(frozen=True)
+class PartitionResult:
+    model: str
+    partition: str
+    rows: int
+    seconds: float
+    error: str | None = None
+
+
+def _profile_output(profiles_dir: Path, target: str | None) -> tuple[str, dict]:
+    profiles = yaml.safe_load((profiles_dir / "profiles.yml").read_text())
+    profile = profiles["lakh_midi_dbt"]
+    target = target or profile["target"]
+    return target, profile["outputs"][target]
+
+
+def compile_models(
+    select: str = DEFAULT_SELECT,
+    project_dir: str | Path = DEFAULT_PROJECT_DIR,
+    profiles_dir: str | Path | None = None,
+    target: str | None = None,
+) -> list[SilverModel]:
+    """Compile the selected models once, for every partition"""
+    from dbt.cli.main import dbtRunner
+
+    project_dir = Path(project_dir)
+    if profiles_dir is None:
+        profiles_dir = os.environ.get("DBT_PROFILES_DIR", project_dir)
+    profiles_dir = Path(profiles_dir)
+    target, output = _profile_output(profiles_dir, target)
+    result = dbtRunner().invoke([
+        "compile", "--quiet",
+        "--select", select,
+        "--vars", json.dumps({"partition_filter": PARTITION_PLACEHOLDER}),
+        "--project-dir", str(project_dir),
+        "--profiles-dir", str(profiles_dir),
+        "--target", target,
+    ])
+    if not result.success:
+        raise RuntimeError(f"dbt compile failed: {result.exception}")
+
+    database_path = output["path"]
+    models = []
+    for node_result in result.result.results:
+        node = node_result.node
+        if node.resource_type != "model" or node.config.materialized != "external":
+            continue
+        options = dict(node.config.get("options") or {})
+        if "partition_by" not in options:
+            raise ValueError(f"{node.name} is not partitioned, build it with dbt run")
+        models.append(SilverModel(
+            name=node.name,
+            relation=node.relation_name,
+            sql=node.compiled_code,
+            location=node.config.get("location") or f"{output['external_root']}/{node.alias}",
+            options=options,
+            database=node.database,
+            database_path=database_path,
+        ))
+    return models
+
+
+def run_partition(
+    model: SilverModel,
+    partition: str,
+    memory_limit: str | None = None,
+    threads: int | None = None,
+) -> PartitionResult:
+    """Write one partition of a model, returning its row count and time"""
+    start = time.perf_counter()
+    connection = duckdb.connect(config={"memory_limit": memory_limit} if memory_limit else {})
+    try:
+        if threads:
+            connection.execute(f"SET threads = {int(threads)}")
+        sql = model.partition_sql(partition)
+        if f'"{model.database}".' in sql and os.path.exists(model.database_path):
+            connection.execute(f"ATTACH '{model.database_path}' AS \"{model.database}\" (READ_ONLY)")
+        Path(model.location).mkdir(parents=True, exist_ok=True)
+        rows = connection.execute(f"COPY ({sql}) TO '{model.location}' ({model.copy_options()})").fetchone()[0]
+    finally:
+        connection.close()
+    return PartitionResult(model.name, partition, rows, time.perf_counter() - start)
+
+
+def _run_job(memory_limit: str | None, threads: int | None, job: tuple[SilverModel, str]) -> PartitionResult:
+    model, partition = job
+    start = time.perf_counter()
+    try:
+        return run_partition(model, partition, memory_limit, threads)
+    except Exception as e:
+        return PartitionResult(model.name, partition, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+def create_views(models: list[SilverModel]):
+    """(Re)create the dbt views over the written outputs in the project database"""
+    by_database = {}
+    for model in models:
+        by_database.setdefault(model.database_path, []).append(model)
+    for database_path, database_models in by_database.items():
+        with duckdb.connect(database_path) as connection:
+            for model in database_models:
+                schema = model.relation.rsplit(".", 1)[0]
+                connection.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+                connection.execute(
+                    f"CREATE OR REPLACE VIEW {model.relation} AS "
+                    f"SELECT * FROM read_parquet('{model.read_location()}', union_by_name=False)"
+                )
+
+
+def run_silver_partitions(
+    models: list[SilverModel],
+    partitions: str | list[str] = PARTITIONS,
+    workers: int | None = None,
+    memory_limit: str | None = None,
+    threads: int | None = None,
+) -> list[PartitionResult]:
+    """
+    Build every partition of every model in `workers` processes, each
+    DuckDB capped at `memory_limit` and `threads`. Views are recreated once
+    every job has succeeded.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if threads is None:
+        # Share the cores between the workers
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    jobs = [(model, partition) for partition in partitions for model in models]
+    results = []
+    for result in pipelined_map(partial(_run_job, memory_limit, threads), jobs, workers, ordered=False):
+        status = f"failed: {result.error}" if result.error else f"{result.rows} rows"
+        print(f"{result.model} partition {result.partition}: {status} in {result.seconds:.1f}s", flush=True)
+        results.append(result)
+    if not any(result.error for result in results):
+        create_views(models)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Build the partitioned silver models in parallel")
+    parser.add_argument("--select", default=DEFAULT_SELECT, help="dbt selector of the models to build")
+    parser.add_argument("--partitions", nargs="*", default=list(PARTITIONS), help="Partitions to build (default all)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default one per core)")
+    parser.add_argument("--memory-limit", default=None, help="DuckDB memory limit per worker, e.g. 4GB")
+    parser.add_argument("--threads", type=int, default=None, help="DuckDB threads per worker")
+    parser.add_argument("--project-dir", default=str(DEFAULT_PROJECT_DIR))
+    parser.add_argument("--profiles-dir", default=None)
+    parser.add_argument("--target", default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    models = compile_models(args.select, args.project_dir, args.profiles_dir, args.target)
+    print(f"Compiled {len(models)} models in {time.perf_counter() - start:.1f}s")
+    results = run_silver_partitions(models, args.partitions, args.workers, args.memory_limit, args.threads)
+
+    print("Partition timings (summed over models):")
+    for partition in args.partitions:
+        seconds = sum(result.seconds for result in results if result.partition == partition)
+        print(f"  {partition}: {seconds:.1f}s")
+    failed = [result for result in results if result.error]
+    print(f"Built {len(results) - len(failed)} of {len(results)} partitions in {time.perf_counter() - start:.1f}s")
+    if failed:
+        sys.exit(1)
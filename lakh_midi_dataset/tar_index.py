@@ -0,0 +1,159 @@
+"""
+Random access into the Lakh tar.gz archives without inflating them end to end
+
+A one-time pass over the archive records gzip restart points (zran style
+checkpoints, via indexed_gzip) and the tar member inventory. Both are
+persisted next to the archive:
+
+    lmd_full.tar.gz.gzidx          gzip checkpoints
+    lmd_full.tar.gz.index.parquet  member name / key / offset / size
+
+Reads then seek to the nearest checkpoint and inflate only the member asked
+for, and listing members never touches the archive at all.
+"""
+
+import tarfile
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import indexed_gzip
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Uncompressed bytes between checkpoints; a read inflates at most this much
+# before reaching the member. Each checkpoint stores a 32KiB window.
+DEFAULT_SPACING = 4 * 1024 * 1024
+
+
+class TarMember(NamedTuple):
+    name: str
+    key: str
+    offset: int
+    size: int
+
+
+def index_paths(tar_path: str | Path) -> tuple[Path, Path]:
+    """Sidecar paths for the gzip checkpoints and the member inventory"""
+    tar_path = Path(tar_path)
+    return (
+        tar_path.with_name(tar_path.name + ".gzidx"),
+        tar_path.with_name(tar_path.name + ".index.parquet"),
+    )
+
+
+def build_tar_index(tar_path: str | Path, spacing: int = DEFAULT_SPACING) -> "TarIndex":
+    """
+    Stream the archive once, recording checkpoints and the member inventory
+    """
+    gzidx_path, members_path = index_paths(tar_path)
+
+    names, offsets, sizes = [], [], []
+    with indexed_gzip.IndexedGzipFile(str(tar_path), spacing=spacing) as gz:
+        # Sequential reads through the indexed file lay down checkpoints as
+        # they go, so the tar walk builds the gzip index for free
+        with tarfile.open(fileobj=gz, mode="r|") as tar:
+            for member in tar:
+                if member.isfile():
+                    names.append(member.name)
+                    offsets.append(member.offset_data)
+                    sizes.append(member.size)
+        gz.build_full_index()
+        gz.export_index(str(gzidx_path))
+
+    members = pa.table({
+        "name": pa.array(names, pa.string()),
+        # Filename stem, i.e. the md5 for lmd_full and the track id for h5
+        "key": pa.array([Path(name).stem for name in names], pa.string()),
+        "offset": pa.array(offsets, pa.int64()),
+        "size": pa.array(sizes, pa.int64()),
+    })
+    pq.write_table(members, members_path)
+
+    return TarIndex(tar_path)
+
+
+class TarIndex:
+    """
+    Seekable view over an indexed tar.gz archive
+
+    >>> with TarIndex.open("lmd_full.tar.gz") as index:
+    ...     midi_bytes = index.get_midi("f8b9a90823dd6af25ac67eaf8fef6a43")
+    """
+    def __init__(self, tar_path: str | Path):
+        self.tar_path = Path(tar_path)
+        gzidx_path, members_path = index_paths(tar_path)
+        if not gzidx_path.exists() or not members_path.exists():
+            raise FileNotFoundError(
+                f"No index for {self.tar_path}, run build_tar_index first"
+            )
+        self.members = pq.read_table(members_path)
+        self._by_key = {
+            key: i for i, key in enumerate(self.members.column("key").to_pylist())
+        }
+        self._gz = indexed_gzip.IndexedGzipFile(
+            str(self.tar_path), index_file=str(gzidx_path), auto_build=False
+        )
+
+    @classmethod
+    def open(cls, tar_path: str | Path, spacing: int = DEFAULT_SPACING) -> "TarIndex":
+        """Open the index for `tar_path`, building it first if there is none"""
+        if not all(p.exists() for p in index_paths(tar_path)):
+            return build_tar_index(tar_path, spacing=spacing)
+        return cls(tar_path)
+
+    def __len__(self) -> int:
+        return self.members.num_rows
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._by_key
+
+    def __enter__(self) -> "TarIndex":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._gz.close()
+
+    def member(self, key: str) -> TarMember:
+        """Look up a member by its filename stem"""
+        row = self.members.slice(self._by_key[key], 1).to_pylist()[0]
+        return TarMember(**row)
+
+    def iter_members(self, prefix: str = "") -> Iterator[TarMember]:
+        """List members whose path starts with `prefix`, from the sidecar only"""
+        members = self.members
+        if prefix:
+            members = members.filter(pc.starts_with(members.column("name"), prefix))
+        for row in members.to_pylist():
+            yield TarMember(**row)
+
+    def read(self, member: TarMember) -> bytes:
+        """Inflate a single member's payload"""
+        self._gz.seek(member.offset)
+        return self._gz.read(member.size)
+
+    def get(self, key: str) -> bytes:
+        """Fetch a member's payload by filename stem"""
+        return self.read(self.member(key))
+
+    def get_midi(self, md5: str) -> bytes:
+        """Fetch a MIDI file from lmd_full by its md5"""
+        return self.get(md5)
+
+    def iter_contents(self, prefix: str = "") -> Iterator[tuple[TarMember, bytes]]:
+        """Read members under `prefix` in archive order"""
+        for member in sorted(self.iter_members(prefix), key=lambda m: m.offset):
+            yield member, self.read(member)
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:] or ["lmd_full.tar.gz"]:
+        print(f"Indexing {path}...")
+        index = build_tar_index(path)
+        print(f"Indexed {len(index)} members")
+        index.close()
@@ -0,0 +1,168 @@
+"""
+Memory mapped random access over the token shards
+
+Reads the `.bin` shards and parquet indexes written by `tokenization`
+without loading any tokens: each shard is mapped on first use and every
+sequence is a zero-copy view into it.
+
+    >>> dataset = TokenDataset()
+    >>> tokens = dataset[0]                       # one whole sequence
+    >>> windows, rows = dataset.sample_windows(32, 1024, seed=0)
+    >>> dataset.midi_hk(rows)                     # joins back to the silver tables
+
+Sequences are ordered by shard and position, so row numbers are stable for
+an unchanged token directory. `shard` splits the rows between ranks and
+dataloader workers by a stable hash of `midi_hk`, so each sequence belongs
+to the same split however many times the job restarts. The dataset only
+needs `__len__` and `__getitem__`, so it can be passed straight to a map
+style dataloader.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from lakh_midi_dataset.sharding import shard_of
+from lakh_midi_dataset.tokenization import CONFIG_KEY, DTYPE_KEY, default_token_dir
+
+
+class TokenDataset:
+    """
+    Token sequences of every successfully tokenized file in `directory`,
+    skipping those shorter than `min_length`
+    """
+    def __init__(self, directory: str | Path | None = None, min_length: int = 1):
+        self.directory = Path(directory) if directory is not None else default_token_dir()
+        self._shards: list[Path] = []
+        self._maps: list[np.memmap | None] = []
+        self.dtype: np.dtype | None = None
+        self.config: dict | None = None
+
+        keys, shards, offsets, lengths = [], [], [], []
+        for index_path in sorted(self.directory.glob("*/*.parquet")):
+            index = pq.read_table(index_path)
+            metadata = index.schema.metadata or {}
+            self._check_metadata(index_path, metadata)
+            index = index.filter(pc.and_(pc.is_null(index["error"]), pc.greater_equal(index["length"], min_length)))
+            keys.append(index.column("midi_hk"))
+            shards.append(np.full(index.num_rows, len(self._shards), np.int32))
+            offsets.append(index.column("offset").to_numpy())
+            lengths.append(index.column("length").to_numpy())
+            self._shards.append(index_path.with_suffix(".bin"))
+            self._maps.append(None)
+
+        self._keys = pa.chunked_array(keys, pa.string()).combine_chunks()
+        self._shard = np.concatenate(shards) if shards else np.empty(0, np.int32)
+        self._offset = np.concatenate(offsets) if offsets else np.empty(0, np.int64)
+        self.lengths = np.concatenate(lengths) if lengths else np.empty(0, np.int64)
+        self._rows: dict[str, int] | None = None
+
+    def _check_metadata(self, path: Path, metadata: dict):
+        dtype = np.dtype(metadata[DTYPE_KEY].decode())
+        config = json.loads(metadata[CONFIG_KEY])
+        if self.dtype is None:
+            self.dtype, self.config = dtype, config
+        elif dtype != self.dtype or config != self.config:
+            raise ValueError(f"{path} was written with another tokenizer config, rebuild the token shards")
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        """Tokens of the `row`th sequence, as a read-only view into its mapped shard"""
+        if not -len(self) <= row < len(self):
+            raise IndexError(f"Row {row} out of range for {len(self)} sequences")
+        return self.window(row, 0, int(self.lengths[row]))
+
+    def __enter__(self) -> "TokenDataset":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _map(self, shard: int) -> np.memmap:
+        if self._maps[shard] is None:
+            self._maps[shard] = np.memmap(self._shards[shard], self.dtype, mode="r")
+        return self._maps[shard]
+
+    def window(self, row: int, start: int, length: int) -> np.ndarray:
+        """`length` tokens of the `row`th sequence from `start`, clipped to its end"""
+        start = max(0, min(start, int(self.lengths[row])))
+        stop = min(start + length, int(self.lengths[row]))
+        offset = int(self._offset[row])
+        return self._map(int(self._shard[row]))[offset + start:offset + stop]
+
+    def midi_hk(self, rows: int | np.ndarray) -> str | list[str]:
+        """The `midi_hk` of a row, or a list for an array of rows"""
+        if np.ndim(rows) == 0:
+            return self._keys[int(rows)].as_py()
+        return self._keys.take(pa.array(np.asarray(rows, np.int64))).to_pylist()
+
+    def row(self, midi_hk: str) -> int:
+        """Row of the sequence tokenized from `midi_hk`"""
+        if self._rows is None:
+            self._rows = {key: i for i, key in enumerate(self._keys.to_pylist())}
+        return self._rows[midi_hk]
+
+    def index_table(self) -> pa.Table:
+        """(row, midi_hk, length) of every sequence, to join with the silver tables"""
+        return pa.table({
+            "row": pa.array(np.arange(len(self), dtype=np.int64)),
+            "midi_hk": self._keys,
+            "length": pa.array(self.lengths),
+        })
+
+    def shard(self, rank: int, world_size: int, worker: int = 0, num_workers: int = 1) -> "TokenDataset":
+        """
+        The rows of dataloader `worker` of `num_workers` on `rank` of
+        `world_size`, one of world_size * num_workers disjoint splits
+        """
+        splits = world_size * num_workers
+        split = rank * num_workers + worker
+        if not 0 <= rank < world_size or not 0 <= worker < num_workers:
+            raise ValueError(f"Invalid worker {worker} of {num_workers} on rank {rank} of {world_size}")
+        keep = np.fromiter(
+            (shard_of(key, splits) == split for key in self._keys.to_pylist()), bool, len(self)
+        ) if splits > 1 else np.ones(len(self), bool)
+        return self._subset(np.flatnonzero(keep))
+
+    def _subset(self, rows: np.ndarray) -> "TokenDataset":
+        subset = object.__new__(TokenDataset)
+        subset.directory, subset.dtype, subset.config = self.directory, self.dtype, self.config
+        # Shares the maps so a subset does not map the shards again
+        subset._shards, subset._maps = self._shards, self._maps
+        subset._keys = self._keys.take(pa.array(rows))
+        subset._shard, subset._offset, subset.lengths = self._shard[rows], self._offset[rows], self.lengths[rows]
+        subset._rows = None
+        return subset
+
+    def sample_windows(
+        self, count: int, length: int, seed: int | np.random.Generator | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        `count` windows of `length` tokens drawn uniformly from every window
+        of the sequences at least that long, as a (count, length) array and
+        the row each came from
+        """
+        rng = np.random.default_rng(seed)
+        starts = np.maximum(self.lengths - length + 1, 0)
+        if starts.sum() == 0:
+            raise ValueError(f"No sequence has {length} tokens")
+        # A window is picked by its global position among all windows
+        positions = rng.integers(0, starts.sum(), count)
+        ends = np.cumsum(starts)
+        rows = np.searchsorted(ends, positions, side="right")
+        offsets = positions - (ends[rows] - starts[rows])
+        windows = np.empty((count, length), self.dtype)
+        for i, (row, offset) in enumerate(zip(rows, offsets)):
+            windows[i] = self.window(int(row), int(offset), length)
+        return windows, rows
+
+    def close(self):
+        """Drop the shard maps; views handed out keep theirs alive"""
+        for i in range(len(self._maps)):
+            self._maps[i] = None
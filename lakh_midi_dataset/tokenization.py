@@ -0,0 +1,265 @@
+"""
+Corpus tokenization with the ARIA absolute tokenizer
+
+Tokenizes the blobs of bronze `raw_midi_files` in worker processes and
+writes the full token id sequences, hash partitioned like the source, as
+
+    data/midi_tokens/aria_abs/partition_col=<digit>/<file>.bin      token ids, back to back
+    data/midi_tokens/aria_abs/partition_col=<digit>/<file>.parquet  midi_hk / offset / length / error
+
+The ids are uint16 (uint32 for vocabularies of 2^16 or more, recorded in
+the index metadata), and offset/length count tokens into the `.bin` file.
+Files the tokenizer rejects get an index row with `error` set instead of
+tokens; `token_failures` collects them.
+
+The tokenizer's own ids are assigned afresh in every process, so they
+cannot be shared between workers or runs. Ids here index `vocabulary()`, the
+tokenizer's tokens sorted by repr, which is saved as `vocab.json` beside the
+shards. The instrument prefix tokens, which the tokenizer emits in no fixed
+order, are sorted the same way, so a file always gets the same ids.
+
+Every index records a hash of the tokenizer configuration, so a run only
+retokenizes files that are new or were tokenized with another config.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from importlib.metadata import version as package_version
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from symbolic_music.aria import AbsTokenizer, MidiDict, normalize_midi_dict
+
+from lakh_midi_dataset import derived_tables, midi_compression
+from lakh_midi_dataset.checkpoint import code_version
+from lakh_midi_dataset.derived_tables import build_derived_table
+from lakh_midi_dataset.midi_compression import decompress
+from lakh_midi_dataset.midi_notes import SOURCE_COLUMNS
+from lakh_midi_dataset.sharding import bronze_dir
+
+TOKENIZER_NAME = "aria_abs"
+
+INDEX_SCHEMA = pa.schema([
+    ("midi_hk", pa.string()),
+    ("offset", pa.int64()),
+    ("length", pa.int64()),
+    ("error", pa.string()),
+])
+
+DTYPE_KEY = b"lakh_midi_dataset.token_dtype"
+CONFIG_KEY = b"lakh_midi_dataset.tokenizer_config"
+
+_tokenizer: AbsTokenizer | None = None
+_vocabulary: list | None = None
+_token_ids: dict | None = None
+
+
+def get_tokenizer() -> AbsTokenizer:
+    """The process's tokenizer, built once per worker"""
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = AbsTokenizer()
+    return _tokenizer
+
+
+def vocabulary() -> list:
+    """Every distinct token, in id order"""
+    global _vocabulary, _token_ids
+    if _vocabulary is None:
+        tokenizer = get_tokenizer()
+        _vocabulary = sorted(set(tokenizer.decode(list(range(tokenizer.vocab_size())))), key=repr)
+        _token_ids = {token: i for i, token in enumerate(_vocabulary)}
+    return _vocabulary
+
+
+def encode(tokens: list) -> np.ndarray:
+    """Ids of a token sequence, with its instrument prefix in canonical order"""
+    vocabulary()
+    prefix = 0
+    while prefix < len(tokens) and isinstance(tokens[prefix], tuple) and str(tokens[prefix][0]).startswith("prefix:"):
+        prefix += 1
+    tokens = sorted(tokens[:prefix], key=repr) + tokens[prefix:]
+    unknown = _token_ids[get_tokenizer().unk_tok]
+    return np.fromiter((_token_ids.get(token, unknown) for token in tokens), token_dtype(), len(tokens))
+
+
+def decode(ids: np.ndarray) -> list:
+    """Tokens of a sequence of ids from the shards"""
+    vocab = vocabulary()
+    return [vocab[i] for i in ids]
+
+
+def tokenizer_config() -> dict:
+    """Everything that changes the ids written for a file"""
+    tokenizer = get_tokenizer()
+    return {
+        "name": TOKENIZER_NAME,
+        "symbolic_music": package_version("symbolic-music"),
+        "config": tokenizer.config,
+        "time_step_ms": tokenizer.time_step_ms,
+        "max_dur_ms": tokenizer.max_dur_ms,
+        "vocabulary": hashlib.sha256(repr(vocabulary()).encode()).hexdigest(),
+        "vocab_size": len(vocabulary()),
+        "remove_preceding_silence": False,
+    }
+
+
+def config_hash(config: dict | None = None) -> str:
+    config = tokenizer_config() if config is None else config
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def token_dtype(vocab_size: int | None = None) -> np.dtype:
+    vocab_size = len(vocabulary()) if vocab_size is None else vocab_size
+    return np.dtype(np.uint16 if vocab_size <= 1 << 16 else np.uint32)
+
+
+def load_midi_dict(data: bytes | memoryview) -> MidiDict:
+    """
+    Load a MidiDict from bytes. Its loader only takes paths, so the bytes are
+    handed over as an anonymous in-memory file rather than a temporary file.
+    """
+    fd = os.memfd_create("midi")
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+        return MidiDict.from_midi(f"/proc/self/fd/{fd}")
+    finally:
+        os.close(fd)
+
+
+def tokenize_midi(data: bytes | memoryview) -> np.ndarray:
+    tokenizer = get_tokenizer()
+    midi_dict = normalize_midi_dict(
+        midi_dict=load_midi_dict(data),
+        ignore_instruments=tokenizer.config["ignore_instruments"],
+        instrument_programs=tokenizer.config["instrument_programs"],
+        time_step_ms=tokenizer.time_step_ms,
+        max_duration_ms=tokenizer.max_dur_ms,
+        drum_velocity=tokenizer.config["drum_velocity"],
+        quantize_velocity_fn=tokenizer._quantize_velocity,
+    )
+    return encode(tokenizer.tokenize(midi_dict, remove_preceding_silence=False))
+
+
+def tokenize_batch(batch: pa.RecordBatch) -> pa.Table:
+    """(midi_hk, tokens, error) of every MIDI file in a batch of midi_notes.SOURCE_COLUMNS"""
+    names = batch.schema.names
+    codecs = batch.column("content_codec").to_pylist() if "content_codec" in names else [None] * len(batch)
+    tokens, errors = [], []
+    for content, codec in zip(batch.column("file_content"), codecs):
+        try:
+            if not content.is_valid:
+                raise ValueError("No content")
+            tokens.append(tokenize_midi(decompress(content.as_buffer(), codec)))
+            errors.append(None)
+        except Exception as e:
+            # The tokenizer raises plain RuntimeErrors for unusable files
+            tokens.append(np.empty(0, token_dtype()))
+            errors.append(f"{type(e).__name__}: {e}")
+
+    lengths = np.array([len(ids) for ids in tokens], np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    return pa.table({
+        "midi_hk": batch.column("midi_hk"),
+        "tokens": pa.LargeListArray.from_arrays(
+            pa.array(offsets), pa.array(np.concatenate(tokens) if tokens else np.empty(0, token_dtype()))
+        ),
+        "error": pa.array(errors, pa.string()),
+    })
+
+
+class TokenShardWriter:
+    """
+    Splits `tokenize_batch` tables into a `.bin` shard of token ids and its
+    index, written to `tmp_path` for `build_derived_table` to move into place
+    """
+    def __init__(self, tmp_path: Path, schema: pa.Schema):
+        self.bin_path = tmp_path.with_name(tmp_path.name.removesuffix(".parquet.tmp") + ".bin")
+        self._bin_tmp_path = self.bin_path.with_suffix(".bin.tmp")
+        self._bin = open(self._bin_tmp_path, "wb")
+        self._index = pq.ParquetWriter(tmp_path, schema)
+        self._offset = 0
+
+    def write_table(self, table: pa.Table):
+        tokens = table.column("tokens").combine_chunks()
+        lengths = pc.list_value_length(tokens).to_numpy().astype(np.int64)
+        errors = table.column("error")
+        self._bin.write(tokens.flatten().to_numpy().tobytes())
+        offsets = self._offset + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        failed = errors.is_valid().to_numpy(zero_copy_only=False)
+        self._index.write_table(pa.table({
+            "midi_hk": table.column("midi_hk"),
+            "offset": pa.array(offsets, pa.int64(), mask=failed),
+            "length": pa.array(lengths, pa.int64(), mask=failed),
+            "error": errors,
+        }, schema=self._index.schema))
+        self._offset += int(lengths.sum())
+
+    def close(self):
+        self._bin.close()
+        os.replace(self._bin_tmp_path, self.bin_path)
+        self._index.close()
+
+
+def default_token_dir() -> Path:
+    return bronze_dir().parent / "midi_tokens" / TOKENIZER_NAME
+
+
+def build_midi_tokens(
+    source: str | Path | None = None,
+    output: str | Path | None = None,
+    workers: int | None = None,
+) -> tuple[int, int]:
+    """
+    Tokenize any `raw_midi_files` file not yet tokenized with the current
+    tokenizer config. Returns the files written and stale files removed.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    output = Path(output) if output is not None else default_token_dir()
+    config = tokenizer_config()
+    output.mkdir(parents=True, exist_ok=True)
+    (output / "vocab.json").write_text(json.dumps(vocabulary()))
+    schema = INDEX_SCHEMA.with_metadata({
+        DTYPE_KEY: token_dtype(config["vocab_size"]).name.encode(),
+        CONFIG_KEY: json.dumps(config, sort_keys=True).encode(),
+    })
+    return build_derived_table(
+        tokenize_batch, schema,
+        source=Path(source) if source is not None else bronze_dir() / "raw_midi_files",
+        output=output,
+        version=config_hash(config) + code_version(sys.modules[__name__], midi_compression, derived_tables)[:16],
+        columns=SOURCE_COLUMNS,
+        workers=workers,
+        writer=TokenShardWriter,
+    )
+
+
+def token_failures(directory: str | Path | None = None) -> pa.Table:
+    """(midi_hk, error) of every file the tokenizer rejected"""
+    directory = Path(directory) if directory is not None else default_token_dir()
+    return duckdb.sql(
+        f"SELECT midi_hk, error FROM read_parquet('{directory}/*/*.parquet') WHERE error IS NOT NULL"
+    ).fetch_arrow_table()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tokenize the bronze MIDI files into token shards")
+    parser.add_argument("--source", default=None, help="raw_midi_files directory to tokenize")
+    parser.add_argument("--output", default=None, help="Directory to write the token shards to")
+    parser.add_argument("--workers", type=int, default=None, help="Tokenizer processes")
+    args = parser.parse_args()
+
+    written, removed = build_midi_tokens(args.source, args.output, args.workers)
+    print(f"Tokenized {written} raw_midi_files files, removed {removed} stale")
+    print(f"{token_failures(args.output).num_rows} MIDI files could not be tokenized")
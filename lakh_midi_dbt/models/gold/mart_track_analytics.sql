@@ -19,7 +19,7 @@ WITH track_base AS (
         st.tempo,
         st.time_signature,
         st.time_signature_confidence,
-        array_length(st.bars_start) as bars_count,
+        st.bars_count,
         
         -- Track metadata
         st.title,
@@ -140,6 +140,7 @@ SELECT
     best_midi_match_score,
     best_midi_match_md5,
     smf.file_content as best_midi_file_content,
+    smf.content_codec as best_midi_content_codec,
     smf.file_size as best_midi_file_size,
     
     -- Technical metadata
@@ -1,5 +1,6 @@
 WITH main_artist_sources AS (
     SELECT DISTINCT
+        artist_hk,
         metadata.songs.artist_id::varchar as artist_id,
         'lmd_h5' as record_source
     FROM {{ source('bronze_data', 'h5_extract') }}
@@ -8,10 +9,13 @@ WITH main_artist_sources AS (
 
 similar_artists AS (
     select DISTINCT 
+        artist_hk,
         artist_id,
         'lmd_h5_similarity' as record_source
     FROM (
-        select UNNEST(metadata.similar_artists)::varchar as artist_id 
+        select
+            UNNEST(similar_artist_hks) as artist_hk,
+            UNNEST(metadata.similar_artists)::varchar as artist_id
         from {{ source('bronze_data', 'h5_extract') }}
         WHERE metadata.similar_artists IS NOT NULL
     ) h5
@@ -26,7 +30,7 @@ artist_sources as (
 )
 
 SELECT
-    {{ dbt_utils.generate_surrogate_key(['artist_id']) }} as artist_hk,
+    artist_hk,
     artist_id,
     current_timestamp as load_date,
     record_source
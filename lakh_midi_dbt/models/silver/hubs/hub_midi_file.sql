@@ -1,5 +1,6 @@
 WITH lmd_full_files AS (
     SELECT DISTINCT
+        midi_hk,
         midi_md5,
         'lmd_full' as record_source
     FROM {{ source('bronze_data', 'raw_midi_files') }}
@@ -8,6 +9,7 @@ WITH lmd_full_files AS (
 
 match_score_files AS (
     SELECT DISTINCT
+        midi_hk,
         midi_md5,
         'match_scores' as record_source
     FROM {{ source('bronze_data', 'raw_match_scores') }}
@@ -17,6 +19,7 @@ match_score_files AS (
 
 md5_path_files AS (
     SELECT DISTINCT
+        midi_hk,
         midi_md5,
         'md5_paths' as record_source
     FROM {{ source('bronze_data', 'raw_md5_paths') }}
@@ -34,7 +37,7 @@ midi_sources AS (
 )
 
 SELECT
-    {{ dbt_utils.generate_surrogate_key(['midi_md5']) }} as midi_hk,
+    midi_hk,
     midi_md5,
     current_timestamp as load_date,
     record_source
@@ -1,5 +1,6 @@
 WITH midi_source_sources AS (
     SELECT DISTINCT
+        source_hk,
         source_path,
         'md5_to_paths' as record_source
     FROM {{ source('bronze_data', 'raw_md5_paths') }}
@@ -7,7 +8,7 @@ WITH midi_source_sources AS (
 )
 
 SELECT
-    {{ dbt_utils.generate_surrogate_key(['source_path']) }} as source_hk,
+    source_hk,
     source_path,
     current_timestamp as load_date,
     record_source
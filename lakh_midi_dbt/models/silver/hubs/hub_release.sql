@@ -1,5 +1,6 @@
 WITH release_sources AS (
     SELECT DISTINCT
+        release_hk,
         metadata.songs.release_7digitalid as release_id,
         'lmd_h5' as record_source
     FROM {{ source('bronze_data', 'h5_extract') }}
@@ -7,7 +8,7 @@ WITH release_sources AS (
 )
 
 SELECT
-    {{ dbt_utils.generate_surrogate_key(['release_id']) }} as release_hk,
+    release_hk,
     release_id,
     current_timestamp as load_date,
     record_source
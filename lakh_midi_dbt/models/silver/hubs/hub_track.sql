@@ -1,5 +1,6 @@
 WITH h5_tracks AS (
     SELECT DISTINCT
+        track_hk,
         track_id,
         'lmd_h5' as record_source
     FROM {{ source('bronze_data', 'h5_extract') }}
@@ -8,6 +9,7 @@ WITH h5_tracks AS (
 
 match_tracks AS (
     SELECT DISTINCT
+        track_hk,
         track_id,
         'match_scores' as record_source
     FROM {{ source('bronze_data', 'raw_match_scores') }}
@@ -22,7 +24,7 @@ track_sources AS (
 )
 
 SELECT
-    {{ dbt_utils.generate_surrogate_key(['track_id']) }} as track_hk,
+    track_hk,
     track_id,
     current_timestamp as load_date,
     record_source
@@ -1,5 +1,5 @@
 SELECT
-    a.artist_hk,
+    h5.artist_hk,
     
     h5.metadata.songs.artist_name,
     h5.metadata.songs.artist_mbid,
@@ -14,6 +14,6 @@ SELECT
     current_timestamp as load_date,
     'lmd_h5' as record_source
 
-FROM {{ ref('hub_artist') }} a
-JOIN {{ source('bronze_data', 'h5_extract') }} h5 ON a.artist_id = h5.metadata.songs.artist_id
+FROM {{ source('bronze_data', 'h5_extract') }} h5
+WHERE h5.metadata.songs.artist_id IS NOT NULL
 ORDER BY artist_hk
\ No newline at end of file
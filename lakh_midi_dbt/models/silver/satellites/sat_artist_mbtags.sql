@@ -1,13 +1,13 @@
 WITH artist_mbtags_unnested AS (
     SELECT
-        a.artist_hk,
+        h5.artist_hk,
         h5.musicbrainz.artist_mbtags,
         h5.musicbrainz.artist_mbtags_count
-    FROM {{ ref('hub_artist') }} a
-    JOIN {{ source('bronze_data', 'h5_extract') }} h5 ON a.artist_id = h5.metadata.songs.artist_id
-    WHERE h5.musicbrainz.artist_mbtags IS NOT NULL
+    FROM {{ source('bronze_data', 'h5_extract') }} h5
+    WHERE h5.metadata.songs.artist_id IS NOT NULL
+      AND h5.musicbrainz.artist_mbtags IS NOT NULL
       AND array_length(h5.musicbrainz.artist_mbtags, 1) > 0
-    QUALIFY ROW_NUMBER() OVER (PARTITION BY a.artist_hk ORDER BY h5.track_id) = 1
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY h5.artist_hk ORDER BY h5.track_id) = 1
 ),
 
 artist_mbtags_data AS (
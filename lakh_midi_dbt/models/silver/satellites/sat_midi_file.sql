@@ -7,18 +7,19 @@
     )
 }}
 SELECT
-    m.midi_hk,
+    mf.midi_hk,
     
     mf.file_content,
+    mf.content_codec,
     mf.file_size_bytes as file_size,
     
     current_timestamp as load_date,
     'lmd_full' as record_source,
     
     -- Operational fields
-    substring(midi_hk, 1, 1) partition_col
+    mf.partition_col
 
-FROM {{ ref('hub_midi_file') }} m
-JOIN {{ source('bronze_data', 'raw_midi_files') }} mf ON m.midi_md5 = mf.midi_md5
-where partition_col='{{ var("partition_filter", "a") }}'
+FROM {{ source('bronze_data', 'raw_midi_files') }} mf
+-- Bronze shares the hash partitioning, so this prunes to one partition's files
+where mf.partition_col='{{ var("partition_filter", "a") }}'
 ORDER BY midi_hk
\ No newline at end of file
@@ -0,0 +1,31 @@
+{{ config(
+        tags=['incremental'],
+        options={
+            'partition_by': 'partition_col',
+            'OVERWRITE_OR_IGNORE': true
+        }
+    )
+}}
+SELECT
+    n.midi_hk,
+    
+    n.track,
+    n.channel,
+    n.program,
+    n.pitch,
+    n.velocity,
+    n.onset_tick,
+    n.duration_ticks,
+    n.onset_seconds,
+    n.duration_seconds,
+    
+    current_timestamp as load_date,
+    'lmd_full' as record_source,
+    
+    -- Operational fields
+    n.partition_col
+
+FROM {{ source('bronze_data', 'midi_notes') }} n
+-- Parsed in the same hash partitions as raw_midi_files
+where n.partition_col='{{ var("partition_filter", "a") }}'
+ORDER BY midi_hk, onset_tick, pitch
@@ -0,0 +1,51 @@
+{{ config(
+        tags=['incremental'],
+        options={
+            'partition_by': 'partition_col',
+            'OVERWRITE_OR_IGNORE': true
+        }
+    )
+}}
+SELECT
+    s.midi_hk,
+    
+    s.parse_error,
+    s.ticks_per_beat,
+    s.num_tracks,
+    s.duration_seconds,
+    
+    -- Notes
+    s.note_count,
+    s.drum_note_count,
+    s.has_drums,
+    s.programs,
+    s.pitch_min,
+    s.pitch_max,
+    s.max_polyphony,
+    s.mean_polyphony,
+    
+    -- Tempo map
+    s.initial_tempo,
+    s.mean_tempo,
+    s.min_tempo,
+    s.max_tempo,
+    s.tempo_change_count,
+    s.time_signature_numerator,
+    s.time_signature_denominator,
+    
+    -- Tonality
+    s.pitch_class_histogram,
+    s.estimated_key_signature_id,
+    s.estimated_mode_id,
+    s.key_confidence,
+    
+    current_timestamp as load_date,
+    'lmd_full' as record_source,
+    
+    -- Operational fields
+    s.partition_col
+
+FROM {{ source('bronze_data', 'midi_stats') }} s
+-- Computed in the same hash partitions as raw_midi_files
+where s.partition_col='{{ var("partition_filter", "a") }}'
+ORDER BY midi_hk
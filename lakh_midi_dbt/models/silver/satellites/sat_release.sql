@@ -1,5 +1,5 @@
 SELECT
-    r.release_hk,
+    h5.release_hk,
     
     h5.metadata.songs.release,
     h5.metadata.songs.release_7digitalid,
@@ -8,6 +8,6 @@ SELECT
     current_timestamp as load_date,
     'lmd_h5' as record_source
 
-FROM {{ ref('hub_release') }} r
-JOIN {{ source('bronze_data', 'h5_extract') }} h5 ON r.release_id = h5.metadata.songs.release_7digitalid
+FROM {{ source('bronze_data', 'h5_extract') }} h5
+WHERE h5.metadata.songs.release_7digitalid IS NOT NULL
 ORDER BY release_hk
\ No newline at end of file
@@ -7,7 +7,7 @@
     )
 }}
 SELECT
-    t.track_hk,
+    h5.track_hk,
     
     -- Audio analysis data
     h5.analysis.songs.audio_md5,
@@ -38,7 +38,10 @@ SELECT
     h5.metadata.songs.song_id,
     h5.metadata.songs.song_hotttnesss,
     
-    -- Index references for time series data
+    -- Scalar summary of the time series
+    len(h5.analysis.bars_start) as bars_count,
+    
+    -- Index references for the time series in sat_track_timeseries
     h5.analysis.songs.idx_bars_confidence,
     h5.analysis.songs.idx_bars_start,
     h5.analysis.songs.idx_beats_confidence,
@@ -55,31 +58,14 @@ SELECT
     h5.analysis.songs.idx_tatums_confidence,
     h5.analysis.songs.idx_tatums_start,
     
-    -- Time series arrays
-    h5.analysis.bars_start,
-    h5.analysis.bars_confidence,
-    h5.analysis.beats_start,
-    h5.analysis.beats_confidence,
-    h5.analysis.sections_start,
-    h5.analysis.sections_confidence,
-    h5.analysis.segments_start,
-    h5.analysis.segments_confidence,
-    h5.analysis.segments_loudness_max,
-    h5.analysis.segments_loudness_max_time,
-    h5.analysis.segments_loudness_start,
-    h5.analysis.segments_pitches,
-    h5.analysis.segments_timbre,
-    h5.analysis.tatums_start,
-    h5.analysis.tatums_confidence,
-    
     -- Audit fields
     current_timestamp as load_date,
     'lmd_h5' as record_source,
     
     -- Operational fields
-    substring(track_hk, 1, 1) partition_col
+    h5.partition_col
 
-FROM {{ ref('hub_track') }} t
-JOIN {{ source('bronze_data', 'h5_extract') }} h5 ON t.track_id = h5.track_id
-where partition_col='{{ var("partition_filter", "a") }}'
+FROM {{ source('bronze_data', 'h5_extract') }} h5
+-- Bronze shares the hash partitioning, so this prunes to one partition's files
+where h5.partition_col='{{ var("partition_filter", "a") }}'
 ORDER BY track_hk
\ No newline at end of file
@@ -0,0 +1,25 @@
+{{ config(
+        tags=['incremental'],
+        options={
+            'partition_by': 'partition_col',
+            'OVERWRITE_OR_IGNORE': true
+        }
+    )
+}}
+SELECT
+    b.track_hk,
+    
+    -- Segment features summarised per beat and per bar
+    b.beats,
+    b.bars,
+    
+    current_timestamp as load_date,
+    'lmd_h5' as record_source,
+    
+    -- Operational fields
+    b.partition_col
+
+FROM {{ source('bronze_data', 'track_beat_features') }} b
+-- Computed in the same hash partitions as h5_extract
+where b.partition_col='{{ var("partition_filter", "a") }}'
+ORDER BY track_hk
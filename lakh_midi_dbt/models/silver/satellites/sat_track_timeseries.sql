@@ -0,0 +1,50 @@
+{{ config(
+        tags=['incremental'],
+        options={
+            'partition_by': 'partition_col',
+            'OVERWRITE_OR_IGNORE': true
+        }
+    )
+}}
+SELECT
+    h5.track_hk,
+    
+    -- One list of events per kind of analysis, so the fields of an event
+    -- share a single set of list offsets. Times and values fit in float32.
+    list_transform(h5.analysis.bars_start, (start, i) -> {
+        'start': start::FLOAT,
+        'confidence': h5.analysis.bars_confidence[i]::FLOAT
+    }) as bars,
+    list_transform(h5.analysis.beats_start, (start, i) -> {
+        'start': start::FLOAT,
+        'confidence': h5.analysis.beats_confidence[i]::FLOAT
+    }) as beats,
+    list_transform(h5.analysis.tatums_start, (start, i) -> {
+        'start': start::FLOAT,
+        'confidence': h5.analysis.tatums_confidence[i]::FLOAT
+    }) as tatums,
+    list_transform(h5.analysis.sections_start, (start, i) -> {
+        'start': start::FLOAT,
+        'confidence': h5.analysis.sections_confidence[i]::FLOAT
+    }) as sections,
+    list_transform(h5.analysis.segments_start, (start, i) -> {
+        'start': start::FLOAT,
+        'confidence': h5.analysis.segments_confidence[i]::FLOAT,
+        'loudness_start': h5.analysis.segments_loudness_start[i]::FLOAT,
+        'loudness_max': h5.analysis.segments_loudness_max[i]::FLOAT,
+        'loudness_max_time': h5.analysis.segments_loudness_max_time[i]::FLOAT,
+        'pitches': h5.analysis.segments_pitches[i]::FLOAT[12],
+        'timbre': h5.analysis.segments_timbre[i]::FLOAT[12]
+    }) as segments,
+    
+    -- Audit fields
+    current_timestamp as load_date,
+    'lmd_h5' as record_source,
+    
+    -- Operational fields
+    h5.partition_col
+
+FROM {{ source('bronze_data', 'h5_extract') }} h5
+-- Bronze shares the hash partitioning, so this prunes to one partition's files
+where h5.partition_col='{{ var("partition_filter", "a") }}'
+ORDER BY track_hk